@@ -1,3 +1,4 @@
+import json
 import uuid
 
 import click
@@ -6,19 +7,39 @@ from rich.theme import Theme
 from exitstatus import ExitStatus
 from halo import Halo
 
+from .measurements.base.streaming import CHECKSUM_ALGORITHMS
 from .measurements.file_download.measurements import FileDownloadMeasurement
 from .measurements.file_download.results import FileDownloadMeasurementResult
+from .measurements.file_download.results import FileDownloadAggregateMeasurementResult
 from .measurements.ip_route.measurements import IPRouteMeasurement
 from .measurements.ip_route.results import IPRouteMeasurementResult
 from .measurements.latency.measurements import LatencyMeasurement
 from .measurements.latency.results import LatencyMeasurementResult
-from .measurements.netflix_fast.measurements import NetflixFastMeasurement
+from .measurements.netflix_fast.measurements import (
+    NetflixFastMeasurement,
+    ENGINES,
+    STABILITY_DETECTORS,
+)
+from .measurements.netflix_fast.cache import get_default_token_cache_path
 from .measurements.netflix_fast.results import NetflixFastMeasurementResult
 from .measurements.netflix_fast.results import NetflixFastThreadResult
+from .measurements.site_crawl.measurements import (
+    CONCURRENT_PAGES,
+    MAX_PAGES,
+    SiteCrawlMeasurement,
+)
 from .measurements.speedtest_dotnet.measurements import SpeedtestDotnetMeasurement
 from .measurements.speedtest_dotnet.results import SpeedtestDotnetMeasurementResult
-from .measurements.webpage_download.measurements import WebpageDownloadMeasurement
+from .measurements.webpage_download.measurements import (
+    CONNECTIONS_PER_ORIGIN,
+    MAX_ASSET_DEPTH,
+    MAX_ASSETS,
+    MAX_CONNECTIONS,
+    WebpageDownloadMeasurement,
+)
+from .measurements.webpage_download.cache import HTTPCache
 from .measurements.webpage_download.results import WebpageDownloadMeasurementResult
+from .measurements.webpage_download.waterfall import to_har
 from .measurements.youtube_download.measurements import YoutubeDownloadMeasurement
 from .measurements.youtube_download.results import YoutubeDownloadMeasurementResult
 
@@ -56,11 +77,45 @@ def cli(verbose):
 @click.option(
     "-u", "--url", required=True, multiple=True, help="URL of file to download"
 )
-def perform_file_download_measurement(url):
+@click.option(
+    "-a",
+    "--aggregate-count",
+    default=1,
+    required=False,
+    multiple=False,
+    type=click.INT,
+    help="Number of least latent URLs to download from simultaneously",
+)
+@click.option(
+    "-c",
+    "--checksum-algorithm",
+    required=False,
+    multiple=False,
+    type=click.Choice(CHECKSUM_ALGORITHMS),
+    help="Algorithm used to compute a checksum of the downloaded file",
+)
+@click.option(
+    "-e",
+    "--expected-checksum",
+    required=False,
+    multiple=False,
+    help="Hex digest to verify the downloaded file against",
+)
+@click.option(
+    "--http2",
+    is_flag=True,
+    default=False,
+    help="Download over HTTP/2 where supported, instead of with wget",
+)
+def perform_file_download_measurement(
+    url, aggregate_count, checksum_algorithm, expected_checksum, http2
+):
     """
     Perform a file download measurement.
 
     Determines the URL with the lowest latency and then downloads it using wget.
+    With --aggregate-count, downloads from that many of the least latent URLs at once.
+    With --http2, downloads over HTTP/2 where the server supports it, which needs the http2 extra.
     """
 
     console = Console(theme=OUTPUT_THEME)
@@ -68,26 +123,56 @@ def perform_file_download_measurement(url):
         measurement = FileDownloadMeasurement(
             id=get_uuid_str(),
             urls=url,
+            aggregate_count=aggregate_count,
+            checksum_algorithm=checksum_algorithm,
+            expected_checksum=expected_checksum,
+            http2=http2,
         )
     except ValueError as err:
         raise click.BadParameter(err)
     with Halo(text="Performing File Download measurement", spinner="dots"):
         results = measurement.measure()
-    output = f""
+    output = f"[header]:floppy_disk:  File Download   :floppy_disk:[/header]"
+    for result in [
+        r for r in results if type(r) == FileDownloadAggregateMeasurementResult
+    ]:
+        if len(result.errors) > 0:
+            for error in result.errors:
+                console.print(f"[error]Error:[/error] {error.description}")
+            return ExitStatus.failure
+        output += (
+            f"\nCombined Download Rate: [value]{result.download_rate}[/value] [unit]{result.download_rate_unit.value}[/unit] | "
+            f"Combined Download Size: [value]{result.download_size}[/value] [unit]{result.download_size_unit.value}[/unit]"
+        )
     for result in [r for r in results if type(r) == FileDownloadMeasurementResult]:
         if len(result.errors) > 0:
             for error in result.errors:
                 console.print(f"[error]Error:[/error] {error.description}")
+            if aggregate_count > 1:
+                continue
             return ExitStatus.failure
         output += (
-            f"[header]:floppy_disk:  File Download   :floppy_disk:[/header]\n"
-            f"URL: [endpoint]{result.url}[/endpoint]\n"
+            f"\nURL: [endpoint]{result.url}[/endpoint]\n"
             f"Download Rate: [value]{result.download_rate}[/value] [unit]{result.download_rate_unit.value}[/unit] | "
             f"Download Size: [value]{result.download_size}[/value] [unit]{result.download_size_unit.value}[/unit]"
         )
+        if result.http_version is not None:
+            output += f" | Protocol: [value]{result.http_version}[/value]"
+        if result.checksum is not None:
+            output += f"\nChecksum ({result.checksum_algorithm}): [value]{result.checksum}[/value]"
+            if result.checksum_matched is not None:
+                output += f" | Matched: [value]{'yes' if result.checksum_matched else 'no'}[/value]"
+            if result.checksum_stall_time:
+                output += f" | Held Up By Hashing: [value]{result.checksum_stall_time}[/value] [unit]{result.checksum_stall_time_unit.value}[/unit]"
     console.rule()
     console.print(output)
     console.rule()
+    for result in [r for r in results if type(r) == FileDownloadMeasurementResult]:
+        if result.checksum_matched is False:
+            console.print(
+                f"[error]Error:[/error] The checksum of {result.url} did not match the expected checksum"
+            )
+            return ExitStatus.failure
     return ExitStatus.success
 
 
@@ -183,7 +268,71 @@ def perform_latency_measurement(host, count):
 
 
 @cli.command("netflix_fast")
-def perform_netflix_fast_measurement():
+@click.option(
+    "-e",
+    "--engine",
+    default="threads",
+    required=False,
+    multiple=False,
+    type=click.Choice(ENGINES),
+    help="Download using one thread per URL or a single asyncio event loop",
+)
+@click.option(
+    "-s",
+    "--stability-detector",
+    default="delta",
+    required=False,
+    multiple=False,
+    type=click.Choice(STABILITY_DETECTORS),
+    help="How to decide the download rate has stabilised",
+)
+@click.option(
+    "--terminate-on-result-stable",
+    is_flag=True,
+    default=False,
+    help="End the test as soon as the download rate has stabilised",
+)
+@click.option(
+    "--token-cache/--no-token-cache",
+    default=True,
+    help="Cache the fast.com API token between tests",
+)
+@click.option(
+    "--adaptive-connections",
+    is_flag=True,
+    default=False,
+    help="Add connections while throughput keeps rising, up to --urlcount",
+)
+@click.option(
+    "-u",
+    "--urlcount",
+    default=3,
+    required=False,
+    type=click.IntRange(min=1),
+    help="Number of URLs to download from",
+)
+@click.option(
+    "--upload",
+    is_flag=True,
+    default=False,
+    help="Also measure upload to the same URLs",
+)
+@click.option(
+    "--range-size",
+    multiple=True,
+    type=click.IntRange(min=1),
+    help="Bytes to request from each URL in turn, repeat to request growing ranges",
+)
+def perform_netflix_fast_measurement(
+    engine,
+    stability_detector,
+    terminate_on_result_stable,
+    token_cache,
+    adaptive_connections,
+    urlcount,
+    upload,
+    range_size,
+):
     """
     Perform a Netflix fast.com measurement.
     """
@@ -192,6 +341,14 @@ def perform_netflix_fast_measurement():
     try:
         measurement = NetflixFastMeasurement(
             id=get_uuid_str(),
+            urlcount=urlcount,
+            engine=engine,
+            stability_detector=stability_detector,
+            terminate_on_result_stable=terminate_on_result_stable,
+            token_cache_path=get_default_token_cache_path() if token_cache else None,
+            adaptive_connections=adaptive_connections,
+            upload=upload,
+            range_sizes=range_size or None,
         )
     except ValueError as err:
         raise click.BadParameter(err)
@@ -219,6 +376,105 @@ def perform_netflix_fast_measurement():
             f"Download Rate: [value]{result.download_rate}[/value] [unit]{result.download_rate_unit.value}[/unit] | "
             f"Download Size: [value]{result.download_size}[/value] [unit]{result.download_size_unit.value}[/unit]"
         )
+        if result.upload_rate is not None:
+            output += (
+                f" | Upload Rate: [value]{result.upload_rate}[/value] [unit]{result.upload_rate_unit.value}[/unit] | "
+                f"Upload Size: [value]{result.upload_size}[/value] [unit]{result.upload_size_unit.value}[/unit]"
+            )
+        if result.connection_count is not None:
+            output += f" | Connections: [value]{result.connection_count}[/value]"
+    console.rule()
+    console.print(output)
+    console.rule()
+    return ExitStatus.success
+
+
+@cli.command("site_crawl")
+@click.option(
+    "-u",
+    "--url",
+    required=True,
+    multiple=True,
+    help="URL of a page to load, may be repeated",
+)
+@click.option(
+    "--follow-links",
+    is_flag=True,
+    default=False,
+    help="Also load the pages linked to on the same origins, up to --max-pages",
+)
+@click.option(
+    "--max-pages",
+    default=MAX_PAGES,
+    type=click.IntRange(min=1),
+    help="Most pages loaded",
+)
+@click.option(
+    "--concurrent-pages",
+    default=CONCURRENT_PAGES,
+    type=click.IntRange(min=1),
+    help="Most pages loaded at once",
+)
+@click.option(
+    "--cache",
+    "cache_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Keep an HTTP cache in this file, reused by later measurements",
+)
+def perform_site_crawl_measurement(
+    url, follow_links, max_pages, concurrent_pages, cache_path
+):
+    """
+    Perform a site crawl measurement.
+
+    Loads each page as a webpage download, several at once, sharing connections and an HTTP cache.
+    """
+
+    console = Console(theme=OUTPUT_THEME)
+    try:
+        measurement = SiteCrawlMeasurement(
+            id=get_uuid_str(),
+            urls=url,
+            follow_links=follow_links,
+            max_pages=max_pages,
+            concurrent_pages=concurrent_pages,
+            cache=HTTPCache(cache_path) if cache_path is not None else None,
+        )
+    except ValueError as err:
+        raise click.BadParameter(err)
+    with Halo(text="Performing Site Crawl measurement", spinner="dots"):
+        results = measurement.measure()
+    crawl_result, page_results = results[0], results[1:]
+    if len(crawl_result.errors) > 0:
+        for error in crawl_result.errors:
+            console.print(f"[error]Error:[/error] {error.description}")
+        return ExitStatus.failure
+    output = (
+        f"[header]:spider_web: Site Crawl :spider_web:[/header]\n"
+        f"Pages: [value]{crawl_result.page_count}[/value] | "
+        f"Failed Pages: [value]{crawl_result.failed_page_count}[/value] | "
+        f"Asset Count: [value]{crawl_result.asset_count}[/value] | "
+        f"Failed Asset Downloads: [value]{crawl_result.failed_asset_downloads}[/value]\n"
+        f"Combined Download Rate: [value]{crawl_result.download_rate}[/value] [unit]{crawl_result.download_rate_unit.value}[/unit] | "
+        f"Combined Download Size: [value]{crawl_result.download_size}[/value] [unit]{crawl_result.download_size_unit.value}[/unit]\n"
+        f"Mean Page Load Time: [value]{crawl_result.mean_page_load_time}[/value] [unit]{crawl_result.mean_page_load_time_unit.value}[/unit] | "
+        f"Elapsed Time: [value]{crawl_result.elapsed_time}[/value] [unit]{crawl_result.elapsed_time_unit.value}[/unit] | "
+        f"Cache Hits: [value]{crawl_result.cache_hits}[/value]"
+    )
+    for result in page_results:
+        if len(result.errors) > 0:
+            for error in result.errors:
+                console.print(
+                    f"[error]Error:[/error] {result.url}: {error.description}"
+                )
+            continue
+        output += (
+            f"\nURL: [endpoint]{result.url}[/endpoint]\n"
+            f"Elapsed Time: [value]{result.elapsed_time}[/value] [unit]{result.elapsed_time_unit.value}[/unit] | "
+            f"Download Size: [value]{result.download_size}[/value] [unit]{result.download_size_unit.value}[/unit] | "
+            f"Asset Count: [value]{result.asset_count}[/value] | "
+            f"Cache Hits: [value]{result.cache_hits}[/value]"
+        )
     console.rule()
     console.print(output)
     console.rule()
@@ -263,7 +519,71 @@ def perform_speedtest_dotnet_measurement():
 @click.option(
     "-u", "--url", required=True, multiple=False, help="URL of webpage to download"
 )
-def perform_webpage_download_measurement(url):
+@click.option(
+    "--connections-per-origin",
+    default=CONNECTIONS_PER_ORIGIN,
+    type=click.IntRange(min=1),
+    help="Most assets fetched at once from a single origin",
+)
+@click.option(
+    "--max-connections",
+    default=MAX_CONNECTIONS,
+    type=click.IntRange(min=1),
+    help="Most assets fetched at once overall",
+)
+@click.option(
+    "--max-asset-depth",
+    default=MAX_ASSET_DEPTH,
+    type=click.IntRange(min=1),
+    help="Deepest level of stylesheet imports whose assets are fetched",
+)
+@click.option(
+    "--max-assets",
+    default=MAX_ASSETS,
+    type=click.IntRange(min=1),
+    help="Most assets fetched in total",
+)
+@click.option(
+    "--har",
+    "har_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the timing of each request to this file as an HTTP Archive",
+)
+@click.option(
+    "--repeat-view",
+    is_flag=True,
+    default=False,
+    help="Load the page again with the cache the first load filled",
+)
+@click.option(
+    "--cache",
+    "cache_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Keep an HTTP cache in this file, reused by later measurements",
+)
+@click.option(
+    "--preconnect/--no-preconnect",
+    default=True,
+    help="Connect to each asset origin as soon as the page names it",
+)
+@click.option(
+    "--http2",
+    is_flag=True,
+    default=False,
+    help="Load the page over HTTP/2 where supported, which needs the http2 extra",
+)
+def perform_webpage_download_measurement(
+    url,
+    connections_per_origin,
+    max_connections,
+    max_asset_depth,
+    max_assets,
+    har_path,
+    repeat_view,
+    cache_path,
+    preconnect,
+    http2,
+):
     """
     Perform a webpage download measurement.
     """
@@ -273,6 +593,15 @@ def perform_webpage_download_measurement(url):
         measurement = WebpageDownloadMeasurement(
             id=get_uuid_str(),
             url=url,
+            connections_per_origin=connections_per_origin,
+            max_connections=max_connections,
+            max_asset_depth=max_asset_depth,
+            max_assets=max_assets,
+            record_requests=har_path is not None,
+            cache=HTTPCache(cache_path) if cache_path is not None else None,
+            repeat_view=repeat_view,
+            preconnect=preconnect,
+            http2=http2,
         )
     except ValueError as err:
         raise click.BadParameter(err)
@@ -286,14 +615,40 @@ def perform_webpage_download_measurement(url):
         f"[header]:globe_with_meridians: Webpage Download :globe_with_meridians:[/header]\n"
         f"URL: [endpoint]{result.url}[/endpoint]\n"
         f"Download Rate: [value]{result.download_rate}[/value] [unit]{result.download_rate_unit.value}[/unit] | "
-        f"Download Size: [value]{result.download_size}[/value] [unit]{result.download_size_unit.value}[/unit]\n"
+        f"Download Size: [value]{result.download_size}[/value] [unit]{result.download_size_unit.value}[/unit] | "
+        f"Decoded Size: [value]{result.decoded_download_size}[/value] [unit]{result.decoded_download_size_unit.value}[/unit]\n"
         f"Elapsed Time: [value]{result.elapsed_time}[/value] [unit]{result.elapsed_time_unit.value}[/unit] | "
         f"Asset Count: [value]{result.asset_count}[/value] | "
         f"Failed Asset Downloads: [value]{result.failed_asset_downloads}[/value]"
     )
+    if result.http_version is not None:
+        output += f"\nProtocol: [value]{result.http_version}[/value]"
+    if result.cache_hits is not None:
+        output += (
+            f"\nCache Hits: [value]{result.cache_hits}[/value] | "
+            f"Cache Revalidations: [value]{result.cache_revalidations}[/value]"
+        )
+    if result.repeat_view is not None and len(result.repeat_view.errors) > 0:
+        output += "\n[header]Repeat View[/header]"
+        for error in result.repeat_view.errors:
+            output += f"\n[error]Error:[/error] {error.description}"
+    elif result.repeat_view is not None:
+        repeat = result.repeat_view
+        output += (
+            f"\n[header]Repeat View[/header]\n"
+            f"Download Size: [value]{repeat.download_size}[/value] [unit]{repeat.download_size_unit.value}[/unit] | "
+            f"Elapsed Time: [value]{repeat.elapsed_time}[/value] [unit]{repeat.elapsed_time_unit.value}[/unit]\n"
+            f"Cache Hits: [value]{repeat.cache_hits}[/value] | "
+            f"Cache Revalidations: [value]{repeat.cache_revalidations}[/value] | "
+            f"Failed Asset Downloads: [value]{repeat.failed_asset_downloads}[/value]"
+        )
     console.rule()
     console.print(output)
     console.rule()
+    if har_path is not None:
+        with open(har_path, "w") as f:
+            json.dump(to_har(result), f, indent=2)
+        console.print(f"[info]HAR written to {har_path}[/info]")
     return ExitStatus.success
 
 
@@ -0,0 +1,284 @@
+"""A minimal asyncio HTTP/1.1 client for measuring transfers.
+
+Response bodies are read into a buffer owned by each connection and only
+counted. `asyncio.BufferedProtocol` lets the event loop receive directly
+into that buffer, so no per-read `bytes` objects are allocated.
+
+Uploads are generated from a buffer of zeros which is reused for every
+write, and are paced by the transport's flow control.
+
+Only what measurements need is supported: a single request at a time per
+connection, bodies delimited by `Content-Length` or by the server
+closing the connection, and no redirects or proxies.
+"""
+
+import asyncio
+import ssl
+import urllib.parse
+
+MAX_HEADER_SIZE = 64 * 2**10
+USER_AGENT = "netmeasure"
+
+
+class HTTPDownloadProtocol(asyncio.BufferedProtocol):
+    """An HTTP/1.1 client connection which counts response bodies.
+
+    Use `open_connection` to create a connected instance.
+
+    :param host: The value of the `Host` header sent with requests.
+    :param buffer_size: The size of the buffer each read is received
+    into.
+    """
+
+    def __init__(self, host, buffer_size):
+        self.host = host
+        self._view = memoryview(bytearray(buffer_size))
+        self._loop = asyncio.get_running_loop()
+        self._transport = None
+        self._lost = None
+        self._lost_cleanly = False
+        self._header = None
+        self._response = None
+        self._body = None
+        self._on_data = None
+        self._pending = 0
+        self._can_write = None
+        self.status = None
+        self.headers = {}
+        self.content_length = None
+        self.body_size = 0
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def get_buffer(self, sizehint):
+        return self._view
+
+    def buffer_updated(self, nbytes):
+        if self._response is not None and not self._response.done():
+            self._receive_header(nbytes)
+        else:
+            self._count(nbytes)
+
+    def eof_received(self):
+        # Returning a false value closes the transport, ending the body
+        return False
+
+    def pause_writing(self):
+        self._can_write = self._loop.create_future()
+
+    def resume_writing(self):
+        if self._can_write is not None and not self._can_write.done():
+            self._can_write.set_result(None)
+        self._can_write = None
+
+    def connection_lost(self, exc):
+        self._lost = ConnectionError(str(exc) if exc else "Connection closed by server")
+        self._lost_cleanly = exc is None
+        if self._can_write is not None and not self._can_write.done():
+            self._can_write.set_result(None)
+        if self._response is not None and not self._response.done():
+            self._response.set_exception(self._lost)
+        if self._body is not None:
+            self._end_body()
+
+    async def request(self, target, method="GET", headers=None, body=None):
+        """Send a request and wait for the response headers.
+
+        Reading is paused once the headers have been received, so the
+        body is not counted until `receive` is called.
+
+        :param target: The request target, i.e. the path and query.
+        :param method: The request method.
+        :param headers: Additional request headers.
+        :param body: An optional request body.
+        :return: The response status code.
+        """
+        self._send_header(method, target, headers, None if body is None else len(body))
+        if body is not None:
+            self._transport.write(body)
+        return await self._response
+
+    async def upload(self, target, size, on_data=None, method="POST", headers=None):
+        """Send a request with a generated body and wait for the response
+        headers.
+
+        The body is written as fast as the connection accepts it. If the
+        server responds before the whole body has been sent, no more of
+        it is sent.
+
+        :param target: The request target, i.e. the path and query.
+        :param size: The size of the body.
+        :param on_data: A callable passed the number of bytes written
+        each time part of the body is written.
+        :param method: The request method.
+        :param headers: Additional request headers.
+        :return: The response status code.
+        """
+        self._send_header(method, target, headers, size)
+        payload = memoryview(bytes(len(self._view)))
+        remaining = size
+        while remaining and not self._response.done():
+            if self._lost is not None:
+                raise self._lost
+            if self._can_write is not None:
+                await asyncio.wait(
+                    [self._can_write, self._response],
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                continue
+            count = min(remaining, len(payload))
+            self._transport.write(payload[:count])
+            remaining -= count
+            if on_data is not None:
+                on_data(count)
+            # Let the loop send what has been written before writing more
+            await asyncio.sleep(0)
+        return await self._response
+
+    async def receive(self, on_data=None):
+        """Receive the response body.
+
+        :param on_data: A callable passed the number of bytes received
+        each time data arrives.
+        :return: The size of the body.
+        """
+        self._on_data = on_data
+        self._body = self._loop.create_future()
+        pending, self._pending = self._pending, 0
+        if pending:
+            self._count(pending)
+        if self._lost is not None:
+            self._end_body()
+        elif not self._body.done():
+            self._transport.resume_reading()
+        return await self._body
+
+    def close(self):
+        """Close the connection immediately, discarding any unsent data."""
+        if self._transport is not None:
+            self._transport.abort()
+
+    def _send_header(self, method, target, headers, content_length):
+        lines = [
+            "{method} {target} HTTP/1.1".format(method=method, target=target),
+            "Host: {host}".format(host=self.host),
+            "User-Agent: {user_agent}".format(user_agent=USER_AGENT),
+            "Accept: */*",
+        ]
+        for name, value in (headers or {}).items():
+            lines.append("{name}: {value}".format(name=name, value=value))
+        if content_length is not None:
+            lines.append("Content-Length: {length}".format(length=content_length))
+        if self._lost is not None:
+            raise self._lost
+        self._header = bytearray()
+        self._response = self._loop.create_future()
+        self._body = None
+        self._on_data = None
+        self._pending = 0
+        self.body_size = 0
+        self.content_length = None
+        self._transport.resume_reading()
+        self._transport.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    def _receive_header(self, nbytes):
+        self._header += self._view[:nbytes]
+        end = self._header.find(b"\r\n\r\n")
+        if end == -1:
+            if len(self._header) > MAX_HEADER_SIZE:
+                self._response.set_exception(
+                    ConnectionError("Response header exceeded maximum size")
+                )
+                self._transport.abort()
+            return
+
+        lines = self._header[:end].decode("latin-1").split("\r\n")
+        try:
+            self.status = int(lines[0].split(" ", 2)[1])
+            self.headers = {
+                name.strip().lower(): value.strip()
+                for name, value in (line.split(":", 1) for line in lines[1:])
+            }
+            self.content_length = (
+                int(self.headers["content-length"])
+                if "content-length" in self.headers
+                else None
+            )
+        except (IndexError, ValueError):
+            self._response.set_exception(
+                ConnectionError("Invalid response header: {line}".format(line=lines[0]))
+            )
+            self._transport.abort()
+            return
+
+        # Body bytes received with the header are held until `receive`
+        self._pending = len(self._header) - end - 4
+        self._header = None
+        self._transport.pause_reading()
+        self._response.set_result(self.status)
+
+    def _count(self, nbytes):
+        if self._body is None:
+            self._pending += nbytes
+            self._transport.pause_reading()
+            return
+        if self._body.done():
+            return
+        self.body_size += nbytes
+        if self._on_data is not None:
+            self._on_data(nbytes)
+        if self.content_length is not None and self.body_size >= self.content_length:
+            self._transport.pause_reading()
+            self._body.set_result(self.body_size)
+
+    def _end_body(self):
+        if self._body.done():
+            return
+        if self._lost_cleanly and self.content_length is None:
+            # The body is delimited by the server closing the connection
+            self._body.set_result(self.body_size)
+        else:
+            self._body.set_exception(self._lost)
+
+
+async def open_connection(url, buffer_size, ssl_context=None):
+    """Open a connection to the host of `url`.
+
+    :param url: An `http` or `https` URL.
+    :param buffer_size: The size of the buffer each read is received
+    into.
+    :param ssl_context: The `ssl.SSLContext` used for `https` URLs.
+    Defaults to `ssl.create_default_context()`.
+    :return: A connected `HTTPDownloadProtocol`.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme == "https":
+        ssl_context = ssl_context or ssl.create_default_context()
+        port = parts.port or 443
+    elif parts.scheme == "http":
+        ssl_context = None
+        port = parts.port or 80
+    else:
+        raise ValueError("`{url}` is not an http or https url".format(url=url))
+
+    loop = asyncio.get_running_loop()
+    try:
+        _, protocol = await loop.create_connection(
+            lambda: HTTPDownloadProtocol(parts.netloc, buffer_size),
+            parts.hostname,
+            port,
+            ssl=ssl_context,
+        )
+    except OSError as e:
+        raise ConnectionError(str(e)) from e
+    return protocol
+
+
+def get_request_target(url):
+    """Get the path and query of `url` for use in a request line."""
+    parts = urllib.parse.urlsplit(url)
+    target = parts.path or "/"
+    if parts.query:
+        target += "?" + parts.query
+    return target
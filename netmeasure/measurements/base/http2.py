@@ -0,0 +1,169 @@
+"""An optional HTTP/2 transport for measurements, through httpx.
+
+`requests` only speaks HTTP/1.1, so a page loaded with it opens a
+connection for each asset fetched at once, where a browser talking to an
+HTTP/2 server multiplexes them over one. `HTTP2Session` makes requests
+through an `httpx.Client` with HTTP/2 enabled, negotiated with each
+server through ALPN and falling back to HTTP/1.1 where the server does
+not support it.
+
+An `HTTP2Session` offers the part of the `requests.Session` interface
+the measurements use, and its responses read like streamed
+`requests.Response`s, so the helpers in `streaming` work with either.
+Errors are raised as their `requests` equivalents.
+
+httpx and h2 are installed with the `http2` extra:
+
+    pip install netmeasure[http2]
+"""
+
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+# The `version` of a response's `raw`, as urllib3 reports it
+HTTP_VERSION_NUMBERS = {"HTTP/1.0": 10, "HTTP/1.1": 11, "HTTP/2": 20}
+
+
+def is_http2_available():
+    """Whether the dependencies of `HTTP2Session` are installed."""
+    return httpx is not None and h2 is not None
+
+
+def _translate_error(error):
+    if isinstance(error, httpx.ConnectTimeout):
+        return requests.exceptions.ConnectTimeout(str(error))
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.ReadTimeout(str(error))
+    return requests.ConnectionError(str(error))
+
+
+class HTTP2Session:
+    """Makes requests over HTTP/2 where servers support it.
+
+    Requests may be made from several threads at once, and those to an
+    HTTP/2 server share one connection to it.
+
+    :param max_connections: The most connections open at once.
+    :param client: An `httpx.Client` to make requests with, e.g. one
+    configured for a test server, instead of a new one.
+    """
+
+    def __init__(self, max_connections=None, client=None):
+        if not is_http2_available():
+            raise ValueError(
+                "HTTP/2 requires httpx and h2, installed with `pip install netmeasure[http2]`"
+            )
+        if client is None:
+            client = httpx.Client(
+                http2=True, limits=httpx.Limits(max_connections=max_connections)
+            )
+        self.client = client
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the session's connections."""
+        self.client.close()
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        """Send a GET request, following redirects.
+
+        :param url: The URL to request.
+        :param headers: Headers to send in addition to the defaults.
+        :param timeout: Seconds to wait for a connection or for data.
+        :param stream: Whether to return before the body is read.
+        :return: An `HTTP2Response`.
+        """
+        request = self.client.build_request(
+            "GET", url, headers=headers, timeout=timeout
+        )
+        try:
+            response = self.client.send(request, stream=True, follow_redirects=True)
+        except httpx.TransportError as e:
+            raise _translate_error(e) from e
+        response = HTTP2Response(response)
+        if not stream:
+            # Read the body before returning, as `requests` does
+            response.content
+        return response
+
+
+class HTTP2Response:
+    """A streamed `httpx.Response`, with the interface of a `requests.Response`.
+
+    :param response: An `httpx.Response` whose body has not been read.
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self.raw = HTTP2RawResponse(response)
+        self._content = None
+
+    @property
+    def status_code(self):
+        return self._response.status_code
+
+    @property
+    def headers(self):
+        return self._response.headers
+
+    @property
+    def url(self):
+        return str(self._response.url)
+
+    @property
+    def encoding(self):
+        return self._response.charset_encoding
+
+    @property
+    def http_version(self):
+        """The protocol the response arrived over, e.g. "HTTP/2"."""
+        return self._response.http_version
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = b"".join(self.iter_content(2**16))
+        return self._content
+
+    def iter_content(self, chunk_size=1):
+        """Yield the decoded body as it arrives, at most `chunk_size` bytes at a time."""
+        try:
+            for chunk in self._response.iter_bytes():
+                for start in range(0, len(chunk), chunk_size):
+                    yield chunk[start : start + chunk_size]
+        except httpx.TransportError as e:
+            raise _translate_error(e) from e
+        finally:
+            self._response.close()
+
+    def close(self):
+        self._response.close()
+
+
+class HTTP2RawResponse:
+    """The counterpart of a `requests.Response.raw` for an `HTTP2Response`."""
+
+    def __init__(self, response):
+        self._response = response
+
+    @property
+    def version(self):
+        return HTTP_VERSION_NUMBERS.get(self._response.http_version)
+
+    def tell(self):
+        """The number of body bytes received, before content decoding."""
+        return self._response.num_bytes_downloaded
@@ -0,0 +1,73 @@
+"""Scaling of the number of connections used by a throughput measurement.
+
+A single connection rarely fills a fast link, while many connections
+overload a slow one. `ConnectionScaler` starts with a few connections
+and adds one at a time while doing so keeps increasing the aggregate
+throughput, settling once it plateaus.
+"""
+
+
+class ConnectionScaler:
+    """Decides how many connections a measurement should have open.
+
+    The measurement passes its progress to `update` each time it samples
+    it. Every `interval_seconds` the throughput over the last interval is
+    compared with the interval before: if it rose by at least
+    `min_growth_percent` another connection is added, otherwise the
+    scaler settles on the current number.
+
+    :param initial: The number of connections to start with.
+    :param maximum: The largest number of connections to open.
+    :param interval_seconds: The time each number of connections is
+    measured for before deciding whether to add another.
+    :param min_growth_percent: The increase in throughput, as a
+    percentage, for which adding a connection is considered worthwhile.
+    """
+
+    def __init__(self, initial, maximum, interval_seconds=1, min_growth_percent=10):
+        if not 1 <= initial <= maximum:
+            raise ValueError("`initial` must be at least 1 and no more than `maximum`")
+        self.maximum = maximum
+        self.interval_seconds = interval_seconds
+        self.min_growth_percent = min_growth_percent
+        self.connection_count = initial
+        self.settled = initial == maximum
+        self._interval_start_time = 0
+        self._interval_start_total = 0
+        self._previous_rate = None
+
+    def update(self, elapsed_time, total):
+        """Add a sample and get the number of connections which should be
+        open.
+
+        :param elapsed_time: Seconds since the measurement started.
+        :param total: The number of bytes transferred since the
+        measurement started, over all connections.
+        :return: The number of connections which should be open.
+        """
+        interval_time = elapsed_time - self._interval_start_time
+        if self.settled or interval_time < self.interval_seconds:
+            return self.connection_count
+
+        rate = (total - self._interval_start_total) / interval_time
+        self._interval_start_time = elapsed_time
+        self._interval_start_total = total
+        if self._previous_rate is not None and rate < self._previous_rate * (
+            1 + self.min_growth_percent / 100
+        ):
+            # The last connection added did not improve throughput enough
+            self.settled = True
+            return self.connection_count
+
+        self._previous_rate = rate
+        self.connection_count += 1
+        self.settled = self.connection_count == self.maximum
+        return self.connection_count
+
+    def settle(self, connection_count):
+        """Stop adding connections, e.g. because opening one failed.
+
+        :param connection_count: The number of connections left open.
+        """
+        self.connection_count = connection_count
+        self.settled = True
@@ -0,0 +1,228 @@
+"""Detectors which decide when a throughput measurement has stabilised.
+
+A detector is fed the cumulative number of bytes transferred each time
+a measurement samples its progress, and reports whether the rate has
+stopped changing enough to end the measurement early. Each update costs
+O(1), regardless of how many samples the detector considers.
+
+Detectors only decide when to stop; the measured rate is still the
+total transferred divided by the total time taken.
+"""
+
+from collections import deque
+
+
+class StabilityDetector:
+    """The interface shared by all stability detectors.
+
+    :param min_time_seconds: The time which must elapse before the
+    measurement can be considered stable.
+    """
+
+    def __init__(self, min_time_seconds):
+        self.min_time_seconds = min_time_seconds
+        self.reset()
+
+    def reset(self):
+        """Discard all samples, ready for a new measurement."""
+        self.elapsed_time = 0
+        self.total = 0
+
+    def update(self, elapsed_time, total):
+        """Add a sample.
+
+        :param elapsed_time: Seconds since the measurement started.
+        :param total: The number of bytes transferred since the
+        measurement started.
+        """
+        raise NotImplementedError
+
+    def is_stable(self):
+        """Whether the samples so far are considered stable."""
+        raise NotImplementedError
+
+    def _get_rate(self, elapsed_time, total):
+        # The rate since the previous sample, or None if no time has passed
+        if elapsed_time <= self.elapsed_time:
+            return None
+        rate = (total - self.total) / (elapsed_time - self.elapsed_time)
+        self.elapsed_time = elapsed_time
+        self.total = total
+        return rate
+
+
+class DeltaStabilityDetector(StabilityDetector):
+    """Compares the cumulative average rate with its recent mean.
+
+    Once `count` rates have been recorded, each new rate is compared with
+    the mean of the last `count`. The measurement is stable when the
+    largest of the last `count` percentage differences is below
+    `max_delta_percent`.
+
+    :param min_time_seconds: The time which must elapse before the
+    measurement can be considered stable.
+    :param count: The number of samples compared.
+    :param max_delta_percent: The largest percentage difference allowed.
+    """
+
+    def __init__(self, min_time_seconds=3, count=6, max_delta_percent=2):
+        self.count = count
+        self.max_delta_percent = max_delta_percent
+        super(DeltaStabilityDetector, self).__init__(min_time_seconds)
+
+    def reset(self):
+        super(DeltaStabilityDetector, self).reset()
+        self._rates = deque()
+        self._rates_sum = 0
+        self._delta_count = 0
+        # Percentage deltas in decreasing order, with their sample index,
+        # so that the first is always the maximum of the window
+        self._max_deltas = deque()
+
+    def update(self, elapsed_time, total):
+        self.elapsed_time = elapsed_time
+        self.total = total
+        if elapsed_time <= 0:
+            return
+        rate = total / elapsed_time
+        self._rates.append(rate)
+        self._rates_sum += rate
+        if len(self._rates) > self.count:
+            self._rates_sum -= self._rates.popleft()
+        if len(self._rates) < self.count or rate <= 0:
+            return
+
+        delta = (rate - self._rates_sum / self.count) / rate * 100
+        index = self._delta_count
+        self._delta_count += 1
+        while self._max_deltas and self._max_deltas[-1][1] <= delta:
+            self._max_deltas.pop()
+        self._max_deltas.append((index, delta))
+        while self._max_deltas[0][0] <= index - self.count:
+            self._max_deltas.popleft()
+
+    def is_stable(self):
+        return (
+            self.elapsed_time > self.min_time_seconds
+            and self._delta_count >= self.count
+            and self._max_deltas[0][1] < self.max_delta_percent
+        )
+
+
+class EWMAStabilityDetector(StabilityDetector):
+    """Tracks an exponentially weighted moving average of the rate
+    between samples.
+
+    The measurement is stable when the average has moved by less than
+    `max_delta_percent` on each of the last `count` samples.
+
+    :param min_time_seconds: The time which must elapse before the
+    measurement can be considered stable.
+    :param alpha: The weight given to each new rate, between 0 and 1.
+    :param count: The number of consecutive samples which must be stable.
+    :param max_delta_percent: The largest percentage change in the
+    average allowed per sample.
+    """
+
+    def __init__(self, min_time_seconds=3, alpha=0.3, count=6, max_delta_percent=2):
+        if not 0 < alpha <= 1:
+            raise ValueError("`alpha` must be greater than 0 and at most 1")
+        self.alpha = alpha
+        self.count = count
+        self.max_delta_percent = max_delta_percent
+        super(EWMAStabilityDetector, self).__init__(min_time_seconds)
+
+    def reset(self):
+        super(EWMAStabilityDetector, self).reset()
+        self.average = None
+        self._stable_count = 0
+
+    def update(self, elapsed_time, total):
+        rate = self._get_rate(elapsed_time, total)
+        if rate is None:
+            return
+        if self.average is None:
+            self.average = rate
+            return
+
+        previous = self.average
+        self.average += self.alpha * (rate - previous)
+        if self.average > 0 and (
+            abs(self.average - previous) / self.average * 100 < self.max_delta_percent
+        ):
+            self._stable_count += 1
+        else:
+            self._stable_count = 0
+
+    def is_stable(self):
+        return (
+            self.elapsed_time > self.min_time_seconds
+            and self._stable_count >= self.count
+        )
+
+
+class RegressionStabilityDetector(StabilityDetector):
+    """Fits a line to the rate between samples over a sliding window.
+
+    The measurement is stable when the change in rate predicted across
+    the window is less than `max_change_percent` of the mean rate in the
+    window. The least-squares sums are updated as samples enter and leave
+    the window, rather than recomputed.
+
+    :param min_time_seconds: The time which must elapse before the
+    measurement can be considered stable.
+    :param window: The number of samples in the window.
+    :param max_change_percent: The largest percentage change across the
+    window allowed.
+    """
+
+    def __init__(self, min_time_seconds=3, window=10, max_change_percent=5):
+        if window < 2:
+            raise ValueError("`window` must be at least 2")
+        self.window = window
+        self.max_change_percent = max_change_percent
+        super(RegressionStabilityDetector, self).__init__(min_time_seconds)
+
+    def reset(self):
+        super(RegressionStabilityDetector, self).reset()
+        self._points = deque()
+        self._sum_x = 0
+        self._sum_y = 0
+        self._sum_xx = 0
+        self._sum_xy = 0
+        self.slope = None
+
+    def update(self, elapsed_time, total):
+        rate = self._get_rate(elapsed_time, total)
+        if rate is None:
+            return
+        self._add_point(elapsed_time, rate, 1)
+        self._points.append((elapsed_time, rate))
+        if len(self._points) > self.window:
+            self._add_point(*self._points.popleft(), -1)
+
+        n = len(self._points)
+        denominator = n * self._sum_xx - self._sum_x**2
+        if n < 2 or denominator <= 0:
+            self.slope = None
+            return
+        self.slope = (n * self._sum_xy - self._sum_x * self._sum_y) / denominator
+
+    def is_stable(self):
+        if (
+            self.elapsed_time <= self.min_time_seconds
+            or len(self._points) < self.window
+            or self.slope is None
+        ):
+            return False
+        mean_rate = self._sum_y / len(self._points)
+        if mean_rate <= 0:
+            return False
+        span = self._points[-1][0] - self._points[0][0]
+        return abs(self.slope * span) / mean_rate * 100 < self.max_change_percent
+
+    def _add_point(self, x, y, sign):
+        self._sum_x += sign * x
+        self._sum_y += sign * y
+        self._sum_xx += sign * x * x
+        self._sum_xy += sign * x * y
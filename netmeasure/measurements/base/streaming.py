@@ -0,0 +1,447 @@
+"""Helpers for measuring streamed downloads.
+
+Measurements usually only need to know how many bytes were received,
+not what they were. These helpers read a `requests` response (opened
+with `stream=True`) into a caller-supplied buffer which is reused for
+every read, so no per-chunk `bytes` objects are allocated.
+
+Where the received bytes are needed, e.g. to verify a checksum, they are
+handed to a worker thread so that the receive loop is not held up.
+
+Uploads are likewise sent from a single buffer of zeros, using
+`GeneratedPayload` as the request body.
+
+Reading past `requests` means its exceptions are not raised for errors
+while the body is read, so the helpers raise them instead: a read which
+times out raises `requests.exceptions.ReadTimeout`, and a connection
+which fails raises `requests.ConnectionError`.
+"""
+
+import array
+import hashlib
+import http.client
+import queue
+import socket
+import threading
+import time
+import typing
+import zlib
+
+import requests
+import urllib3
+
+CHECKSUM_ALGORITHMS = ["sha256", "crc32"]
+MIN_CHUNK_SIZE = 4 * 2**10
+MAX_CHUNK_SIZE = 4 * 2**20
+TARGET_READS_PER_SECOND = 50
+# The most chunks waiting to be hashed, which bounds the memory held when
+# data arrives faster than it can be hashed
+CHECKSUM_QUEUE_SIZE = 64
+
+
+def get_readinto(response):
+    """Get a `readinto` callable that reads directly from the body of a
+    streamed response.
+
+    Returns `None` if the response body cannot be read directly, either
+    because it is not backed by a `http.client.HTTPResponse` or because
+    it is content-encoded and must be decoded by `requests`.
+
+    :param response: A `requests.Response` opened with `stream=True`.
+    """
+    raw_fp = getattr(response.raw, "_fp", None)
+    if not isinstance(raw_fp, http.client.HTTPResponse):
+        return None
+    if response.headers.get("content-encoding", "identity") != "identity":
+        return None
+    return raw_fp.readinto
+
+
+def iter_discard(response, buffer, tuner=None):
+    """Read a streamed response into `buffer`, discarding its contents.
+
+    Yields the number of bytes read each time `buffer` is filled. Falls
+    back to `iter_decoded` when the response cannot be read directly.
+    Once the body has been read in full the underlying connection is
+    released back to its pool.
+
+    :param response: A `requests.Response` opened with `stream=True`.
+    :param buffer: A writable buffer (e.g. a `bytearray`) which
+    determines the size of each read.
+    :param tuner: An optional `ChunkSizeTuner` which chooses the size of
+    each read instead, up to the size of `buffer`.
+    """
+    view = memoryview(buffer)
+    readinto = get_readinto(response)
+    if readinto is None:
+        chunk_size = len(view) if tuner is None else tuner.chunk_size
+        for chunk in iter_decoded(response, chunk_size):
+            yield len(chunk)
+        return
+
+    try:
+        if tuner is None:
+            while True:
+                count = readinto(view)
+                if not count:
+                    break
+                yield count
+        else:
+            tuner.start()
+            while True:
+                count = readinto(view[: tuner.chunk_size])
+                if not count:
+                    break
+                tuner.update(count)
+                yield count
+    except socket.timeout as e:
+        raise requests.exceptions.ReadTimeout(e) from e
+    except (OSError, http.client.IncompleteRead) as e:
+        raise requests.ConnectionError(e) from e
+    response.raw.release_conn()
+
+
+def iter_decoded(response, chunk_size):
+    """Yield the decoded body of a streamed response as it arrives.
+
+    Where urllib3 supports it, whatever has arrived is read rather than
+    waiting for `chunk_size` bytes, and the bytes read from the wire are
+    counted for `get_wire_size`. Otherwise falls back to `iter_content`.
+    Once the body has been read in full the underlying connection is
+    released back to its pool.
+
+    :param response: A `requests.Response` opened with `stream=True`.
+    :param chunk_size: The most bytes read at once.
+    """
+    read1 = getattr(response.raw, "read1", None)
+    if not isinstance(response.raw, urllib3.response.HTTPResponse) or read1 is None:
+        yield from response.iter_content(chunk_size=chunk_size)
+        return
+    try:
+        while True:
+            chunk = read1(chunk_size, decode_content=True)
+            if not chunk:
+                break
+            yield chunk
+    except urllib3.exceptions.ReadTimeoutError as e:
+        raise requests.exceptions.ReadTimeout(e) from e
+    except urllib3.exceptions.ProtocolError as e:
+        raise requests.ConnectionError(e) from e
+    response.raw.release_conn()
+
+
+def get_wire_size(response, size):
+    """Get the number of body bytes a streamed response was sent as.
+
+    This differs from the number of bytes read from the response when it
+    is content-encoded, e.g. compressed with gzip.
+
+    :param response: A `requests.Response` read in full with
+    `iter_discard` or `iter_decoded`.
+    :param size: The number of bytes read from the response.
+    :return: The number of body bytes received, before content decoding,
+    or `size` if that is not known.
+    """
+    if response.headers.get("content-encoding", "identity") == "identity":
+        # `get_readinto` bypasses urllib3, so its count would be zero
+        return size
+    wire_size = response.raw.tell() if hasattr(response.raw, "tell") else None
+    return wire_size if isinstance(wire_size, int) else size
+
+
+def discard(response, buffer, tuner=None):
+    """Read the remainder of a streamed response into `buffer`.
+
+    :param response: A `requests.Response` opened with `stream=True`.
+    :param buffer: A writable buffer (e.g. a `bytearray`) which
+    determines the size of each read.
+    :param tuner: An optional `ChunkSizeTuner` which chooses the size of
+    each read instead, up to the size of `buffer`.
+    :return: The number of bytes read.
+    """
+    return sum(iter_discard(response, buffer, tuner))
+
+
+class ChunkSizeTuner:
+    """Chooses the size of each read from the rate data arrives at.
+
+    Reading a fast transfer in small chunks spends more time in Python
+    per byte, while reading a slow one in large chunks delays each read
+    until the whole chunk has arrived. After every read the chunk size is
+    set to the rate of that read divided by `reads_per_second`, rounded
+    down to `minimum` times a power of two and kept between `minimum` and
+    `maximum`. It grows by at most four times per read, so a single burst
+    does not inflate it.
+
+    :param initial: The size of the first read.
+    :param minimum: The smallest read size.
+    :param maximum: The largest read size. Buffers read into must be at
+    least this large.
+    :param reads_per_second: The number of reads per second aimed for.
+    :param clock: A monotonic clock returning seconds.
+    """
+
+    def __init__(
+        self,
+        initial,
+        minimum=MIN_CHUNK_SIZE,
+        maximum=MAX_CHUNK_SIZE,
+        reads_per_second=TARGET_READS_PER_SECOND,
+        clock=time.monotonic,
+    ):
+        if not 0 < minimum <= initial <= maximum:
+            raise ValueError(
+                "`initial` must be between `minimum` and `maximum`, which must be positive"
+            )
+        self.chunk_size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.reads_per_second = reads_per_second
+        self._clock = clock
+        self._last_time = None
+
+    def start(self):
+        """Record the time before the first read of a transfer."""
+        self._last_time = self._clock()
+
+    def update(self, nbytes):
+        """Record a read of `nbytes` and get the size of the next read."""
+        now = self._clock()
+        duration = now - self._last_time if self._last_time is not None else 0
+        self._last_time = now
+        if duration <= 0:
+            target = self.maximum
+        else:
+            target = nbytes / duration / self.reads_per_second
+        size = self.minimum
+        while size * 2 <= min(target, self.maximum):
+            size *= 2
+        self.chunk_size = min(size, self.chunk_size * 4)
+        return self.chunk_size
+
+
+class StreamingChecksum:
+    """Computes a checksum over streamed bytes in a worker thread.
+
+    Chunks passed to `update` are queued and hashed by the worker, so
+    the receive loop only pays the cost of a queue insertion. Both
+    `hashlib` and `zlib` release the GIL while hashing large chunks.
+    At most `max_queued` chunks wait to be hashed; once that many are
+    queued, `update` blocks until the worker catches up, slowing the
+    receive loop to the hashing rate rather than holding the whole
+    download in memory. The time spent blocked is kept in `stall_time`,
+    so that a transfer slowed by hashing can be told apart.
+
+    `hexdigest` must be called, even if the download fails, to stop the
+    worker.
+
+    :param algorithm: One of `CHECKSUM_ALGORITHMS`.
+    :param max_queued: The most chunks waiting to be hashed.
+    """
+
+    def __init__(self, algorithm, max_queued=CHECKSUM_QUEUE_SIZE):
+        if algorithm not in CHECKSUM_ALGORITHMS:
+            raise ValueError(
+                "`{algorithm}` is not a supported checksum algorithm".format(
+                    algorithm=algorithm
+                )
+            )
+        self.algorithm = algorithm
+        self._chunks = queue.Queue(maxsize=max_queued)
+        self._digest = None
+        self.stall_time = 0.0
+        self._worker = threading.Thread(target=self._hash_chunks, daemon=True)
+        self._worker.start()
+
+    def update(self, chunk):
+        """Queue a chunk of bytes to be included in the checksum."""
+        try:
+            self._chunks.put_nowait(chunk)
+        except queue.Full:
+            # The worker has fallen behind, which holds up the receive loop
+            start = time.perf_counter()
+            self._chunks.put(chunk)
+            self.stall_time += time.perf_counter() - start
+
+    def hexdigest(self):
+        """Wait for all queued chunks to be hashed and return the checksum."""
+        if self._worker.is_alive():
+            self._chunks.put(None)
+            self._worker.join()
+        return self._digest
+
+    def _hash_chunks(self):
+        if self.algorithm == "crc32":
+            crc = 0
+            for chunk in iter(self._chunks.get, None):
+                crc = zlib.crc32(chunk, crc)
+            self._digest = "{crc:08x}".format(crc=crc)
+        else:
+            hasher = hashlib.new(self.algorithm)
+            for chunk in iter(self._chunks.get, None):
+                hasher.update(chunk)
+            self._digest = hasher.hexdigest()
+
+
+class CounterSnapshot(typing.NamedTuple):
+    """The state of a set of `TransferCounters` at a single instant.
+
+    :param elapsed_time: Seconds between the counters being started and
+    the snapshot being taken.
+    :param sizes: The number of bytes transferred by each connection.
+    :param completed_count: The number of connections which have
+    completed their transfer.
+    :param ended_count: The number of connections which have stopped
+    transferring, whether or not they completed.
+    """
+
+    elapsed_time: float
+    sizes: typing.Tuple[int, ...]
+    completed_count: int
+    ended_count: int
+
+    @property
+    def total(self):
+        return sum(self.sizes)
+
+
+class TransferCounters:
+    """Byte counters for a set of connections transferring in parallel.
+
+    Each connection has its own slot in an `array.array`, written only
+    by the thread or task performing that connection's transfer, so
+    `add` takes no lock. Snapshots read the slots without stopping the
+    writers; a read racing a write misses at most that write, which the
+    next snapshot includes, so a sample can only under-count. Ends and
+    snapshots share a lock, so that the totals at the first completion
+    are captured along with the time it occurred.
+
+    :param count: The number of connections.
+    :param clock: A monotonic clock returning seconds.
+    """
+
+    def __init__(self, count, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sizes = array.array("Q", [0] * count)
+        self._completed = [False] * count
+        self.start_time = None
+        self.end_times = [None] * count
+        self.first_completed = None
+
+    def start(self):
+        """Record the start of the transfers."""
+        self.start_time = self._clock()
+
+    def add(self, index, nbytes):
+        """Add `nbytes` to the counter of connection `index`.
+
+        Only the transfer of connection `index` may call this.
+        """
+        self._sizes[index] += nbytes
+
+    def end(self, index, completed):
+        """Record that connection `index` has stopped transferring.
+
+        :param index: The index of the connection.
+        :param completed: Whether the transfer ran to completion, as
+        opposed to being stopped early or failing.
+        """
+        with self._lock:
+            self.end_times[index] = self._clock() - self.start_time
+            if completed:
+                self._completed[index] = True
+                if self.first_completed is None:
+                    self.first_completed = self._snapshot()
+
+    def snapshot(self):
+        """Get a `CounterSnapshot` of all counters."""
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        return CounterSnapshot(
+            elapsed_time=self._clock() - self.start_time,
+            sizes=tuple(self._sizes),
+            completed_count=sum(self._completed),
+            ended_count=sum(end_time is not None for end_time in self.end_times),
+        )
+
+
+class TransferTimeline:
+    """Per-connection byte counts recorded at each sample.
+
+    Counts are kept in `array.array`s, one per connection, alongside the
+    time of each sample, so a timeline costs a few bytes per connection
+    per sample.
+
+    :param count: The number of connections.
+    """
+
+    def __init__(self, count):
+        self.times = array.array("d")
+        self.sizes = [array.array("Q") for _ in range(count)]
+
+    def record(self, snapshot):
+        """Record the counts in a `CounterSnapshot`."""
+        self.times.append(snapshot.elapsed_time)
+        for sizes, size in zip(self.sizes, snapshot.sizes):
+            sizes.append(size)
+
+    def get_rates(self, index=None):
+        """Get the rate in bytes per second over each interval between
+        samples, the first interval starting when the counters started.
+
+        :param index: The index of a connection, or `None` for the rate
+        over all connections.
+        :return: An `array.array` of rates, one per sample.
+        """
+        if index is None:
+            sizes = [sum(sample) for sample in zip(*self.sizes)]
+        else:
+            sizes = self.sizes[index]
+        rates = array.array("d")
+        previous_time = previous_size = 0
+        for time_, size in zip(self.times, sizes):
+            rates.append(
+                (size - previous_size) / (time_ - previous_time)
+                if time_ > previous_time
+                else 0
+            )
+            previous_time, previous_size = time_, size
+        return rates
+
+
+class GeneratedPayload:
+    """A file-like request body of zeros, read from a single buffer.
+
+    Pass an instance as `data` to a `requests` call. Each read returns a
+    view of the same buffer, and the length is known up front so the
+    body is sent with a `Content-Length` header.
+
+    :param size: The size of the body.
+    :param chunk_size: The largest number of bytes returned by each read.
+    :param on_read: A callable passed the number of bytes returned by
+    each read.
+    :param should_stop: A callable which, if it returns true, causes the
+    next read to raise `ConnectionAbortedError` and so abort the request.
+    """
+
+    def __init__(self, size, chunk_size, on_read=None, should_stop=None):
+        self._view = memoryview(bytes(chunk_size))
+        self._remaining = size
+        self._on_read = on_read
+        self._should_stop = should_stop
+
+    def __len__(self):
+        return self._remaining
+
+    def read(self, size=-1):
+        if self._should_stop is not None and self._should_stop():
+            raise ConnectionAbortedError("Upload stopped")
+        count = len(self._view) if size is None or size < 0 else size
+        count = min(count, len(self._view), self._remaining)
+        self._remaining -= count
+        if count and self._on_read is not None:
+            self._on_read(count)
+        return self._view[:count]
@@ -0,0 +1,125 @@
+"""A local HTTP/2 server for tests, speaking cleartext HTTP/2 (h2c).
+
+Clients must use HTTP/2 with prior knowledge, as the sessions from
+`get_h2c_session` do.
+"""
+
+import socket
+import threading
+
+from netmeasure.measurements.base.http2 import HTTP2Session, is_http2_available
+
+if is_http2_available():
+    import h2.config
+    import h2.connection
+    import h2.events
+    import httpx
+
+READ_SIZE = 65535
+
+
+def get_h2c_session():
+    """Get an `HTTP2Session` which speaks HTTP/2 to `http` URLs, without negotiating it."""
+    return HTTP2Session(client=httpx.Client(http1=False, http2=True))
+
+
+class H2Server:
+    """Serves fixed responses over HTTP/2, one thread per connection.
+
+    :param routes: A `dict` of paths to `(headers, body)` tuples, where
+    `headers` is a list of `(name, value)` pairs. Other paths are
+    answered with a `404`.
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.connection_count = 0
+        self.requested_paths = []
+        self._lock = threading.Lock()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.listen()
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{port}".format(port=self._socket.getsockname()[1])
+
+    def start(self):
+        """Start accepting connections in the background."""
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def stop(self):
+        """Stop accepting connections."""
+        self._socket.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._socket.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connection_count += 1
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _serve(self, sock):
+        conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        conn.initiate_connection()
+        # The body left to send on each stream, once flow control allows
+        pending = {}
+        with sock:
+            sock.sendall(conn.data_to_send())
+            while True:
+                try:
+                    data = sock.recv(READ_SIZE)
+                except OSError:
+                    return
+                if not data:
+                    return
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        path = dict(event.headers)[":path"]
+                        with self._lock:
+                            self.requested_paths.append(path)
+                        headers, body = self.routes.get(path, ([], b""))
+                        status = "200" if path in self.routes else "404"
+                        conn.send_headers(
+                            event.stream_id,
+                            [(":status", status), ("content-length", str(len(body)))]
+                            + headers,
+                        )
+                        pending[event.stream_id] = bytearray(body)
+                    elif isinstance(event, h2.events.StreamReset):
+                        pending.pop(event.stream_id, None)
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+                self._send_pending(conn, pending)
+                sock.sendall(conn.data_to_send())
+
+    def _send_pending(self, conn, pending):
+        for stream_id, body in list(pending.items()):
+            while True:
+                size = min(
+                    len(body),
+                    conn.local_flow_control_window(stream_id),
+                    conn.max_outbound_frame_size,
+                )
+                if size <= 0 and body:
+                    break
+                conn.send_data(
+                    stream_id, bytes(body[:size]), end_stream=size == len(body)
+                )
+                del body[:size]
+                if not body:
+                    del pending[stream_id]
+                    break
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from netmeasure.measurements.base.aio import get_request_target, open_connection
+
+
+class BodyRequestHandler(BaseHTTPRequestHandler):
+    """Responds to `/<size>` with a body of `size` bytes.
+
+    `/close/<size>` omits the `Content-Length` header and closes the
+    connection after the body instead.
+
+    POSTs are read in full and answered with the number of bytes received,
+    except to `/reject`, which is refused without reading the body.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts[0] == "missing":
+            self.send_error(404)
+            return
+        size = int(parts[-1])
+        self.send_response(200)
+        if parts[0] == "close":
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        else:
+            self.send_header("Content-Length", str(size))
+        self.end_headers()
+        self.wfile.write(b"x" * size)
+
+    def do_POST(self):
+        if self.path == "/reject":
+            self.send_error(413)
+            self.close_connection = True
+            return
+        remaining = int(self.headers["Content-Length"])
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 65536)))
+        body = self.headers["Content-Length"].encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPDownloadProtocolTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), BodyRequestHandler)
+        cls.base_url = "http://127.0.0.1:{port}".format(port=cls.server.server_port)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_content_length_body(self):
+        async def download():
+            conn = await open_connection(self.base_url, 4096)
+            status = await conn.request("/100000")
+            received = []
+            size = await conn.receive(received.append)
+            conn.close()
+            return status, size, sum(received)
+
+        self.assertEqual(self.run_async(download()), (200, 100000, 100000))
+
+    def test_close_delimited_body(self):
+        async def download():
+            conn = await open_connection(self.base_url, 4096)
+            await conn.request("/close/12345")
+            return await conn.receive()
+
+        self.assertEqual(self.run_async(download()), 12345)
+
+    def test_keep_alive(self):
+        async def download():
+            conn = await open_connection(self.base_url, 4096)
+            sizes = []
+            for size in [10, 20000, 30]:
+                await conn.request("/{size}".format(size=size))
+                sizes.append(await conn.receive())
+            conn.close()
+            return sizes
+
+        self.assertEqual(self.run_async(download()), [10, 20000, 30])
+
+    def test_error_status(self):
+        async def download():
+            conn = await open_connection(self.base_url, 4096)
+            status = await conn.request("/missing")
+            conn.close()
+            return status
+
+        self.assertEqual(self.run_async(download()), 404)
+
+    def test_upload(self):
+        async def upload():
+            conn = await open_connection(self.base_url, 4096)
+            sent = []
+            status = await conn.upload("/upload", 5000000, sent.append)
+            size = await conn.receive()
+            conn.close()
+            return status, sum(sent), size
+
+        self.assertEqual(self.run_async(upload()), (200, 5000000, len("5000000")))
+
+    def test_upload_rejected(self):
+        async def upload():
+            conn = await open_connection(self.base_url, 4096)
+            sent = []
+            try:
+                status = await conn.upload("/reject", 10**10, sent.append)
+            except ConnectionError:
+                # The server may close the connection before its response is read
+                status = None
+            conn.close()
+            return status, sum(sent)
+
+        status, sent = self.run_async(upload())
+        self.assertIn(status, [413, None])
+        self.assertLess(sent, 10**10)
+
+    def test_connection_refused(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), BodyRequestHandler)
+        url = "http://127.0.0.1:{port}".format(port=server.server_port)
+        server.server_close()
+        self.assertRaises(ConnectionError, self.run_async, open_connection(url, 4096))
+
+    def test_get_request_target(self):
+        self.assertEqual(
+            get_request_target("https://fakehost.net/speedtest?c=au&n=1"),
+            "/speedtest?c=au&n=1",
+        )
+        self.assertEqual(get_request_target("https://fakehost.net"), "/")
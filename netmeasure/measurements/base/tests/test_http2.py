@@ -0,0 +1,80 @@
+import gzip
+import socket
+from unittest import TestCase, mock, skipUnless
+
+import requests
+
+from netmeasure.measurements.base import http2
+from netmeasure.measurements.base.http2 import HTTP2Session, is_http2_available
+from netmeasure.measurements.base.streaming import (
+    discard,
+    get_wire_size,
+    iter_decoded,
+)
+from netmeasure.measurements.base.tests.h2_server import H2Server, get_h2c_session
+
+
+def get_closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class HTTP2AvailabilityTestCase(TestCase):
+    def test_unavailable(self):
+        with mock.patch.object(http2, "httpx", None):
+            self.assertFalse(is_http2_available())
+            self.assertRaises(ValueError, HTTP2Session)
+
+
+@skipUnless(is_http2_available(), "httpx and h2 are not installed")
+class HTTP2SessionTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.body = b"0123456789" * 10000
+        self.server = H2Server(
+            {
+                "/plain": ([("content-type", "text/plain")], self.body),
+                "/gzip": ([("content-encoding", "gzip")], gzip.compress(self.body)),
+            }
+        )
+        self.server.start()
+        self.session = get_h2c_session()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.stop()
+        super().tearDown()
+
+    def test_get(self):
+        response = self.session.get(self.server.base_url + "/plain", stream=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.url, self.server.base_url + "/plain")
+        self.assertEqual(response.headers.get("Content-Type"), "text/plain")
+        self.assertEqual(response.http_version, "HTTP/2")
+        self.assertEqual(response.raw.version, 20)
+        self.assertEqual(discard(response, bytearray(4096)), len(self.body))
+        self.assertEqual(get_wire_size(response, len(self.body)), len(self.body))
+
+    def test_not_streamed(self):
+        response = self.session.get(self.server.base_url + "/plain")
+        self.assertEqual(response.content, self.body)
+
+    def test_decoded(self):
+        response = self.session.get(self.server.base_url + "/gzip", stream=True)
+        chunks = list(iter_decoded(response, 4096))
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 4096)
+        self.assertEqual(b"".join(chunks), self.body)
+        self.assertEqual(
+            get_wire_size(response, len(self.body)), len(gzip.compress(self.body))
+        )
+
+    def test_multiplexed(self):
+        for path in ["/plain", "/gzip", "/missing"]:
+            self.session.get(self.server.base_url + path).content
+        self.assertEqual(self.server.connection_count, 1)
+        self.assertEqual(self.server.requested_paths, ["/plain", "/gzip", "/missing"])
+
+    def test_connection_error(self):
+        url = "http://127.0.0.1:{port}/".format(port=get_closed_port())
+        self.assertRaises(requests.ConnectionError, self.session.get, url)
@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from netmeasure.measurements.base.scaling import ConnectionScaler
+
+
+class ConnectionScalerTestCase(TestCase):
+    def test_adds_while_rising(self):
+        scaler = ConnectionScaler(initial=1, maximum=5, interval_seconds=1)
+        self.assertEqual(scaler.update(0.5, 500), 1)
+        self.assertEqual(scaler.update(1, 1000), 2)
+        self.assertEqual(scaler.update(2, 3000), 3)
+        self.assertEqual(scaler.update(3, 6000), 4)
+        self.assertFalse(scaler.settled)
+
+    def test_settles_on_plateau(self):
+        scaler = ConnectionScaler(initial=1, maximum=5, interval_seconds=1)
+        scaler.update(1, 1000)
+        scaler.update(2, 3000)
+        # 2050 bytes/s is less than 10% more than 2000 bytes/s
+        self.assertEqual(scaler.update(3, 5050), 3)
+        self.assertTrue(scaler.settled)
+        self.assertEqual(scaler.update(4, 100000), 3)
+
+    def test_settles_at_maximum(self):
+        scaler = ConnectionScaler(initial=1, maximum=2, interval_seconds=1)
+        self.assertEqual(scaler.update(1, 1000), 2)
+        self.assertTrue(scaler.settled)
+        self.assertEqual(scaler.update(2, 5000), 2)
+
+    def test_initial_maximum(self):
+        scaler = ConnectionScaler(initial=3, maximum=3)
+        self.assertTrue(scaler.settled)
+        self.assertEqual(scaler.update(1, 1000), 3)
+
+    def test_settle(self):
+        scaler = ConnectionScaler(initial=1, maximum=5, interval_seconds=1)
+        scaler.update(1, 1000)
+        scaler.settle(1)
+        self.assertEqual(scaler.connection_count, 1)
+        self.assertEqual(scaler.update(2, 5000), 1)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, ConnectionScaler, initial=0, maximum=3)
+        self.assertRaises(ValueError, ConnectionScaler, initial=4, maximum=3)
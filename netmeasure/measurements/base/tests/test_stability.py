@@ -0,0 +1,126 @@
+from unittest import TestCase
+
+from netmeasure.measurements.base.stability import (
+    DeltaStabilityDetector,
+    EWMAStabilityDetector,
+    RegressionStabilityDetector,
+)
+
+
+def update(detector, totals, interval=0.2):
+    for i, total in enumerate(totals, start=1):
+        detector.update(i * interval, total)
+
+
+def steady(sample_count, rate=10000, interval=0.2):
+    return [i * interval * rate for i in range(1, sample_count + 1)]
+
+
+def ramp(sample_count, interval=0.2):
+    # The rate between samples doubles every second
+    totals = []
+    total = 0
+    for i in range(1, sample_count + 1):
+        total += 10000 * 2 ** (i * interval) * interval
+        totals.append(total)
+    return totals
+
+
+class DeltaStabilityDetectorTestCase(TestCase):
+    def test_steady(self):
+        detector = DeltaStabilityDetector(min_time_seconds=3)
+        update(detector, steady(20))
+        self.assertTrue(detector.is_stable())
+
+    def test_ramp(self):
+        detector = DeltaStabilityDetector(min_time_seconds=3)
+        update(detector, ramp(20))
+        self.assertFalse(detector.is_stable())
+
+    def test_too_early(self):
+        detector = DeltaStabilityDetector(min_time_seconds=3)
+        update(detector, steady(14))
+        self.assertFalse(detector.is_stable())
+
+    def test_window_max_expires(self):
+        # A single large delta stops counting once it leaves the window
+        detector = DeltaStabilityDetector(min_time_seconds=0, count=3)
+        update(detector, [1000, 2000, 3000, 20000])
+        self.assertFalse(detector.is_stable())
+        detector.update(1.0, 25000)
+        detector.update(1.2, 30000)
+        self.assertFalse(detector.is_stable())
+        detector.update(1.4, 35000)
+        detector.update(1.6, 40000)
+        detector.update(1.8, 45000)
+        self.assertTrue(detector.is_stable())
+
+    def test_reset(self):
+        detector = DeltaStabilityDetector(min_time_seconds=3)
+        update(detector, steady(20))
+        detector.reset()
+        self.assertFalse(detector.is_stable())
+        update(detector, steady(20))
+        self.assertTrue(detector.is_stable())
+
+
+class EWMAStabilityDetectorTestCase(TestCase):
+    def test_steady(self):
+        detector = EWMAStabilityDetector(min_time_seconds=3)
+        update(detector, steady(20))
+        self.assertTrue(detector.is_stable())
+
+    def test_ramp(self):
+        detector = EWMAStabilityDetector(min_time_seconds=3)
+        update(detector, ramp(20))
+        self.assertFalse(detector.is_stable())
+
+    def test_step_change(self):
+        # A step in rate after a steady period is noticed straight away
+        detector = EWMAStabilityDetector(min_time_seconds=1)
+        totals = steady(20)
+        update(detector, totals)
+        self.assertTrue(detector.is_stable())
+        detector.update(21 * 0.2, totals[-1] + 4000)
+        self.assertFalse(detector.is_stable())
+
+    def test_too_early(self):
+        detector = EWMAStabilityDetector(min_time_seconds=5)
+        update(detector, steady(20))
+        self.assertFalse(detector.is_stable())
+
+    def test_invalid_alpha(self):
+        self.assertRaises(ValueError, EWMAStabilityDetector, alpha=0)
+        self.assertRaises(ValueError, EWMAStabilityDetector, alpha=1.5)
+
+
+class RegressionStabilityDetectorTestCase(TestCase):
+    def test_steady(self):
+        detector = RegressionStabilityDetector(min_time_seconds=3)
+        update(detector, steady(20))
+        self.assertTrue(detector.is_stable())
+        self.assertAlmostEqual(detector.slope, 0)
+
+    def test_ramp(self):
+        detector = RegressionStabilityDetector(min_time_seconds=3)
+        update(detector, ramp(20))
+        self.assertFalse(detector.is_stable())
+
+    def test_slope(self):
+        # The rate between samples rises by 1000 bytes/s every second
+        detector = RegressionStabilityDetector(min_time_seconds=0, window=5)
+        totals = []
+        total = 0
+        for i in range(1, 21):
+            total += (10000 + 1000 * i * 0.2) * 0.2
+            totals.append(total)
+        update(detector, totals)
+        self.assertAlmostEqual(detector.slope, 1000)
+
+    def test_window_not_full(self):
+        detector = RegressionStabilityDetector(min_time_seconds=0, window=10)
+        update(detector, steady(9))
+        self.assertFalse(detector.is_stable())
+
+    def test_invalid_window(self):
+        self.assertRaises(ValueError, RegressionStabilityDetector, window=1)
@@ -0,0 +1,333 @@
+import gzip
+import io
+import hashlib
+import http.client
+import socket
+import threading
+from threading import Thread
+from unittest import TestCase, mock
+
+import requests
+import urllib3
+
+from netmeasure.measurements.base.streaming import (
+    ChunkSizeTuner,
+    StreamingChecksum,
+    TransferCounters,
+    TransferTimeline,
+    discard,
+    get_readinto,
+    get_wire_size,
+    iter_decoded,
+    iter_discard,
+)
+
+
+class FakeSocket:
+    """A socket stand-in from which `http.client` reads a canned response."""
+
+    def __init__(self, data):
+        self._file = io.BytesIO(data)
+
+    def makefile(self, *args, **kwargs):
+        return self._file
+
+
+def get_streamed_response(body, headers=None):
+    """Build a `requests.Response`-like mock backed by a real `HTTPResponse`."""
+    raw_fp = http.client.HTTPResponse(
+        FakeSocket(
+            b"HTTP/1.1 200 OK\r\nContent-Length: "
+            + str(len(body)).encode()
+            + b"\r\n\r\n"
+            + body
+        )
+    )
+    raw_fp.begin()
+    response = mock.MagicMock()
+    response.raw._fp = raw_fp
+    response.headers = headers or {}
+    return response
+
+
+def get_encoded_response(body):
+    """Build a `requests.Response`-like mock of a gzip encoded body, read by urllib3."""
+    response = mock.MagicMock()
+    response.headers = {"content-encoding": "gzip"}
+    response.raw = urllib3.HTTPResponse(
+        body=io.BytesIO(gzip.compress(body)),
+        headers=response.headers,
+        preload_content=False,
+    )
+    return response
+
+
+class StreamingTestCase(TestCase):
+    def test_get_readinto_direct(self):
+        response = get_streamed_response(b"0123456789")
+        self.assertEqual(get_readinto(response), response.raw._fp.readinto)
+
+    def test_get_readinto_encoded(self):
+        response = get_streamed_response(
+            b"0123456789", headers={"content-encoding": "gzip"}
+        )
+        self.assertIsNone(get_readinto(response))
+
+    def test_get_readinto_not_http_response(self):
+        self.assertIsNone(get_readinto(mock.MagicMock()))
+
+    def test_iter_discard_direct(self):
+        response = get_streamed_response(b"0123456789")
+        buffer = bytearray(4)
+        self.assertEqual(list(iter_discard(response, buffer)), [4, 4, 2])
+        response.iter_content.assert_not_called()
+        response.raw.release_conn.assert_called_once()
+
+    def test_iter_discard_fallback(self):
+        response = mock.MagicMock()
+        response.iter_content.return_value = [b"0123", b"4567", b"89"]
+        buffer = bytearray(4)
+        self.assertEqual(list(iter_discard(response, buffer)), [4, 4, 2])
+        response.iter_content.assert_called_once_with(chunk_size=4)
+
+    def test_discard(self):
+        response = get_streamed_response(b"x" * 100000)
+        self.assertEqual(discard(response, bytearray(1024)), 100000)
+
+    def test_iter_discard_tuned(self):
+        # Each read takes a second, so the tuner shrinks reads to its minimum
+        clock = mock.Mock(side_effect=[float(i) for i in range(10)])
+        tuner = ChunkSizeTuner(4, minimum=2, maximum=8, clock=clock)
+        response = get_streamed_response(b"0123456789")
+        buffer = bytearray(8)
+        self.assertEqual(list(iter_discard(response, buffer, tuner)), [4, 2, 2, 2])
+        response.raw.release_conn.assert_called_once()
+
+    def test_iter_decoded(self):
+        body = b"0123456789" * 10000
+        response = get_encoded_response(body)
+        self.assertEqual(b"".join(iter_decoded(response, 4096)), body)
+        response.iter_content.assert_not_called()
+
+    def test_iter_decoded_read_timeout(self):
+        response = get_encoded_response(b"0123456789")
+        error = urllib3.exceptions.ReadTimeoutError(None, None, "Read timed out.")
+        with mock.patch.object(response.raw, "read1", side_effect=error):
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                list(iter_decoded(response, 4096))
+
+    def test_iter_decoded_protocol_error(self):
+        response = get_encoded_response(b"0123456789")
+        error = urllib3.exceptions.ProtocolError("Connection broken")
+        with mock.patch.object(response.raw, "read1", side_effect=error):
+            with self.assertRaises(requests.ConnectionError):
+                list(iter_decoded(response, 4096))
+
+    def test_iter_discard_connection_reset(self):
+        response = get_streamed_response(b"0123456789")
+        with mock.patch.object(
+            response.raw._fp, "readinto", side_effect=ConnectionResetError()
+        ):
+            with self.assertRaises(requests.ConnectionError):
+                list(iter_discard(response, bytearray(4)))
+
+    def test_iter_discard_timeout(self):
+        response = get_streamed_response(b"0123456789")
+        with mock.patch.object(
+            response.raw._fp, "readinto", side_effect=socket.timeout("timed out")
+        ):
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                list(iter_discard(response, bytearray(4)))
+
+    def test_iter_decoded_fallback(self):
+        response = mock.MagicMock()
+        response.iter_content.return_value = [b"0123", b"4567", b"89"]
+        self.assertEqual(list(iter_decoded(response, 4)), [b"0123", b"4567", b"89"])
+        response.iter_content.assert_called_once_with(chunk_size=4)
+
+    def test_get_wire_size_encoded(self):
+        body = b"0123456789" * 10000
+        response = get_encoded_response(body)
+        size = discard(response, bytearray(4096))
+        self.assertEqual(size, len(body))
+        self.assertEqual(get_wire_size(response, size), len(gzip.compress(body)))
+
+    def test_get_wire_size_direct(self):
+        response = get_streamed_response(b"0123456789")
+        size = discard(response, bytearray(4))
+        self.assertEqual(get_wire_size(response, size), 10)
+
+    def test_get_wire_size_unknown(self):
+        response = mock.MagicMock()
+        response.headers = {"content-encoding": "gzip"}
+        self.assertEqual(get_wire_size(response, 10), 10)
+
+
+class ChunkSizeTunerTestCase(TestCase):
+    def setUp(self):
+        self.clock = mock.Mock(return_value=0.0)
+        self.tuner = ChunkSizeTuner(
+            64 * 2**10,
+            minimum=4 * 2**10,
+            maximum=4 * 2**20,
+            reads_per_second=50,
+            clock=self.clock,
+        )
+        self.tuner.start()
+
+    def read(self, nbytes, duration):
+        self.clock.return_value += duration
+        return self.tuner.update(nbytes)
+
+    def test_shrinks_on_slow_link(self):
+        # 64 KiB/s over 50 reads per second is about 1.3 KiB per read
+        self.assertEqual(self.read(64 * 2**10, 1), 4 * 2**10)
+
+    def test_target_size(self):
+        # 10 MiB/s over 50 reads per second is about 205 KiB per read
+        self.assertEqual(self.read(64 * 2**10, 64 / 10240), 128 * 2**10)
+        self.assertEqual(self.read(128 * 2**10, 128 / 10240), 128 * 2**10)
+
+    def test_growth_limited(self):
+        # A burst only grows the chunk size four times per read
+        self.assertEqual(self.read(64 * 2**10, 0), 256 * 2**10)
+        self.assertEqual(self.read(256 * 2**10, 0), 1 * 2**20)
+        self.assertEqual(self.read(1 * 2**20, 0), 4 * 2**20)
+        self.assertEqual(self.read(4 * 2**20, 0), 4 * 2**20)
+
+    def test_invalid_bounds(self):
+        self.assertRaises(ValueError, ChunkSizeTuner, 1024, minimum=4096)
+        self.assertRaises(ValueError, ChunkSizeTuner, 1024, minimum=0)
+        self.assertRaises(ValueError, ChunkSizeTuner, 8192, minimum=1024, maximum=4096)
+
+
+class StreamingChecksumTestCase(TestCase):
+    def test_sha256(self):
+        checksum = StreamingChecksum("sha256")
+        for chunk in [b"0123", b"4567", b"89"]:
+            checksum.update(chunk)
+        self.assertEqual(
+            checksum.hexdigest(), hashlib.sha256(b"0123456789").hexdigest()
+        )
+
+    def test_crc32(self):
+        checksum = StreamingChecksum("crc32")
+        for chunk in [b"0123", b"4567", b"89"]:
+            checksum.update(chunk)
+        self.assertEqual(checksum.hexdigest(), "a684c7c6")
+
+    def test_bounded_queue(self):
+        checksum = StreamingChecksum("sha256", max_queued=2)
+        for _ in range(100):
+            checksum.update(b"0123456789")
+            self.assertLessEqual(checksum._chunks.qsize(), 2)
+        self.assertEqual(
+            checksum.hexdigest(), hashlib.sha256(b"0123456789" * 100).hexdigest()
+        )
+
+    def test_stall_time(self):
+        release = threading.Event()
+        hash_chunks = StreamingChecksum._hash_chunks
+
+        def slow_hash_chunks(checksum):
+            release.wait()
+            hash_chunks(checksum)
+
+        with mock.patch.object(StreamingChecksum, "_hash_chunks", slow_hash_chunks):
+            checksum = StreamingChecksum("sha256", max_queued=1)
+        checksum.update(b"01234")
+        self.assertEqual(checksum.stall_time, 0.0)
+        threading.Timer(0.2, release.set).start()
+        # The queue is full until the worker starts hashing
+        checksum.update(b"56789")
+        self.assertGreater(checksum.stall_time, 0.1)
+        self.assertEqual(
+            checksum.hexdigest(), hashlib.sha256(b"0123456789").hexdigest()
+        )
+
+    def test_hexdigest_repeated(self):
+        checksum = StreamingChecksum("crc32")
+        checksum.update(b"0123456789")
+        self.assertEqual(checksum.hexdigest(), checksum.hexdigest())
+
+    def test_invalid_algorithm(self):
+        self.assertRaises(ValueError, StreamingChecksum, "md5")
+
+
+class TransferCountersTestCase(TestCase):
+    def setUp(self):
+        self.clock = mock.Mock(return_value=10.0)
+        self.counters = TransferCounters(3, clock=self.clock)
+        self.counters.start()
+
+    def test_snapshot(self):
+        self.counters.add(0, 100)
+        self.counters.add(2, 50)
+        self.counters.add(0, 25)
+        self.clock.return_value = 12.0
+        snapshot = self.counters.snapshot()
+        self.assertEqual(snapshot.elapsed_time, 2.0)
+        self.assertEqual(snapshot.sizes, (125, 0, 50))
+        self.assertEqual(snapshot.total, 175)
+        self.assertEqual(snapshot.completed_count, 0)
+
+    def test_first_completed(self):
+        self.counters.add(0, 100)
+        self.counters.add(1, 200)
+        self.clock.return_value = 11.0
+        self.counters.end(1, completed=True)
+        self.counters.add(0, 100)
+        self.clock.return_value = 12.0
+        self.counters.end(0, completed=True)
+        self.assertEqual(self.counters.first_completed.elapsed_time, 1.0)
+        self.assertEqual(self.counters.first_completed.total, 300)
+        self.assertEqual(self.counters.snapshot().completed_count, 2)
+        self.assertEqual(self.counters.end_times, [2.0, 1.0, None])
+
+    def test_end_not_completed(self):
+        self.clock.return_value = 11.0
+        self.counters.end(2, completed=False)
+        self.assertIsNone(self.counters.first_completed)
+        self.assertEqual(self.counters.snapshot().completed_count, 0)
+        self.assertEqual(self.counters.snapshot().ended_count, 1)
+        self.assertEqual(self.counters.end_times, [None, None, 1.0])
+
+    def test_concurrent_add(self):
+        def add(index):
+            for _ in range(20000):
+                self.counters.add(index, 3)
+
+        # One writer per connection, sampled while they write
+        threads = [Thread(target=add, args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        totals = []
+        while any(thread.is_alive() for thread in threads):
+            totals.append(self.counters.snapshot().total)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(totals, sorted(totals))
+        self.assertEqual(self.counters.snapshot().sizes, (60000, 60000, 60000))
+
+
+class TransferTimelineTestCase(TestCase):
+    def test_rates(self):
+        clock = mock.Mock(return_value=0.0)
+        counters = TransferCounters(2, clock=clock)
+        counters.start()
+        timeline = TransferTimeline(2)
+        for time_, first, second in [(0.5, 100, 50), (1.0, 100, 100), (2.0, 200, 0)]:
+            clock.return_value = time_
+            counters.add(0, first)
+            counters.add(1, second)
+            timeline.record(counters.snapshot())
+        self.assertEqual(list(timeline.times), [0.5, 1.0, 2.0])
+        self.assertEqual(list(timeline.sizes[0]), [100, 200, 400])
+        self.assertEqual(list(timeline.get_rates(0)), [200, 200, 200])
+        self.assertEqual(list(timeline.get_rates(1)), [100, 200, 0])
+        self.assertEqual(list(timeline.get_rates()), [300, 400, 200])
+
+    def test_empty(self):
+        timeline = TransferTimeline(3)
+        self.assertEqual(list(timeline.get_rates()), [])
+        self.assertEqual(list(timeline.get_rates(2)), [])
@@ -1,15 +1,29 @@
 import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
 import validators
 import subprocess
 from six.moves.urllib.parse import urlparse
 from validators import ValidationFailure
 
+from netmeasure.measurements.base.http2 import HTTP2Session, is_http2_available
 from netmeasure.measurements.base.measurements import BaseMeasurement
-from netmeasure.measurements.file_download.results import FileDownloadMeasurementResult
+from netmeasure.measurements.file_download.results import (
+    FileDownloadMeasurementResult,
+    FileDownloadAggregateMeasurementResult,
+)
 from netmeasure.measurements.latency.measurements import LatencyMeasurement
 from netmeasure.measurements.base.results import Error
-from netmeasure.units import NetworkUnit, StorageUnit
+from netmeasure.measurements.base.streaming import (
+    CHECKSUM_ALGORITHMS,
+    StreamingChecksum,
+    discard,
+)
+from netmeasure.units import NetworkUnit, StorageUnit, TimeUnit
 
 WGET_OUTPUT_REGEX = re.compile(
     r"\((?P<download_rate>[\d.]*)\s(?P<download_unit>.*)\).*\[(?P<download_size>\d*)[\]/]"
@@ -24,18 +38,34 @@ WGET_ERRORS = {
     "wget-download-size": "wget could not process the download size.",
     "wget-no-server": "No closest server could be resolved.",
     "wget-timeout": "Measurement request timed out.",
+    "wget-aggregate": "None of the aggregated downloads completed successfully.",
+    "http2-err": "The HTTP/2 download failed.",
+    "http2-status": "The server responded to the HTTP/2 download with an error status.",
+    "http2-timeout": "HTTP/2 measurement request timed out.",
 }
 
 WGET_DOWNLOAD_RATE_UNIT_MAP = {
     "KB/s": NetworkUnit("Kibit/s"),
     "MB/s": NetworkUnit("Mibit/s"),
 }
+BITS_PER_BYTE = 8
+WGET_READ_SIZE = 64 * 2**10
 
 
 class FileDownloadMeasurement(BaseMeasurement):
     """A measurement designed to test download speed."""
 
-    def __init__(self, id, urls, count=4, download_timeout=180):
+    def __init__(
+        self,
+        id,
+        urls,
+        count=4,
+        download_timeout=180,
+        aggregate_count=1,
+        checksum_algorithm=None,
+        expected_checksum=None,
+        http2=False,
+    ):
         """Initialisation of a download speed measurement.
 
         :param id: A unique identifier for the measurement.
@@ -45,6 +75,24 @@ class FileDownloadMeasurement(BaseMeasurement):
         pings to perform. Defaults to 4.
         :param download_timeout: An integer describing the number of
         seconds for the test to last. 0 means no timeout.
+        :param aggregate_count: A positive integer describing the number
+        of least latent URLs to download from simultaneously. Values
+        greater than 1 report the combined rate across all downloads
+        in addition to the rate of each. Defaults to 1.
+        :param checksum_algorithm: One of `CHECKSUM_ALGORITHMS` used to
+        compute a checksum of the downloaded file as it is received.
+        Defaults to `None`, meaning no checksum is computed. Hashing
+        happens in a separate thread, behind a queue of at most
+        `CHECKSUM_QUEUE_SIZE` chunks of `WGET_READ_SIZE` bytes (4 MiB).
+        The queue is bounded deliberately: on a host which hashes slower
+        than it receives, the download is slowed to the hashing rate
+        rather than the file being buffered in memory. The time the
+        download was held up is reported as `checksum_stall_time`.
+        :param expected_checksum: A hex digest the computed checksum is
+        compared against. Requires `checksum_algorithm`.
+        :param http2: Whether to download with the HTTP/2 transport,
+        which negotiates HTTP/2 with servers that support it, instead of
+        wget. Requires the `http2` extra.
         """
         super(FileDownloadMeasurement, self).__init__(id=id)
         if len(urls) < 1:
@@ -66,19 +114,64 @@ class FileDownloadMeasurement(BaseMeasurement):
                 "integer or `0` to turn off the timeout.".format(count=count)
             )
 
+        if aggregate_count < 1:
+            raise ValueError(
+                "A value of {aggregate_count} was provided for the number of aggregated "
+                "downloads. This must be a positive integer.".format(
+                    aggregate_count=aggregate_count
+                )
+            )
+
+        if (
+            checksum_algorithm is not None
+            and checksum_algorithm not in CHECKSUM_ALGORITHMS
+        ):
+            raise ValueError(
+                "`{checksum_algorithm}` is not a supported checksum algorithm. Supported "
+                "algorithms are {algorithms}.".format(
+                    checksum_algorithm=checksum_algorithm,
+                    algorithms=", ".join(CHECKSUM_ALGORITHMS),
+                )
+            )
+
+        if expected_checksum is not None and checksum_algorithm is None:
+            raise ValueError(
+                "An expected checksum was provided without a checksum algorithm."
+            )
+
+        if http2 and not is_http2_available():
+            raise ValueError(
+                "HTTP/2 requires httpx and h2, installed with `pip install netmeasure[http2]`"
+            )
+
         self.urls = urls
         self.count = count
         self.download_timeout = download_timeout
+        self.aggregate_count = aggregate_count
+        self.checksum_algorithm = checksum_algorithm
+        self.expected_checksum = expected_checksum
+        self.http2 = http2
 
     def measure(self):
         """Perform the measurement."""
         initial_latency_results = self._find_least_latent_url(self.urls)
-        least_latent_url = initial_latency_results[0][0]
-        results = [self._get_wget_results(least_latent_url, self.download_timeout)]
+        if self.aggregate_count > 1:
+            download_urls = [
+                url for url, _ in initial_latency_results[: self.aggregate_count]
+            ]
+            results = self._get_aggregate_results(download_urls, self.download_timeout)
+        else:
+            download_urls = [initial_latency_results[0][0]]
+            results = [
+                self._get_download_results(download_urls[0], self.download_timeout)
+            ]
         if self.count > 0:
-            host = urlparse(least_latent_url).netloc
-            latency_measurement = LatencyMeasurement(self.id, host, count=self.count)
-            results.append(latency_measurement.measure()[0])
+            for url in download_urls:
+                host = urlparse(url).netloc
+                latency_measurement = LatencyMeasurement(
+                    self.id, host, count=self.count
+                )
+                results.append(latency_measurement.measure()[0])
 
         results.extend([res for _, res in initial_latency_results])
         return results
@@ -98,6 +191,113 @@ class FileDownloadMeasurement(BaseMeasurement):
             key=lambda x: (x[1].average_latency is None, x[1].average_latency),
         )
 
+    def _get_aggregate_results(self, urls, download_timeout):
+        """
+        Downloads from each of the specified URLs simultaneously
+        Returns a FileDownloadAggregateMeasurementResult followed by a
+        FileDownloadMeasurementResult for each URL
+        """
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            url_results = list(
+                executor.map(
+                    lambda url: self._get_download_results(url, download_timeout),
+                    urls,
+                )
+            )
+        elapsed_time = time.time() - start_time
+
+        completed_results = [r for r in url_results if len(r.errors) == 0]
+        if len(completed_results) == 0:
+            aggregate_result = self._get_aggregate_error(
+                "wget-aggregate",
+                urls,
+                traceback="\n".join(
+                    str(error.traceback) for r in url_results for error in r.errors
+                ),
+            )
+        else:
+            download_size = sum(r.download_size for r in completed_results)
+            aggregate_result = FileDownloadAggregateMeasurementResult(
+                id=self.id,
+                urls=[r.url for r in completed_results],
+                download_size=download_size,
+                download_size_unit=StorageUnit.byte,
+                download_rate=download_size * BITS_PER_BYTE / elapsed_time,
+                download_rate_unit=NetworkUnit("bit/s"),
+                elapsed_time=elapsed_time,
+                elapsed_time_unit=TimeUnit("s"),
+                errors=[],
+            )
+        return [aggregate_result] + url_results
+
+    def _get_download_results(self, url, download_timeout):
+        """
+        Downloads from `url` with the HTTP/2 transport if requested, otherwise with wget
+        """
+        if self.http2:
+            return self._get_http2_results(url, download_timeout)
+        return self._get_wget_results(url, download_timeout)
+
+    def _get_http2_results(self, url, download_timeout):
+        """Perform the download measurement with the HTTP/2 transport."""
+        if url is None:
+            return self._get_wget_error("wget-no-server", url, traceback=None)
+
+        if download_timeout == 0:
+            download_timeout = None
+        with HTTP2Session() as session:
+            try:
+                start_time = time.time()
+                # Like wget, ask for the file as stored rather than compressed
+                response = session.get(
+                    url,
+                    headers={"Accept-Encoding": "identity"},
+                    timeout=download_timeout,
+                    stream=True,
+                )
+                if response.status_code >= 400:
+                    response.close()
+                    return self._get_wget_error(
+                        "http2-status", url, traceback=str(response.status_code)
+                    )
+                download_size, checksum = self._read_http2_response(response)
+                elapsed_time = time.time() - start_time
+            except requests.exceptions.Timeout:
+                return self._get_wget_error("http2-timeout", url, traceback=None)
+            except requests.ConnectionError as e:
+                return self._get_wget_error("http2-err", url, traceback=str(e))
+
+        return FileDownloadMeasurementResult(
+            id=self.id,
+            url=url,
+            download_rate_unit=NetworkUnit("bit/s"),
+            download_rate=download_size * BITS_PER_BYTE / elapsed_time,
+            download_size=float(download_size),
+            download_size_unit=StorageUnit.byte,
+            http_version=response.http_version,
+            errors=[],
+            **self._get_checksum_fields(checksum),
+        )
+
+    def _read_http2_response(self, response):
+        """
+        Reads the body of a streamed response, computing a checksum over the bytes as they are received
+        Returns the number of bytes read and the finished StreamingChecksum, which is None without `checksum_algorithm`
+        """
+        if self.checksum_algorithm is None:
+            return discard(response, bytearray(WGET_READ_SIZE)), None
+        checksum = StreamingChecksum(self.checksum_algorithm)
+        download_size = 0
+        try:
+            for chunk in response.iter_content(WGET_READ_SIZE):
+                download_size += len(chunk)
+                checksum.update(chunk)
+        finally:
+            # Stops the checksum's worker, even if the download failed
+            checksum.hexdigest()
+        return download_size, checksum
+
     def _get_wget_results(self, url, download_timeout):
         """Perform the download measurement."""
         if url is None:
@@ -105,14 +305,18 @@ class FileDownloadMeasurement(BaseMeasurement):
 
         if download_timeout == 0:
             download_timeout = None
+        checksum = None
         try:
-            wget_out = subprocess.run(
-                ["wget", "--tries=2", "-O", "/dev/null", url],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=download_timeout,
-                universal_newlines=True,
-            )
+            if self.checksum_algorithm is None:
+                wget_out = subprocess.run(
+                    ["wget", "--tries=2", "-O", "/dev/null", url],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    timeout=download_timeout,
+                    universal_newlines=True,
+                )
+            else:
+                wget_out, checksum = self._run_wget_with_checksum(url, download_timeout)
         except subprocess.TimeoutExpired:
             return self._get_wget_error("wget-timeout", url, traceback=None)
 
@@ -163,8 +367,74 @@ class FileDownloadMeasurement(BaseMeasurement):
             download_size=download_size,
             download_size_unit=StorageUnit.byte,
             errors=[],
+            **self._get_checksum_fields(checksum),
+        )
+
+    def _run_wget_with_checksum(self, url, download_timeout):
+        """
+        Downloads to stdout, computing a checksum over the bytes as they are received
+        Returns the completed process and the finished StreamingChecksum
+        """
+        args = ["wget", "--tries=2", "-O", "-", url]
+        checksum = StreamingChecksum(self.checksum_algorithm)
+        # stderr is written to a file so that wget is never blocked by a full pipe
+        with tempfile.TemporaryFile() as stderr_file:
+            wget_process = subprocess.Popen(
+                args, stdout=subprocess.PIPE, stderr=stderr_file
+            )
+            timed_out = threading.Event()
+            timer = None
+            if download_timeout is not None:
+
+                def expire():
+                    timed_out.set()
+                    wget_process.kill()
+
+                timer = threading.Timer(download_timeout, expire)
+                timer.start()
+            try:
+                # Chunks are passed on to be hashed in a separate thread
+                for chunk in iter(
+                    lambda: wget_process.stdout.read1(WGET_READ_SIZE), b""
+                ):
+                    checksum.update(chunk)
+                returncode = wget_process.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                wget_process.stdout.close()
+                # Stops the checksum's worker, even if the download failed
+                checksum.hexdigest()
+            if timed_out.is_set():
+                raise subprocess.TimeoutExpired(args, download_timeout)
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode(errors="replace")
+        return (
+            subprocess.CompletedProcess(args, returncode, stdout=None, stderr=stderr),
+            checksum,
         )
 
+    def _get_checksum_fields(self, checksum):
+        """
+        Returns the checksum fields of a FileDownloadMeasurementResult from a finished StreamingChecksum
+        They are empty without `checksum_algorithm`
+        """
+        if checksum is None:
+            return {}
+        digest = checksum.hexdigest()
+        return {
+            "checksum": digest,
+            "checksum_algorithm": self.checksum_algorithm,
+            "checksum_matched": self._is_checksum_matched(digest),
+            "checksum_stall_time": checksum.stall_time,
+            "checksum_stall_time_unit": TimeUnit("s"),
+        }
+
+    def _is_checksum_matched(self, checksum):
+        if checksum is None or self.expected_checksum is None:
+            return None
+        return checksum.lower() == self.expected_checksum.lower()
+
     def _get_wget_error(self, key, url, traceback):
         return FileDownloadMeasurementResult(
             id=self.id,
@@ -179,3 +449,20 @@ class FileDownloadMeasurement(BaseMeasurement):
                 )
             ],
         )
+
+    def _get_aggregate_error(self, key, urls, traceback):
+        return FileDownloadAggregateMeasurementResult(
+            id=self.id,
+            urls=urls,
+            download_size=None,
+            download_size_unit=None,
+            download_rate=None,
+            download_rate_unit=None,
+            elapsed_time=None,
+            elapsed_time_unit=None,
+            errors=[
+                Error(
+                    key=key, description=WGET_ERRORS.get(key, ""), traceback=traceback
+                )
+            ],
+        )
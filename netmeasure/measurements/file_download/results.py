@@ -2,7 +2,7 @@ import typing
 from dataclasses import dataclass
 
 from netmeasure.measurements.base.results import MeasurementResult
-from netmeasure.units import NetworkUnit, StorageUnit
+from netmeasure.units import NetworkUnit, StorageUnit, TimeUnit
 
 
 @dataclass(frozen=True)
@@ -19,6 +19,21 @@ class FileDownloadMeasurementResult(MeasurementResult):
     measurement excluding units:
     :param download_rate_unit: The unit of measurement used to
     measure the `download_rate`.
+    :param checksum: The hex digest of the downloaded bytes, if a
+    checksum was requested.
+    :param checksum_algorithm: The algorithm used to compute the
+    `checksum`.
+    :param checksum_matched: Whether the `checksum` matched the expected
+    checksum, or `None` if no expected checksum was provided.
+    :param http_version: The protocol the file was received over, e.g.
+    "HTTP/2", if it was downloaded with the HTTP/2 transport rather than
+    wget.
+    :param checksum_stall_time: The time (excluding units) the download
+    was held up waiting for the checksum to catch up, if a checksum was
+    requested. Above zero, the `download_rate` may be limited by hashing
+    rather than by the network.
+    :param checksum_stall_time_unit: The unit of measurement used to
+    describe the `checksum_stall_time`.
     """
 
     url: str
@@ -26,3 +41,39 @@ class FileDownloadMeasurementResult(MeasurementResult):
     download_size_unit: typing.Optional[StorageUnit]
     download_rate: typing.Optional[float]
     download_rate_unit: typing.Optional[NetworkUnit]
+    checksum: typing.Optional[str] = None
+    checksum_algorithm: typing.Optional[str] = None
+    checksum_matched: typing.Optional[bool] = None
+    http_version: typing.Optional[str] = None
+    checksum_stall_time: typing.Optional[float] = None
+    checksum_stall_time_unit: typing.Optional[TimeUnit] = None
+
+
+@dataclass(frozen=True)
+class FileDownloadAggregateMeasurementResult(MeasurementResult):
+    """Encapsulates the combined results from simultaneous downloads.
+
+    :param urls: The URLs whose downloads completed and are included
+    in the combined measurement.
+    :param download_size: The combined size of the downloads (excluding
+    units).
+    :param download_size_unit: The unit of measurement used
+    to describe the `download_size`.
+    :param download_rate: The combined rate of the downloads, measured
+    from the start of the first to the end of the last (excluding
+    units).
+    :param download_rate_unit: The unit of measurement used to
+    measure the `download_rate`.
+    :param elapsed_time: The time taken to complete all downloads
+    (excluding units).
+    :param elapsed_time_unit: The unit of measurement used to
+    describe the `elapsed_time`.
+    """
+
+    urls: typing.List[str]
+    download_size: typing.Optional[float]
+    download_size_unit: typing.Optional[StorageUnit]
+    download_rate: typing.Optional[float]
+    download_rate_unit: typing.Optional[NetworkUnit]
+    elapsed_time: typing.Optional[float]
+    elapsed_time_unit: typing.Optional[TimeUnit]
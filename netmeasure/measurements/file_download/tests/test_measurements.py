@@ -1,17 +1,27 @@
 # -*- coding: utf-8 -*-
-from unittest import TestCase, mock
+import hashlib
+import io
+import threading
+from unittest import TestCase, mock, skipUnless
 import six
+import socket
 import subprocess
 
 from netmeasure.measurements.latency.measurements import LatencyMeasurement
+from netmeasure.measurements.base.http2 import is_http2_available
 from netmeasure.measurements.base.results import Error
+from netmeasure.measurements.base.streaming import StreamingChecksum
+from netmeasure.measurements.base.tests.h2_server import H2Server, get_h2c_session
 from netmeasure.measurements.file_download.measurements import WGET_OUTPUT_REGEX
 from netmeasure.measurements.file_download.measurements import FileDownloadMeasurement
 from netmeasure.measurements.file_download.measurements import WGET_ERRORS
-from netmeasure.measurements.file_download.results import FileDownloadMeasurementResult
+from netmeasure.measurements.file_download.results import (
+    FileDownloadMeasurementResult,
+    FileDownloadAggregateMeasurementResult,
+)
 from netmeasure.measurements.latency.results import LatencyMeasurementResult
 
-from netmeasure.units import NetworkUnit, StorageUnit
+from netmeasure.units import NetworkUnit, StorageUnit, TimeUnit
 
 # NOTE: To match what subprocess calls output, wget output strings
 #       should end with "\n\n" and latency output strings should end with "\n"
@@ -53,6 +63,46 @@ class FileDownloadMeasurementCreationTestCase(TestCase):
             count=-2,
         )
 
+    def test_invalid_aggregate_count(self, *args):
+        self.assertRaises(
+            ValueError,
+            FileDownloadMeasurement,
+            "test",
+            ["http://validfakeurl.com"],
+            aggregate_count=0,
+        )
+
+    def test_invalid_checksum_algorithm(self, *args):
+        self.assertRaises(
+            ValueError,
+            FileDownloadMeasurement,
+            "test",
+            ["http://validfakeurl.com"],
+            checksum_algorithm="md5",
+        )
+
+    @mock.patch(
+        "netmeasure.measurements.file_download.measurements.is_http2_available",
+        return_value=False,
+    )
+    def test_http2_unavailable(self, *args):
+        self.assertRaises(
+            ValueError,
+            FileDownloadMeasurement,
+            "test",
+            ["http://validfakehost.com/test"],
+            http2=True,
+        )
+
+    def test_expected_checksum_without_algorithm(self, *args):
+        self.assertRaises(
+            ValueError,
+            FileDownloadMeasurement,
+            "test",
+            ["http://validfakeurl.com"],
+            expected_checksum="a684c7c6",
+        )
+
 
 class FileDownloadMeasurementWgetTestCase(TestCase):
     def setUp(self) -> None:
@@ -200,6 +250,301 @@ class FileDownloadMeasurementWgetTestCase(TestCase):
         )
 
 
+class FileDownloadMeasurementChecksumTestCase(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.content = b"0123456789" * 10000
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def get_wget_process(self, args, stdout, stderr):
+        # wget writes the file to stdout and its progress to stderr
+        stderr.write(
+            "\n2019-08-07 09:12:08 (16.7 MB/s) - written to stdout [100000]\n\n".encode()
+        )
+        wget_process = mock.MagicMock()
+        wget_process.stdout = io.BufferedReader(io.BytesIO(self.content), 4096)
+        wget_process.wait.return_value = 0
+        return wget_process
+
+    @mock.patch("subprocess.Popen")
+    def test_checksum_matched(self, mock_popen):
+        mock_popen.side_effect = self.get_wget_process
+        measurement = FileDownloadMeasurement(
+            "test",
+            ["http://validfakehost.com/test"],
+            checksum_algorithm="sha256",
+            expected_checksum=self.sha256.upper(),
+        )
+        self.assertEqual(
+            measurement._get_wget_results("http://validfakehost.com/test", 0),
+            FileDownloadMeasurementResult(
+                id="test",
+                url="http://validfakehost.com/test",
+                download_rate_unit=NetworkUnit("Mibit/s"),
+                download_rate=133.6,
+                download_size=100000,
+                download_size_unit=StorageUnit.byte,
+                checksum=self.sha256,
+                checksum_algorithm="sha256",
+                checksum_matched=True,
+                checksum_stall_time=0.0,
+                checksum_stall_time_unit=TimeUnit("s"),
+                errors=[],
+            ),
+        )
+        self.assertEqual(
+            mock_popen.call_args[0][0],
+            ["wget", "--tries=2", "-O", "-", "http://validfakehost.com/test"],
+        )
+
+    @mock.patch("subprocess.Popen")
+    def test_checksum_not_matched(self, mock_popen):
+        mock_popen.side_effect = self.get_wget_process
+        measurement = FileDownloadMeasurement(
+            "test",
+            ["http://validfakehost.com/test"],
+            checksum_algorithm="crc32",
+            expected_checksum="00000000",
+        )
+        result = measurement._get_wget_results("http://validfakehost.com/test", 0)
+        self.assertEqual(result.checksum_algorithm, "crc32")
+        self.assertFalse(result.checksum_matched)
+
+    @mock.patch("subprocess.Popen")
+    def test_checksum_without_expected(self, mock_popen):
+        mock_popen.side_effect = self.get_wget_process
+        measurement = FileDownloadMeasurement(
+            "test", ["http://validfakehost.com/test"], checksum_algorithm="sha256"
+        )
+        result = measurement._get_wget_results("http://validfakehost.com/test", 0)
+        self.assertEqual(result.checksum, self.sha256)
+        self.assertIsNone(result.checksum_matched)
+        self.assertGreaterEqual(result.checksum_stall_time, 0.0)
+        self.assertEqual(result.checksum_stall_time_unit, TimeUnit("s"))
+
+    @mock.patch("subprocess.Popen")
+    def test_checksum_timeout(self, mock_popen):
+        killed = threading.Event()
+        wget_process = mock.MagicMock()
+        # Block reading stdout until the process is killed
+        wget_process.stdout.read1.side_effect = lambda size: killed.wait() and b""
+        wget_process.kill.side_effect = killed.set
+        wget_process.wait.return_value = -9
+        mock_popen.return_value = wget_process
+        measurement = FileDownloadMeasurement(
+            "test", ["http://validfakehost.com/test"], checksum_algorithm="sha256"
+        )
+        checksums = []
+
+        def get_checksum(*args, **kwargs):
+            checksums.append(StreamingChecksum(*args, **kwargs))
+            return checksums[-1]
+
+        with mock.patch(
+            "netmeasure.measurements.file_download.measurements.StreamingChecksum",
+            side_effect=get_checksum,
+        ):
+            result = measurement._get_wget_results(
+                "http://validfakehost.com/test", 0.01
+            )
+        self.assertEqual(result.errors[0].key, "wget-timeout")
+        # The checksum's worker was stopped
+        self.assertFalse(checksums[0]._worker.is_alive())
+
+
+@skipUnless(is_http2_available(), "httpx and h2 are not installed")
+@mock.patch(
+    "netmeasure.measurements.file_download.measurements.HTTP2Session",
+    get_h2c_session,
+)
+class FileDownloadMeasurementHTTP2TestCase(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.content = b"0123456789" * 10000
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+        self.server = H2Server({"/test": ([], self.content)})
+        self.server.start()
+        self.url = self.server.base_url + "/test"
+
+    def tearDown(self):
+        self.server.stop()
+        super().tearDown()
+
+    def test_http2(self):
+        measurement = FileDownloadMeasurement(
+            "test",
+            [self.url],
+            checksum_algorithm="sha256",
+            expected_checksum=self.sha256,
+            http2=True,
+        )
+        result = measurement._get_download_results(self.url, 0)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.http_version, "HTTP/2")
+        self.assertEqual(result.download_size, 100000)
+        self.assertEqual(result.download_size_unit, StorageUnit.byte)
+        self.assertEqual(result.download_rate_unit, NetworkUnit("bit/s"))
+        self.assertGreater(result.download_rate, 0)
+        self.assertEqual(result.checksum, self.sha256)
+        self.assertTrue(result.checksum_matched)
+
+    def test_aggregate(self):
+        measurement = FileDownloadMeasurement(
+            "test", [self.url], aggregate_count=2, http2=True
+        )
+        aggregate_result, *url_results = measurement._get_aggregate_results(
+            [self.url, self.url], 0
+        )
+        self.assertEqual(aggregate_result.download_size, 200000)
+        self.assertEqual(
+            [result.http_version for result in url_results], ["HTTP/2", "HTTP/2"]
+        )
+
+    def test_error_status(self):
+        measurement = FileDownloadMeasurement("test", [self.url], http2=True)
+        result = measurement._get_download_results(self.server.base_url + "/missing", 0)
+        self.assertEqual(result.errors[0].key, "http2-status")
+        self.assertEqual(result.errors[0].traceback, "404")
+
+    def test_connection_error(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            url = "http://127.0.0.1:{port}/test".format(port=sock.getsockname()[1])
+        measurement = FileDownloadMeasurement("test", [url], http2=True)
+        result = measurement._get_download_results(url, 0)
+        self.assertEqual(result.errors[0].key, "http2-err")
+
+
+class FileDownloadMeasurementAggregateTestCase(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.example_urls = [
+            "http://n1-validfakehost.com/test",
+            "http://n2-validfakehost.com/test",
+        ]
+        self.measurement = FileDownloadMeasurement(
+            "test", self.example_urls, aggregate_count=2
+        )
+
+    @staticmethod
+    def get_wget_process(args, **kwargs):
+        # Each host reports a different download size
+        download_size = {
+            "http://n1-validfakehost.com/test": 1000,
+            "http://n2-validfakehost.com/test": 3000,
+        }.get(args[-1])
+        if download_size is None:
+            return subprocess.CompletedProcess(
+                args=args, returncode=4, stdout="", stderr="Network failure."
+            )
+        return subprocess.CompletedProcess(
+            args=args,
+            returncode=0,
+            stdout="b''",
+            stderr="\n2019-08-07 09:12:08 (16.7 MB/s) - '/dev/null’ saved [{size}]\n\n".format(
+                size=download_size
+            ),
+        )
+
+    @mock.patch("time.time")
+    @mock.patch("subprocess.run")
+    def test_aggregate_results(self, mock_run, mock_time):
+        mock_run.side_effect = self.get_wget_process
+        mock_time.side_effect = [10.0, 12.0]
+        results = self.measurement._get_aggregate_results(
+            self.example_urls, self.measurement.download_timeout
+        )
+        self.assertEqual(
+            results[0],
+            FileDownloadAggregateMeasurementResult(
+                id="test",
+                urls=self.example_urls,
+                download_size=4000,
+                download_size_unit=StorageUnit.byte,
+                download_rate=4000 * 8 / 2.0,
+                download_rate_unit=NetworkUnit("bit/s"),
+                elapsed_time=2.0,
+                elapsed_time_unit=TimeUnit("s"),
+                errors=[],
+            ),
+        )
+        self.assertEqual(
+            [(r.url, r.download_size) for r in results[1:]],
+            [(self.example_urls[0], 1000), (self.example_urls[1], 3000)],
+        )
+
+    @mock.patch("time.time")
+    @mock.patch("subprocess.run")
+    def test_aggregate_partial_failure(self, mock_run, mock_time):
+        mock_run.side_effect = self.get_wget_process
+        mock_time.side_effect = [10.0, 12.0]
+        urls = self.example_urls + ["http://n3-validfakehost.com/test"]
+        results = self.measurement._get_aggregate_results(
+            urls, self.measurement.download_timeout
+        )
+        self.assertEqual(results[0].urls, self.example_urls)
+        self.assertEqual(results[0].download_size, 4000)
+        self.assertEqual(results[3].errors[0].key, "wget-err")
+
+    @mock.patch("time.time")
+    @mock.patch("subprocess.run")
+    def test_aggregate_all_failed(self, mock_run, mock_time):
+        mock_run.side_effect = self.get_wget_process
+        mock_time.side_effect = [10.0, 12.0]
+        urls = ["http://n3-validfakehost.com/test"]
+        results = self.measurement._get_aggregate_results(
+            urls, self.measurement.download_timeout
+        )
+        self.assertEqual(
+            results[0],
+            FileDownloadAggregateMeasurementResult(
+                id="test",
+                urls=urls,
+                download_size=None,
+                download_size_unit=None,
+                download_rate=None,
+                download_rate_unit=None,
+                elapsed_time=None,
+                elapsed_time_unit=None,
+                errors=[
+                    Error(
+                        key="wget-aggregate",
+                        description=WGET_ERRORS.get("wget-aggregate", ""),
+                        traceback="Network failure.",
+                    )
+                ],
+            ),
+        )
+
+    @mock.patch.object(FileDownloadMeasurement, "_get_aggregate_results")
+    @mock.patch.object(FileDownloadMeasurement, "_find_least_latent_url")
+    @mock.patch.object(LatencyMeasurement, "measure")
+    def test_measure_aggregates_least_latent(
+        self, mock_latency, mock_find_least_latent_url, mock_get_aggregate_results
+    ):
+        measurement = FileDownloadMeasurement(
+            "test",
+            self.example_urls + ["http://n3-validfakehost.com/test"],
+            count=0,
+            aggregate_count=2,
+        )
+        mock_find_least_latent_url.return_value = [
+            ("http://n3-validfakehost.com/test", "n3 latency"),
+            (self.example_urls[0], "n1 latency"),
+            (self.example_urls[1], "n2 latency"),
+        ]
+        mock_get_aggregate_results.return_value = ["aggregate results"]
+        self.assertEqual(
+            measurement.measure(),
+            ["aggregate results", "n3 latency", "n1 latency", "n2 latency"],
+        )
+        mock_get_aggregate_results.assert_called_once_with(
+            ["http://n3-validfakehost.com/test", self.example_urls[0]],
+            measurement.download_timeout,
+        )
+        mock_latency.assert_not_called()
+
+
 class FileDownloadMeasurementClosestServerTestCase(TestCase):
     def setUp(self) -> None:
         super().setUp()
@@ -0,0 +1,204 @@
+"""An end-to-end benchmark of `NetflixFastMeasurement`.
+
+Each run measures against a `FastStandInServer` throttled to a set rate,
+started in a separate process so that only the measurement's CPU time is
+counted. A run reports how far the measured rate is from the set rate,
+the CPU time spent measuring, and the termination latency: the time from
+the test deciding to end until every transfer has stopped. Comparing
+these between versions catches performance regressions without network
+access.
+
+    python -m netmeasure.measurements.netflix_fast.benchmark --rate 1000000 --rate 10000000
+"""
+
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+
+import click
+
+from netmeasure.measurements.netflix_fast.measurements import (
+    BITS_PER_BYTE,
+    ENGINES,
+    NetflixFastMeasurement,
+)
+
+BENCHMARK_MAX_TIME_SECONDS = 5
+# Large enough that no target completes before the test ends
+BENCHMARK_TARGET_SIZE = 2**40
+DEFAULT_RATES = [1e6, 1e7, 1e8]
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    """The outcome of measuring against the stand-in at one rate.
+
+    Rates are in bytes per second and times in seconds.
+    """
+
+    engine: str
+    rate: float
+    measured_rate: float
+    error_percent: float
+    cpu_time: float
+    elapsed_time: float
+    termination_latency: float
+    reason_terminated: str
+
+
+class StandInProcess:
+    """Runs a `FastStandInServer` in a separate process.
+
+    :param rate: The rate of the emulated link in bytes per second.
+    :param target_size: The number of bytes each target sends.
+    """
+
+    def __init__(self, rate, target_size=BENCHMARK_TARGET_SIZE):
+        self.rate = rate
+        self.target_size = target_size
+        self.fast_url = None
+        self.api_url = None
+        self._process = None
+
+    def __enter__(self):
+        self._process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "netmeasure.measurements.netflix_fast.standin",
+                "--rate",
+                str(self.rate),
+                "--target-size",
+                str(self.target_size),
+            ],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        self.fast_url = self._process.stdout.readline().strip()
+        self.api_url = self._process.stdout.readline().strip()
+        if not self.api_url:
+            self.__exit__(None, None, None)
+            raise ConnectionError("The fast.com stand-in failed to start")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._process.terminate()
+        self._process.wait()
+        self._process.stdout.close()
+
+
+def run_benchmark(
+    rate, engine="threads", max_time_seconds=BENCHMARK_MAX_TIME_SECONDS, **kwargs
+):
+    """Measure against a stand-in throttled to `rate`.
+
+    :param rate: The rate of the emulated link in bytes per second.
+    :param engine: The engine the measurement uses.
+    :param max_time_seconds: The time the measurement runs for.
+    :param kwargs: Further arguments for `NetflixFastMeasurement`.
+    :return: A `BenchmarkResult`.
+    """
+    with StandInProcess(rate) as stand_in:
+        measurement = NetflixFastMeasurement(
+            "benchmark",
+            max_time_seconds=max_time_seconds,
+            terminate_on_thread_complete=False,
+            engine=engine,
+            fast_url=stand_in.fast_url,
+            api_url=stand_in.api_url,
+            **kwargs
+        )
+        timings = _instrument(measurement)
+        # Only the download is benchmarked, without the latency probes which follow it
+        with measurement:
+            measurement._reset_measurement_state()
+            cpu_start, start = time.process_time(), time.perf_counter()
+            fast_result = measurement._get_fast_result()
+            cpu_time = time.process_time() - cpu_start
+            elapsed_time = time.perf_counter() - start
+
+    if fast_result.errors:
+        raise ConnectionError(fast_result.errors[0].description)
+    measured_rate = fast_result.download_rate / BITS_PER_BYTE
+    return BenchmarkResult(
+        engine=engine,
+        rate=rate,
+        measured_rate=measured_rate,
+        error_percent=(measured_rate - rate) / rate * 100,
+        cpu_time=cpu_time,
+        elapsed_time=elapsed_time,
+        termination_latency=timings["stopped"] - timings["decided"],
+        reason_terminated=fast_result.reason_terminated,
+    )
+
+
+def _instrument(measurement):
+    # Wrap the measurement's termination checks, recording when the test
+    # decides to end and when its transfers have all stopped
+    timings = {}
+    is_test_complete = measurement._is_test_complete
+    get_fast_data = measurement._get_fast_data
+
+    def timed_is_test_complete(elapsed_time):
+        reason = is_test_complete(elapsed_time)
+        if reason and "decided" not in timings:
+            timings["decided"] = time.perf_counter()
+        return reason
+
+    def timed_get_fast_data(*args, **kwargs):
+        timings.setdefault("stopped", time.perf_counter())
+        return get_fast_data(*args, **kwargs)
+
+    measurement._is_test_complete = timed_is_test_complete
+    measurement._get_fast_data = timed_get_fast_data
+    return timings
+
+
+@click.command()
+@click.option(
+    "--rate",
+    "rates",
+    multiple=True,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Rate in bytes per second to benchmark at, may be repeated",
+)
+@click.option(
+    "-e",
+    "--engine",
+    "engines",
+    multiple=True,
+    type=click.Choice(ENGINES),
+    help="Engine to benchmark, may be repeated. Defaults to all engines",
+)
+@click.option(
+    "--max-time",
+    default=BENCHMARK_MAX_TIME_SECONDS,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Seconds each measurement runs for",
+)
+@click.option("-u", "--urlcount", default=3, type=click.IntRange(min=1))
+def main(rates, engines, max_time, urlcount):
+    """
+    Benchmark NetflixFastMeasurement against a local fast.com stand-in.
+    """
+    click.echo(
+        "engine   rate (B/s)   measured (B/s)  error %  cpu (s)  "
+        "elapsed (s)  termination (ms)"
+    )
+    for engine in engines or ENGINES:
+        for rate in rates or DEFAULT_RATES:
+            result = run_benchmark(
+                rate, engine=engine, max_time_seconds=max_time, urlcount=urlcount
+            )
+            click.echo(
+                "{r.engine:<8} {r.rate:>11.4g} {r.measured_rate:>16.4g} "
+                "{r.error_percent:>8.2f} {r.cpu_time:>8.3f} {r.elapsed_time:>12.3f} "
+                "{termination:>17.1f}".format(
+                    r=result, termination=result.termination_latency * 1000
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""An on-disk cache of the fast.com API token.
+
+Finding the token means fetching the fast.com page, finding its script
+and downloading the script to search it for the token. The token is
+cached so that later measurements can query the API directly.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_TOKEN_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+
+def get_default_token_cache_path():
+    """Get the default path of the token cache, within the user's cache
+    directory (`$XDG_CACHE_HOME`, or `~/.cache`)."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "netmeasure", "netflix_fast_token.json")
+
+
+class TokenCache:
+    """Stores the fast.com API token in a JSON file.
+
+    The cache is best-effort: a cache which cannot be read or written is
+    treated as empty.
+
+    :param path: The path of the cache file.
+    :param ttl_seconds: The time after which a cached token is no longer
+    used.
+    :param clock: A wall clock returning seconds since the epoch.
+    """
+
+    def __init__(
+        self, path, ttl_seconds=DEFAULT_TOKEN_CACHE_TTL_SECONDS, clock=time.time
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+
+    def load(self):
+        """Get the cached token.
+
+        :return: The token, or `None` if nothing unexpired is cached.
+        """
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+            token, created = entry["token"], entry["created"]
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+        age = self._clock() - created
+        if not 0 <= age < self.ttl_seconds:
+            return None
+        return token
+
+    def store(self, token):
+        """Cache a token."""
+        entry = {"token": token, "created": self._clock()}
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Replace the file in one step so readers never see a partial entry
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(entry, f)
+                os.replace(temp_path, self.path)
+            except OSError:
+                os.unlink(temp_path)
+                raise
+        except OSError:
+            pass
+
+    def invalidate(self):
+        """Remove any cached token."""
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -5,34 +5,75 @@ Using the netflix_fast v2 api, the test collects some details about the client,
     - All threads have finished downloading
     - A single thread has finished downloading, IF `terminate_on_thread_complete=True`
 
-Stabilisation is considered to be:
+Stabilisation is decided by the `stability_detector`, which is updated with the total downloaded at every sample. By default (`"delta"`) it is considered to be:
     - Downloaded has been running longer than `MIN_TIME_SECONDS` (presently 3s)
     - AND more than or equal to `MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE` (presently 6) have been recorded
     - AND maximum percentage delta in these measurements is `< STABLE_MEASUREMENTS_DELTA` presently (2%)
 
+`"ewma"` instead waits for an exponentially weighted moving average of the rate between samples to stop moving, and `"regression"` for the slope of a line fitted to recent rates to flatten. Both react to changes in rate sooner than the cumulative average does. A configured `StabilityDetector` instance may also be given.
+
+With `engine="asyncio"` all URLs are instead downloaded on a single asyncio event loop. Samples are taken on a timer aligned to the start of the download rather than after each sleep, and termination is also checked as soon as any download completes. Once the test is complete, outstanding downloads are cancelled immediately instead of waiting for each thread to receive its next chunk.
+
+If `token_cache_path` is given, the API token is cached there for `token_cache_ttl_seconds` (presently 24 hours). Later tests query the API with the cached token directly, only fetching fast.com and its script again once the cache has expired or the API rejects the cached token.
+
+With `adaptive_connections=True` the test instead starts downloading from `ADAPTIVE_INITIAL_CONNECTIONS` (presently 1) of the URLs, and every `ADAPTIVE_INTERVAL_SECONDS` (presently 1s) adds a connection to the next URL for as long as the throughput over the last interval rose by at least `ADAPTIVE_MIN_GROWTH_PERCENT` (presently 10%). `urlcount` is then the maximum number of connections. The number of connections settled on is reported as `connection_count`, and only the URLs downloaded from are reported on. The result is not considered stabilised until the number of connections has settled.
+
+With `upload=True` the download is followed by an upload to the same URLs, which sends `upload_payload_size` bytes of zeros (presently 25 MiB) over each connection. The upload is sampled, scaled and terminated in the same way as the download, and reported as `upload_rate` and `upload_size`. The fast.com page and API are read from `fast_url` and `api_url`, so that a local stand-in may be used.
+
+At every sample the bytes received over each connection are recorded in compact arrays. From these the rate over each interval is reported for every connection, as `download_rates` on its `NetflixFastThreadResult`, and overall, as `download_rates` on the `NetflixFastMeasurementResult`, with the times of the samples as `sample_times`. A single slow URL holding back the total can be seen in these.
+
+With `autotune_chunk_size=True` (the default) each download thread adapts the size of its reads to the rate it is receiving at, aiming for `TARGET_READS_PER_SECOND` (presently 50) reads per second, between `MIN_CHUNK_SIZE` (4 KiB) and `MAX_CHUNK_SIZE` (4 MiB), starting from `chunk_size`. Fast connections then spend less time per byte in Python, while slow ones are not held up waiting for a large chunk to fill. The size each connection ended on is reported as `chunk_size` on its `NetflixFastThreadResult`.
+
+By default each URL's full object is downloaded, so when a connection completes depends on the size of the object its server sends. With `range_sizes` each connection instead requests the given numbers of bytes in turn, using the `/range/0-N` suffix the targets accept, reusing its connection for each request, and completes once it has received them all. Growing sizes, such as `(256 KiB, 2 MiB, 16 MiB)`, let the test ramp up quickly without wasting much data on slow links, while the sum of the sizes bounds the bytes each connection can download.
+
+All requests made with `requests` share a single session, whose connection pools keep a connection per URL. With `keep_alive=True` (the default) the session, and so its connections, are kept between calls to `measure()` until `close()` is called or the measurement is used as a context manager and exits. With `keep_alive=False` connections are not reused and the session is closed at the end of each measurement. Each call to `measure()` starts from a fresh state, so a measurement may be run repeatedly.
+
 In cases where the test concludes independently of the main loop (i.e when `reason_terminated == "thread_complete"`) The speed at the instant the thread completes is used, otherwise the final speed is used.
 
 All this is then packaged into a `NetflixFastMeasurementResult`
 
-After this, each of the URLs downloaded from has a latency test then have an Honesty-Box LatencyMeasurement test run against them, the results of which, along with the location and download rates/sizes for each thread are put into a `NetflixFastThreadResult`.
+After this, each of the URLs downloaded from has an Honesty-Box LatencyMeasurement test run against them concurrently, the results of which, along with the location and download rates/sizes for each thread are put into a `NetflixFastThreadResult`.
 
 All these results are then returned as a list.
 """
 
+import array
+import asyncio
+import functools
 import requests
 import re
 import time
 import urllib
 import json
 from threading import Thread
-from collections import deque
-from statistics import mean
+from concurrent.futures import ThreadPoolExecutor
 
 from netmeasure.measurements.base.measurements import BaseMeasurement
+from netmeasure.measurements.base.aio import get_request_target, open_connection
 from netmeasure.measurements.base.results import Error
+from netmeasure.measurements.base.scaling import ConnectionScaler
+from netmeasure.measurements.base.stability import (
+    DeltaStabilityDetector,
+    EWMAStabilityDetector,
+    RegressionStabilityDetector,
+    StabilityDetector,
+)
+from netmeasure.measurements.base.streaming import (
+    MAX_CHUNK_SIZE,
+    MIN_CHUNK_SIZE,
+    ChunkSizeTuner,
+    GeneratedPayload,
+    iter_discard,
+    TransferCounters,
+    TransferTimeline,
+)
 from netmeasure.units import RatioUnit, TimeUnit, StorageUnit, NetworkUnit
 from netmeasure.measurements.latency.measurements import LatencyMeasurement
 from netmeasure.measurements.file_download.measurements import FileDownloadMeasurement
+from netmeasure.measurements.netflix_fast.cache import (
+    DEFAULT_TOKEN_CACHE_TTL_SECONDS,
+    TokenCache,
+)
 from netmeasure.measurements.netflix_fast.results import (
     NetflixFastMeasurementResult,
     NetflixFastThreadResult,
@@ -51,12 +92,32 @@ NETFLIX_ERRORS = {
     "netflix-api-parse": "Netflix test failed interpret elements of the decoded JSON",
     "netflix-connection": "Netflix test failed to connect to download URLs",
     "netflix-download": "Netflix test encountered an error downloading data",
+    "netflix-upload": "Netflix test failed to connect to upload URLs",
 }
 MIN_TIME_SECONDS = 3
 PING_COUNT = 4
 MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE = 6
 STABLE_MEASUREMENTS_DELTA = 2
 BITS_PER_BYTE = 8
+ENGINES = ["threads", "asyncio"]
+STABILITY_DETECTORS = ["delta", "ewma", "regression"]
+ADAPTIVE_INITIAL_CONNECTIONS = 1
+ADAPTIVE_INTERVAL_SECONDS = 1
+ADAPTIVE_MIN_GROWTH_PERCENT = 10
+FAST_URL = "https://fast.com"
+API_URL = "https://api.fast.com/netflix/speedtest/v2"
+UPLOAD_PAYLOAD_SIZE = 25 * 2**20
+# Hosts pooled besides the URLs, i.e. fast.com and its API
+POOL_EXTRA_HOSTS = 2
+
+
+class _NetflixError(Exception):
+    """Raised by a step of the measurement, to be returned as the error `key`."""
+
+    def __init__(self, key, traceback):
+        super(_NetflixError, self).__init__(key)
+        self.key = key
+        self.traceback = traceback
 
 
 class NetflixFastMeasurement(BaseMeasurement):
@@ -69,8 +130,41 @@ class NetflixFastMeasurement(BaseMeasurement):
         chunk_size=64 * 2**10,
         terminate_on_thread_complete=True,
         terminate_on_result_stable=False,
+        engine="threads",
+        stability_detector="delta",
+        token_cache_path=None,
+        token_cache_ttl_seconds=DEFAULT_TOKEN_CACHE_TTL_SECONDS,
+        adaptive_connections=False,
+        upload=False,
+        upload_payload_size=UPLOAD_PAYLOAD_SIZE,
+        fast_url=FAST_URL,
+        api_url=API_URL,
+        keep_alive=True,
+        autotune_chunk_size=True,
+        range_sizes=None,
     ):
         super(NetflixFastMeasurement, self).__init__(id=id)
+        if engine not in ENGINES:
+            raise ValueError(
+                "`{engine}` is not a valid engine. Valid engines are {engines}.".format(
+                    engine=engine, engines=", ".join(ENGINES)
+                )
+            )
+        if not isinstance(stability_detector, StabilityDetector):
+            if stability_detector not in STABILITY_DETECTORS:
+                raise ValueError(
+                    "`{detector}` is not a valid stability detector. Valid detectors are {detectors}.".format(
+                        detector=stability_detector,
+                        detectors=", ".join(STABILITY_DETECTORS),
+                    )
+                )
+            stability_detector = self._create_stability_detector(stability_detector)
+        if range_sizes is not None and (
+            not range_sizes or any(size < 1 for size in range_sizes)
+        ):
+            raise ValueError(
+                "`range_sizes` must be a non-empty sequence of positive sizes"
+            )
         self.id = id
         self.urlcount = urlcount
         self.max_time_seconds = max_time_seconds
@@ -78,19 +172,71 @@ class NetflixFastMeasurement(BaseMeasurement):
         self.chunk_size = chunk_size
         self.terminate_on_thread_complete = terminate_on_thread_complete
         self.terminate_on_result_stable = terminate_on_result_stable
+        self.engine = engine
+        self.stability_detector = stability_detector
+        self.adaptive_connections = adaptive_connections
+        self.connection_scaler = None
+        self.connection_count = 0
+        self.upload = upload
+        self.upload_payload_size = upload_payload_size
+        self.fast_url = fast_url
+        self.api_url = api_url
+        self.upload_thread_results = []
+        self.token_cache = (
+            TokenCache(token_cache_path, ttl_seconds=token_cache_ttl_seconds)
+            if token_cache_path is not None
+            else None
+        )
+        self.keep_alive = keep_alive
+        self.autotune_chunk_size = autotune_chunk_size
+        self.range_sizes = tuple(range_sizes) if range_sizes is not None else None
+        self.chunk_sizes = []
+        self.session = None
         self.finished_threads = 0
+        self.ended_threads = 0
         self.exit_threads = False
-        self.total = 0
-        self.sessions = []
         self.client_data = {"asn": None, "ip": None, "isp": None, "location": None}
         self.targets = []
         self.thread_results = []
         self.completed_total = 0
         self.completed_elapsed_time = None
+        self.connection_failed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the connections kept open between measurements."""
+        if self.session is not None:
+            self.session.close()
+            self.session = None
 
     def measure(self):
         results = []
+        self._reset_measurement_state()
+        results.append(self._get_fast_result())
+        # Probe the latency to every URL at once, keeping results in URL order
+        with ThreadPoolExecutor(
+            max_workers=max(len(self.thread_results), 1)
+        ) as executor:
+            for url_result in executor.map(self._get_url_result, self.thread_results):
+                results = results + url_result
+        if not self.keep_alive:
+            self.close()
+        return results
+
+    def _reset_measurement_state(self):
+        # Reset the state left by any previous measurement
+        self.client_data = {"asn": None, "ip": None, "isp": None, "location": None}
+        self.connection_scaler = None
+        self.connection_count = 0
+        self.upload_thread_results = []
+        self._reset_transfer_state()
         # Generate thread results dict structure
+        self.thread_results = []
         for i in range(self.urlcount):
             self.thread_results.append(
                 {
@@ -103,163 +249,560 @@ class NetflixFastMeasurement(BaseMeasurement):
                 }
             )
 
-        results.append(self._get_fast_result())
-        for thread_result in self.thread_results:
-            results = results + self._get_url_result(thread_result)
-        return results
+    def _get_session(self):
+        """
+        Returns the session shared by every request, creating it if needed
+        Its connection pools hold a connection per URL, so connections are reused by later measurements
+        """
+        if self.session is None:
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.urlcount + POOL_EXTRA_HOSTS,
+                pool_maxsize=self.urlcount,
+            )
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+            if not self.keep_alive:
+                self.session.headers["Connection"] = "close"
+        return self.session
+
+    def _reset_transfer_state(self):
+        self.exit_threads = False
+        self.finished_threads = 0
+        self.ended_threads = 0
+        self.completed_total = 0
+        self.completed_elapsed_time = None
+        self.connection_failed = False
 
     def _get_fast_result(self):
-        s = requests.Session()
+        s = self._get_session()
+        try:
+            self._get_token(s)
+            fast_data = self._run_transfers()
+        except _NetflixError as e:
+            return self._get_netflix_error(e.key, traceback=e.traceback)
+
+        if self.adaptive_connections:
+            # Only report on the URLs which were downloaded from
+            del self.thread_results[self.connection_count :]
+
+        errors = []
+        upload_data = None
+        if self.upload:
+            try:
+                upload_data = self._get_upload_data()
+            except ConnectionError as e:
+                errors.append(
+                    Error(
+                        key="netflix-upload",
+                        description=NETFLIX_ERRORS.get("netflix-upload", ""),
+                        traceback=str(e),
+                    )
+                )
+
+        return NetflixFastMeasurementResult(
+            id=self.id,
+            download_rate=float(fast_data["speed_bits"]),
+            download_rate_unit=NetworkUnit("bit/s"),
+            download_size=float(fast_data["total"]),
+            download_size_unit=StorageUnit("B"),
+            asn=self.client_data["asn"],
+            ip=self.client_data["ip"],
+            isp=self.client_data["isp"],
+            city=self.client_data["location"]["city"],
+            country=self.client_data["location"]["country"],
+            urlcount=self.urlcount,
+            reason_terminated=fast_data["reason_terminated"],
+            errors=errors,
+            connection_count=(
+                self.connection_count if self.adaptive_connections else None
+            ),
+            sample_times=fast_data.get("sample_times"),
+            download_rates=fast_data.get("rates_bits"),
+            **self._get_upload_fields(upload_data),
+        )
+
+    def _get_token(self, s):
+        """
+        Returns the fast.com API token, from the token cache if it is still accepted, and queries the API with it
+        Raises a _NetflixError if the token cannot be found or the API cannot be queried
+        """
+        cached = self.token_cache.load() if self.token_cache is not None else None
+        if cached is not None:
+            try:
+                self._query_api(s, cached)
+                return cached
+            except (
+                ConnectionError,
+                requests.exceptions.RequestException,
+                json.decoder.JSONDecodeError,
+                TypeError,
+                KeyError,
+            ):
+                # The API rejected the cached token, or could not be reached with
+                # it, so find the current one
+                self.token_cache.invalidate()
+
+        token = self._find_token(s)
+        try:
+            self._query_api(s, token)
+        except ConnectionError as e:
+            raise _NetflixError("netflix-api-response", str(e))
+        except json.decoder.JSONDecodeError as e:
+            raise _NetflixError("netflix-api-json", str(e))
+        except (TypeError, KeyError) as e:
+            raise _NetflixError("netflix-api-parse", str(e))
+
+        if self.token_cache is not None:
+            self.token_cache.store(token)
+        return token
+
+    def _find_token(self, s):
+        """
+        Returns the API token, scraped from the script of the fast.com page
+        Raises a _NetflixError if the script or the token cannot be found
+        """
         try:
             resp = self._get_response(s)
         except ConnectionError as e:
-            return self._get_netflix_error("netflix-response", traceback=str(e))
+            raise _NetflixError("netflix-response", str(e))
 
         try:
             script = re.search(r'<script src="(.*?)">', resp.text).group(1)
         except AttributeError:
-            return self._get_netflix_error("netflix-script-regex", traceback=resp.text)
+            raise _NetflixError("netflix-script-regex", resp.text)
 
         try:
-            script_resp = s.get("https://fast.com{script}".format(script=script))
+            script_resp = s.get(
+                "{fast_url}{script}".format(fast_url=self.fast_url, script=script)
+            )
         except ConnectionError as e:
-            return self._get_netflix_error("netflix-script-response", traceback=str(e))
+            raise _NetflixError("netflix-script-response", str(e))
 
         try:
             token = re.search(r'token:"(.*?)"', script_resp.text).group(1)
         except AttributeError:
-            return self._get_netflix_error(
-                "netflix-token-regex", traceback=script_resp.text
-            )
+            raise _NetflixError("netflix-token-regex", script_resp.text)
+        return token
+
+    def _run_transfers(self):
+        """
+        Downloads from the targets with the chosen engine, returning the data of the download
+        Raises a _NetflixError if connecting or downloading fails
+        """
+        if self.engine == "asyncio":
+            try:
+                return self._manage_async_downloads()
+            except ConnectionError as e:
+                raise _NetflixError("netflix-connection", str(e))
 
         try:
-            self._query_api(s, token)
+            conns = [
+                self._get_connection(target["url"])
+                for target in self._get_initial_targets()
+            ]
         except ConnectionError as e:
-            return self._get_netflix_error("netflix-api-response", traceback=str(e))
-        except json.decoder.JSONDecodeError as e:
-            return self._get_netflix_error("netflix-api-json", traceback=str(e))
-        except TypeError as e:
-            return self._get_netflix_error("netflix-api-parse", traceback=str(e))
-        except KeyError as e:
-            return self._get_netflix_error("netflix-api-parse", traceback=str(e))
+            raise _NetflixError("netflix-connection", str(e))
 
         try:
-            conns = [
-                self._get_connection(target["url"]) for target in self.thread_results
-            ]
+            return self._manage_threads(conns)
         except ConnectionError as e:
-            return self._get_netflix_error("netflix-connection", traceback=str(e))
+            raise _NetflixError("netflix-download", str(e))
+
+    def _get_upload_fields(self, upload_data):
+        """
+        Returns the upload fields of a NetflixFastMeasurementResult, which are empty without `upload_data`
+        """
+        if upload_data is None:
+            return {}
+        return {
+            "upload_rate": float(upload_data["speed_bits"]),
+            "upload_rate_unit": NetworkUnit("bit/s"),
+            "upload_size": float(upload_data["total"]),
+            "upload_size_unit": StorageUnit("B"),
+        }
+
+    def _get_upload_data(self):
+        # Start again from the state the download began with
+        self._reset_transfer_state()
+        self.upload_thread_results = [
+            {
+                "index": thread_result["index"],
+                "elapsed_time": None,
+                "upload_size": 0,
+                "upload_rate": 0,
+            }
+            for thread_result in self.thread_results
+        ]
+        if self.engine == "asyncio":
+            return self._manage_async_downloads(upload=True)
+        return self._manage_threads(
+            [target["url"] for target in self._get_initial_targets()], upload=True
+        )
 
-        fast_data = self._manage_threads(conns)
+    def _manage_threads(self, conns, upload=False):
+        """
+        Transfers over each of `conns` in its own thread until the test is complete
+        For uploads, `conns` are the URLs to upload to
+        """
+        self.connection_scaler = self._create_connection_scaler(len(conns))
+        counters = TransferCounters(
+            self.connection_scaler.maximum if self.connection_scaler else len(conns)
+        )
+        timeline = TransferTimeline(len(counters.end_times))
+        self.chunk_sizes = [None] * len(counters.end_times)
+        counters.start()
+        # Create worker threads
+        threads = [
+            self._start_transfer_thread(conn, counters, index, upload)
+            for index, conn in enumerate(conns)
+        ]
+        self.connection_count = len(threads)
 
-        return NetflixFastMeasurementResult(
-            id=self.id,
-            download_rate=float(fast_data["speed_bits"]),
-            download_rate_unit=NetworkUnit("bit/s"),
-            download_size=float(fast_data["total"]),
-            download_size_unit=StorageUnit("B"),
-            asn=self.client_data["asn"],
-            ip=self.client_data["ip"],
-            isp=self.client_data["isp"],
-            city=self.client_data["location"]["city"],
-            country=self.client_data["location"]["country"],
-            urlcount=self.urlcount,
-            reason_terminated=fast_data["reason_terminated"],
-            errors=[],
+        self.stability_detector.reset()
+        while True:
+            time.sleep(self.sleep_seconds)
+            snapshot = counters.snapshot()
+            timeline.record(snapshot)
+            self.stability_detector.update(snapshot.elapsed_time, snapshot.total)
+            self.finished_threads = snapshot.completed_count
+            self.ended_threads = snapshot.ended_count
+
+            if self.connection_scaler is not None:
+                self._scale_threads(snapshot, counters, threads, upload)
+
+            reason_terminated = self._is_test_complete(snapshot.elapsed_time)
+            if reason_terminated == "all_failed":
+                raise ConnectionError("Every connection failed")
+            if reason_terminated:
+                self.exit_threads = True
+                for thread in threads:
+                    thread.join()
+                return self._get_fast_data(
+                    counters, timeline, snapshot, reason_terminated, upload
+                )
+
+    def _scale_threads(self, snapshot, counters, threads, upload):
+        """
+        Starts a thread for each connection the connection scaler adds
+        Each new download thread opens its own connection, so sampling is not held up while it connects
+        """
+        if self.connection_failed:
+            # Opening the last connection added failed, so add no more
+            self.connection_scaler.settle(len(threads))
+        connection_count = self.connection_scaler.update(
+            snapshot.elapsed_time, snapshot.total
+        )
+        for index in range(len(threads), connection_count):
+            conn = self.thread_results[index]["url"] if upload else None
+            threads.append(self._start_transfer_thread(conn, counters, index, upload))
+        self.connection_count = len(threads)
+
+    def _start_transfer_thread(self, conn, counters, index, upload):
+        thread = Thread(
+            target=self._threaded_upload if upload else self._threaded_download,
+            args=(conn, counters, index),
+            daemon=True,
         )
+        thread.start()
+        return thread
+
+    def _threaded_download(self, conn, counters, index):
+        """
+        Downloads over `conn`, or over a new connection if `conn` is None, until the test is complete
+        """
+        completed = False
+        if conn is None:
+            try:
+                conn = self._get_connection(self.thread_results[index]["url"])
+            except (ConnectionError, requests.exceptions.RequestException):
+                self.connection_failed = True
+                counters.end(index, completed)
+                return
+        try:
+            # Count the URL content as it is read into a buffer reused for every chunk
+            tuner = self._create_chunk_size_tuner()
+            buffer = bytearray(tuner.maximum if tuner else self.chunk_size)
+            for step in range(self._get_range_count()):
+                if step:
+                    # The previous range was read in full, so its connection is reused
+                    conn = self._get_connection(self.thread_results[index]["url"], step)
+                if not self._count_download(conn, buffer, tuner, counters, index):
+                    break
+            else:
+                completed = True
+            if tuner is not None:
+                self.chunk_sizes[index] = tuner.chunk_size
+        except (ConnectionError, requests.exceptions.RequestException):
+            # A failed download stops contributing but is not considered complete
+            pass
+        finally:
+            # A download stopped early closes its connection rather than returning it to the pool
+            conn.close()
+            counters.end(index, completed)
+
+    def _count_download(self, conn, buffer, tuner, counters, index):
+        """
+        Counts the content of `conn` as it is read
+        Returns whether it was read in full, rather than stopped by the end of the test
+        """
+        for count in iter_discard(conn, buffer, tuner):
+            if self.exit_threads:
+                return False
+            counters.add(index, count)
+        return True
 
-    def _manage_threads(self, conns):
-        # Create worker threads
-        threads = [None] * len(self.thread_results)
-        for i in range(len(self.thread_results)):
-            threads[i] = Thread(
-                target=self._threaded_download,
-                args=(conns[i], self.thread_results[i], time.time()),
+    def _threaded_upload(self, url, counters, index):
+        completed = False
+        try:
+            payload = GeneratedPayload(
+                self.upload_payload_size,
+                self.chunk_size,
+                on_read=functools.partial(counters.add, index),
+                should_stop=lambda: self.exit_threads,
             )
-            threads[i].daemon = True
-            threads[i].start()
-
-        # Record approximate time
-        start_time = time.time()
-        recent_measurements = deque(
-            maxlen=MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE
+            response = self._get_session().post(url, data=payload)
+            response.close()
+            completed = response.status_code < 400
+        except (ConnectionError, requests.exceptions.RequestException):
+            # A failed or stopped upload stops contributing but is not considered complete
+            pass
+        finally:
+            counters.end(index, completed)
+
+    def _manage_async_downloads(self, upload=False):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self._async_manage_downloads(upload))
+        finally:
+            loop.close()
+
+    async def _async_manage_downloads(self, upload=False):
+        loop = asyncio.get_running_loop()
+        # Connect and receive headers from every URL before timing starts
+        conns = await asyncio.gather(
+            *[
+                self._async_get_transfer_connection(r["url"], upload)
+                for r in self._get_initial_targets()
+            ],
+            return_exceptions=True,
         )
-        recent_percent_deltas = deque(
-            maxlen=MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE
+        errors = [conn for conn in conns if isinstance(conn, BaseException)]
+        if errors:
+            for conn in conns:
+                if not isinstance(conn, BaseException):
+                    conn.close()
+            raise errors[0]
+
+        self.connection_scaler = self._create_connection_scaler(len(conns))
+        counters = TransferCounters(
+            self.connection_scaler.maximum if self.connection_scaler else len(conns),
+            clock=loop.time,
         )
+        timeline = TransferTimeline(len(counters.end_times))
+        # Each connection reads into a buffer of a fixed size
+        self.chunk_sizes = [None] * len(counters.end_times)
+        counters.start()
+        download_complete = asyncio.Event()
+        tasks = [
+            loop.create_task(
+                self._async_transfer(conn, counters, index, download_complete, upload)
+            )
+            for index, conn in enumerate(conns)
+        ]
+        self.connection_count = len(tasks)
+
+        self.stability_detector.reset()
+        sample_count = 1
+        next_sample_time = counters.start_time + self.sleep_seconds
         while True:
-            elapsed_time = time.time() - start_time
-            total = 0
-            for thread_result in self.thread_results:
-                total += thread_result["download_size"]
-            speed_bits = total / elapsed_time * BITS_PER_BYTE
-            recent_measurements.append(speed_bits)
-
-            if (
-                len(recent_measurements)
-                == MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE
-            ):
-                # Calculate percentage difference to the average of the last ten measurements
-                # Note that there is no outlier detection here, all measurements are treated as-is.
-                recent_percent_deltas.append(
-                    (speed_bits - mean(recent_measurements)) / speed_bits * 100
+            snapshot = counters.snapshot()
+            if loop.time() >= next_sample_time:
+                # Samples are aligned to the start time so they do not drift
+                timeline.record(snapshot)
+                self.stability_detector.update(snapshot.elapsed_time, snapshot.total)
+                if self.connection_scaler is not None:
+                    await self._async_scale_connections(
+                        snapshot, counters, tasks, download_complete, upload
+                    )
+                sample_count += 1
+                next_sample_time = (
+                    counters.start_time + sample_count * self.sleep_seconds
+                )
+            self.finished_threads = snapshot.completed_count
+            self.ended_threads = snapshot.ended_count
+
+            reason_terminated = self._is_test_complete(snapshot.elapsed_time)
+            if reason_terminated == "all_failed":
+                raise ConnectionError("Every connection failed")
+            if reason_terminated:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                return self._get_fast_data(
+                    counters, timeline, snapshot, reason_terminated, upload
                 )
 
-            if self._is_test_complete(elapsed_time, recent_percent_deltas):
-                reason_terminated = self._is_test_complete(
-                    elapsed_time, recent_percent_deltas
+            # Wait for the next sample, or for a download to complete
+            try:
+                await asyncio.wait_for(
+                    download_complete.wait(),
+                    timeout=max(next_sample_time - loop.time(), 0),
                 )
-                self.exit_threads = True
-                for thread in threads:
-                    thread.join()
+            except asyncio.TimeoutError:
+                pass
+            download_complete.clear()
 
-                if (self.completed_elapsed_time is not None) & (
-                    reason_terminated == "thread_complete"
-                ):
-                    # Record the speed at the time the thread finished downloading
-                    speed_bits = (
-                        self.completed_total
-                        / self.completed_elapsed_time
-                        * BITS_PER_BYTE
+    async def _async_scale_connections(
+        self, snapshot, counters, tasks, download_complete, upload
+    ):
+        loop = asyncio.get_running_loop()
+        connection_count = self.connection_scaler.update(
+            snapshot.elapsed_time, snapshot.total
+        )
+        for index in range(len(tasks), connection_count):
+            try:
+                conn = await self._async_get_transfer_connection(
+                    self.thread_results[index]["url"], upload
+                )
+            except ConnectionError:
+                self.connection_scaler.settle(len(tasks))
+                break
+            tasks.append(
+                loop.create_task(
+                    self._async_transfer(
+                        conn, counters, index, download_complete, upload
                     )
-                else:
-                    elapsed_time = time.time() - start_time
-                    speed_bits = total / elapsed_time * BITS_PER_BYTE
-
-                return {
-                    "speed_bits": speed_bits,
-                    "total": total,
-                    "reason_terminated": reason_terminated,
-                }
-            time.sleep(self.sleep_seconds)
+                )
+            )
+        self.connection_count = len(tasks)
 
-    def _threaded_download(self, conn, thread_result, start_time):
-        # Iterate through the URL content
-        g = conn.iter_content(chunk_size=self.chunk_size)
-        for chunk in g:
-            if self.exit_threads:
-                break
-            thread_result["download_size"] += len(chunk)
+    def _async_get_transfer_connection(self, url, upload):
+        if upload:
+            return open_connection(url, self.chunk_size)
+        return self._async_get_connection(url)
 
-        completed_time = time.time()
-        elapsed_time = completed_time - start_time
+    def _async_transfer(self, conn, counters, index, transfer_complete, upload):
+        if upload:
+            return self._async_upload(conn, counters, index, transfer_complete)
+        return self._async_download(conn, counters, index, transfer_complete)
 
-        # If this is the first thread to complete, record the time and total at this point
-        if self.completed_elapsed_time is None:
-            self.completed_elapsed_time = elapsed_time
-            for global_thread_result in self.thread_results:
-                self.completed_total += global_thread_result["download_size"]
+    async def _async_get_connection(self, url):
+        conn = await open_connection(url, self.chunk_size)
+        try:
+            await self._async_request_range(conn, url, 0)
+        except ConnectionError:
+            conn.close()
+            raise
+        return conn
 
-        thread_result["download_rate"] = (
-            thread_result["download_size"] / elapsed_time * BITS_PER_BYTE
-        )
-        thread_result["elapsed_time"] = elapsed_time
-        self.finished_threads += 1
+    async def _async_request_range(self, conn, url, step):
+        range_url = self._get_range_url(url, step)
+        status = await conn.request(get_request_target(range_url))
+        if status >= 400:
+            raise ConnectionError(
+                "{url} responded with status {status}".format(
+                    url=range_url, status=status
+                )
+            )
+
+    async def _async_download(self, conn, counters, index, download_complete):
+        completed = False
+        try:
+            for step in range(self._get_range_count()):
+                if step:
+                    await self._async_request_range(
+                        conn, self.thread_results[index]["url"], step
+                    )
+                await conn.receive(functools.partial(counters.add, index))
+            completed = True
+        except ConnectionError:
+            # A failed download stops contributing but is not considered complete
+            pass
+        finally:
+            conn.close()
+            counters.end(index, completed)
+        download_complete.set()
+
+    async def _async_upload(self, conn, counters, index, upload_complete):
+        completed = False
+        try:
+            status = await conn.upload(
+                get_request_target(self.thread_results[index]["url"]),
+                self.upload_payload_size,
+                functools.partial(counters.add, index),
+            )
+            completed = status < 400
+        except ConnectionError:
+            # A failed upload stops contributing but is not considered complete
+            pass
+        finally:
+            conn.close()
+            counters.end(index, completed)
+        upload_complete.set()
+
+    def _get_fast_data(
+        self, counters, timeline, snapshot, reason_terminated, upload=False
+    ):
+        """
+        Records the results and rate timeline of each connection once all have stopped
+        Returns the overall speed and total, as of the snapshot the test terminated on,
+        and the overall rate timeline
+        """
+        final_snapshot = counters.snapshot()
+        direction = "upload" if upload else "download"
+        thread_results = self.upload_thread_results if upload else self.thread_results
+        for index, thread_result in enumerate(thread_results):
+            elapsed_time = counters.end_times[index]
+            thread_result[direction + "_size"] = final_snapshot.sizes[index]
+            thread_result["elapsed_time"] = elapsed_time
+            thread_result[direction + "_rate"] = (
+                final_snapshot.sizes[index] / elapsed_time * BITS_PER_BYTE
+                if elapsed_time
+                else 0
+            )
+            thread_result["sample_times"] = timeline.times
+            thread_result[direction + "_rates"] = self._get_rates_bits(
+                timeline.get_rates(index)
+            )
+            if not upload:
+                thread_result["chunk_size"] = (
+                    self.chunk_sizes[index]
+                    if self.chunk_sizes[index] is not None
+                    else self.chunk_size
+                )
+        self.finished_threads = final_snapshot.completed_count
+
+        if counters.first_completed is not None:
+            # The time and total were captured together when the first download completed
+            self.completed_elapsed_time = counters.first_completed.elapsed_time
+            self.completed_total = counters.first_completed.total
+
+        if (self.completed_elapsed_time is not None) & (
+            reason_terminated == "thread_complete"
+        ):
+            # Record the speed at the time the thread finished downloading
+            speed_bits = (
+                self.completed_total / self.completed_elapsed_time * BITS_PER_BYTE
+            )
+        else:
+            speed_bits = snapshot.total / snapshot.elapsed_time * BITS_PER_BYTE
+
+        return {
+            "speed_bits": speed_bits,
+            "total": snapshot.total,
+            "reason_terminated": reason_terminated,
+            "sample_times": timeline.times,
+            "rates_bits": self._get_rates_bits(timeline.get_rates()),
+        }
+
+    def _get_rates_bits(self, rates):
+        return array.array("d", (rate * BITS_PER_BYTE for rate in rates))
 
     def _query_api(self, s, token):
         params = {"https": "true", "token": token, "urlCount": self.urlcount}
         # '/v2/' path returns all location data about the servers
-        api_resp = s.get("https://api.fast.com/netflix/speedtest/v2", params=params)
+        api_resp = s.get(self.api_url, params=params)
         api_json = api_resp.json()
         for i in range(len(api_json["targets"])):
             self.thread_results[i]["url"] = api_json["targets"][i]["url"]
@@ -267,32 +810,85 @@ class NetflixFastMeasurement(BaseMeasurement):
         self.client_data = api_json["client"]
         return
 
-    def _is_stabilised(self, recent_percent_deltas, elapsed_time):
-        return (
-            elapsed_time > MIN_TIME_SECONDS
-            and len(recent_percent_deltas)
-            >= MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE
-            and max(recent_percent_deltas) < STABLE_MEASUREMENTS_DELTA
+    def _create_chunk_size_tuner(self):
+        if not self.autotune_chunk_size:
+            return None
+        return ChunkSizeTuner(
+            self.chunk_size,
+            minimum=min(MIN_CHUNK_SIZE, self.chunk_size),
+            maximum=max(MAX_CHUNK_SIZE, self.chunk_size),
         )
 
-    def _get_response(self, s):
-        return s.get("http://fast.com/")
+    def _create_stability_detector(self, name):
+        if name == "ewma":
+            return EWMAStabilityDetector(min_time_seconds=MIN_TIME_SECONDS)
+        if name == "regression":
+            return RegressionStabilityDetector(min_time_seconds=MIN_TIME_SECONDS)
+        return DeltaStabilityDetector(
+            min_time_seconds=MIN_TIME_SECONDS,
+            count=MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE,
+            max_delta_percent=STABLE_MEASUREMENTS_DELTA,
+        )
 
-    def _get_connection(self, url):
-        s = requests.Session()
-        self.sessions.append(s)
-        conn = s.get(url, stream=True)
+    def _get_initial_targets(self):
+        if self.adaptive_connections:
+            return self.thread_results[:ADAPTIVE_INITIAL_CONNECTIONS]
+        return self.thread_results
+
+    def _create_connection_scaler(self, initial):
+        if not self.adaptive_connections or not initial:
+            return None
+        return ConnectionScaler(
+            initial=initial,
+            maximum=max(len(self.thread_results), initial),
+            interval_seconds=ADAPTIVE_INTERVAL_SECONDS,
+            min_growth_percent=ADAPTIVE_MIN_GROWTH_PERCENT,
+        )
+
+    def _is_stabilised(self):
+        # While connections are still being added the rate is expected to rise
+        if self.connection_scaler is not None and not self.connection_scaler.settled:
+            return False
+        return self.stability_detector.is_stable()
+
+    def _get_response(self, s):
+        return s.get(self.fast_url + "/")
+
+    def _get_connection(self, url, step=0):
+        conn = self._get_session().get(self._get_range_url(url, step), stream=True)
+        if conn.status_code >= 400:
+            conn.close()
+            raise ConnectionError(
+                "{url} responded with status {status}".format(
+                    url=conn.url, status=conn.status_code
+                )
+            )
         return conn
 
-    def _is_test_complete(self, elapsed_time, recent_percent_deltas):
+    def _get_range_count(self):
+        return len(self.range_sizes) if self.range_sizes is not None else 1
+
+    def _get_range_url(self, url, step):
+        """
+        Returns the URL of the `step`th range requested from `url`, or `url` if ranges are not used
+        Targets serve the first N + 1 bytes of their object from `/range/0-N` appended to their path
+        """
+        if self.range_sizes is None:
+            return url
+        parts = urllib.parse.urlsplit(url)
+        path = "{path}/range/0-{end}".format(
+            path=parts.path.rstrip("/"), end=self.range_sizes[step] - 1
+        )
+        return urllib.parse.urlunsplit(parts._replace(path=path))
+
+    def _is_test_complete(self, elapsed_time):
         if elapsed_time > self.max_time_seconds:
             return "time_expired"
-        if (self.terminate_on_result_stable) & (
-            self._is_stabilised(recent_percent_deltas, elapsed_time)
-        ):
+        if (self.terminate_on_result_stable) & (self._is_stabilised()):
             return "result_stabilised"
-        if self.finished_threads == len(self.thread_results):
-            return "all_complete"
+        if self.ended_threads == self.connection_count:
+            # Connections which failed have stopped contributing, as complete ones have
+            return "all_complete" if self.finished_threads else "all_failed"
         if (self.terminate_on_thread_complete) & (self.finished_threads >= 1):
             return "thread_complete"
         return False
@@ -315,6 +911,9 @@ class NetflixFastMeasurement(BaseMeasurement):
                 elapsed_time=thread_result["elapsed_time"],
                 elapsed_time_unit=TimeUnit("s"),
                 errors=[],
+                sample_times=thread_result.get("sample_times"),
+                download_rates=thread_result.get("download_rates"),
+                chunk_size=thread_result.get("chunk_size"),
             ),
             LatencyResult,
         ]
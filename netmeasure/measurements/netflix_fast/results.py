@@ -1,3 +1,4 @@
+import array
 import typing
 from dataclasses import dataclass
 
@@ -20,6 +21,13 @@ class NetflixFastMeasurementResult(MeasurementResult):
     country: typing.Optional[str]
     urlcount: typing.Optional[int]
     reason_terminated: typing.Optional[str]
+    connection_count: typing.Optional[int] = None
+    upload_rate: typing.Optional[float] = None
+    upload_rate_unit: typing.Optional[NetworkUnit] = None
+    upload_size: typing.Optional[float] = None
+    upload_size_unit: typing.Optional[StorageUnit] = None
+    sample_times: typing.Optional[array.array] = None
+    download_rates: typing.Optional[array.array] = None
 
 
 @dataclass(frozen=True)
@@ -35,3 +43,6 @@ class NetflixFastThreadResult(MeasurementResult):
     elapsed_time_unit: typing.Optional[TimeUnit]
     city: typing.Optional[str]
     country: typing.Optional[str]
+    sample_times: typing.Optional[array.array] = None
+    download_rates: typing.Optional[array.array] = None
+    chunk_size: typing.Optional[int] = None
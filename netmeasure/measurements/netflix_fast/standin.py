@@ -0,0 +1,249 @@
+"""A local stand-in for fast.com, its API and its download targets.
+
+`FastStandInServer` serves the fast.com page, the script the API token is
+found in, the `/netflix/speedtest/v2` API and the targets it lists, so
+that `NetflixFastMeasurement` can run end to end without network access.
+Targets can be throttled to emulate a link of a given rate.
+
+The stand-in can also be run on its own, printing the fast.com and API
+URLs to measure against:
+
+    python -m netmeasure.measurements.netflix_fast.standin --rate 1000000
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import click
+
+TOKEN = "stand-in-token"
+DEFAULT_TARGET_SIZE = 200000
+WRITE_SIZE = 16 * 2**10
+
+
+class Throttle:
+    """Paces transfers which share a link of a fixed rate.
+
+    Each transfer calls `wait` before sending or after receiving each
+    part of its data. Parts are given consecutive slots on the link, so
+    transfers sharing it are slowed to `rate` bytes per second between
+    them.
+
+    :param rate: The rate of the link in bytes per second.
+    :param clock: A monotonic clock returning seconds.
+    :param sleep: A callable which sleeps for a number of seconds.
+    """
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("`rate` must be positive")
+        self.rate = rate
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next_time = None
+
+    def wait(self, nbytes):
+        """Wait until the link has had time to carry `nbytes`."""
+        now = self._clock()
+        with self._lock:
+            start = now if self._next_time is None else max(self._next_time, now)
+            self._next_time = start + nbytes / self.rate
+            end = self._next_time
+        if end > now:
+            self._sleep(end - now)
+
+
+class FastStandInRequestHandler(BaseHTTPRequestHandler):
+    """Handles requests to a `FastStandInServer`.
+
+    Each target responds to GETs with the server's `target_size` bytes,
+    or the first N + 1 bytes when `/range/0-N` is appended to its path,
+    and to POSTs by reading the body, unless the server's
+    `accept_uploads` is false.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == "/":
+            self._send_body(b'<html><script src="/app.js"></script></html>')
+        elif parts.path == "/app.js":
+            self._send_body('var a={{token:"{token}"}}'.format(token=TOKEN).encode())
+        elif parts.path == "/netflix/speedtest/v2":
+            query = parse_qs(parts.query)
+            if query.get("token") != [TOKEN]:
+                self._send_body(b'{"errors": ["invalid token"]}', status=403)
+                return
+            api_response = {
+                "client": {
+                    "location": {"city": "Stand-in City", "country": "Stand-in"},
+                    "isp": "Loopback",
+                    "asn": "0",
+                    "ip": "127.0.0.1",
+                },
+                "targets": [
+                    {
+                        "location": {"city": "Target City", "country": "Target"},
+                        "url": "{base_url}/speedtest/{i}".format(
+                            base_url=self.server.base_url, i=i
+                        ),
+                    }
+                    for i in range(int(query["urlCount"][0]))
+                ],
+            }
+            self._send_body(json.dumps(api_response).encode())
+        else:
+            match = re.search(r"/range/0-(\d+)$", parts.path)
+            self._send_target(
+                int(match.group(1)) + 1 if match else self.server.target_size
+            )
+
+    def do_POST(self):
+        if not self.server.accept_uploads:
+            self.send_error(403)
+            self.close_connection = True
+            return
+        remaining = int(self.headers["Content-Length"])
+        try:
+            while remaining:
+                count = len(self.rfile.read(min(remaining, WRITE_SIZE)))
+                if not count:
+                    self.close_connection = True
+                    return
+                if self.server.throttle is not None:
+                    self.server.throttle.wait(count)
+                remaining -= count
+        except ConnectionError:
+            self.close_connection = True
+            return
+        self._send_body(b"")
+
+    def _send_body(self, body, status=200):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_target(self, size):
+        self.send_response(200)
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        chunk = memoryview(bytes(WRITE_SIZE))
+        remaining = size
+        try:
+            while remaining:
+                count = min(remaining, len(chunk))
+                if self.server.throttle is not None:
+                    self.server.throttle.wait(count)
+                self.wfile.write(chunk[:count])
+                remaining -= count
+        except ConnectionError:
+            # The measurement stopped downloading and closed the connection
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FastStandInServer(ThreadingHTTPServer):
+    """A local HTTP server standing in for fast.com, its API and targets.
+
+    Measure against it by passing its `fast_url` and `api_url` to
+    `NetflixFastMeasurement`.
+
+    :param address: The host and port to listen on. Port 0 picks a free
+    port.
+    :param target_size: The number of bytes each target sends.
+    :param rate: The rate, in bytes per second, of the link emulated
+    between the measurement and all targets, or `None` to not throttle.
+    :param accept_uploads: Whether targets accept uploads.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        target_size=DEFAULT_TARGET_SIZE,
+        rate=None,
+        accept_uploads=True,
+    ):
+        super(FastStandInServer, self).__init__(address, FastStandInRequestHandler)
+        self.target_size = target_size
+        self.throttle = Throttle(rate) if rate is not None else None
+        self.accept_uploads = accept_uploads
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return "http://{host}:{port}".format(host=host, port=port)
+
+    @property
+    def fast_url(self):
+        return self.base_url
+
+    @property
+    def api_url(self):
+        return self.base_url + "/netflix/speedtest/v2"
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving requests and close the listening socket."""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Address to listen on")
+@click.option("--port", default=0, type=int, help="Port to listen on, 0 for any")
+@click.option(
+    "--rate",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Rate of the emulated link in bytes per second, unthrottled if omitted",
+)
+@click.option(
+    "--target-size",
+    default=DEFAULT_TARGET_SIZE,
+    type=click.IntRange(min=1),
+    help="Number of bytes each target sends",
+)
+def main(host, port, rate, target_size):
+    """
+    Serve a local stand-in for fast.com until interrupted.
+
+    The fast.com and API URLs are printed on the first two lines.
+    """
+    server = FastStandInServer((host, port), target_size=target_size, rate=rate)
+    click.echo(server.fast_url)
+    click.echo(server.api_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
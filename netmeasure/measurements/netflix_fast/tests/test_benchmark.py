@@ -0,0 +1,18 @@
+from unittest import TestCase
+
+from netmeasure.measurements.netflix_fast.benchmark import run_benchmark
+from netmeasure.measurements.netflix_fast.measurements import ENGINES
+
+
+class BenchmarkTestCase(TestCase):
+    def test_run_benchmark(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                result = run_benchmark(4e6, engine=engine, max_time_seconds=1)
+                self.assertEqual(result.engine, engine)
+                self.assertEqual(result.reason_terminated, "time_expired")
+                # Accuracy and latency depend on the load on the machine, so only their presence is checked
+                self.assertGreater(result.measured_rate, 0)
+                self.assertGreater(result.cpu_time, 0)
+                self.assertGreaterEqual(result.elapsed_time, 1)
+                self.assertGreaterEqual(result.termination_latency, 0)
@@ -1,24 +1,40 @@
+import os
 import subprocess
 import sys
 import json
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import TestCase, mock
-from threading import active_count
+from threading import active_count, Barrier, current_thread, Thread
 from itertools import cycle
 
+import requests
+
 from netmeasure.measurements.netflix_fast.measurements import (
+    ENGINES,
     NetflixFastMeasurement,
     NETFLIX_ERRORS,
     MIN_TIME_SECONDS,
     PING_COUNT,
     MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE,
     STABLE_MEASUREMENTS_DELTA,
+    STABILITY_DETECTORS,
 )
+from netmeasure.measurements.netflix_fast.cache import TokenCache
+from netmeasure.measurements.netflix_fast.standin import FastStandInServer
 from netmeasure.measurements.netflix_fast.results import (
     NetflixFastMeasurementResult,
     NetflixFastThreadResult,
 )
 from netmeasure.measurements.latency.results import LatencyMeasurementResult
 from netmeasure.measurements.base.results import Error
+from netmeasure.measurements.base.stability import (
+    DeltaStabilityDetector,
+    EWMAStabilityDetector,
+    RegressionStabilityDetector,
+)
+from netmeasure.measurements.base.streaming import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE
 from netmeasure.units import RatioUnit, TimeUnit, StorageUnit, NetworkUnit
 
 
@@ -194,7 +210,10 @@ class NetflixResultTestCase(TestCase):
         "netmeasure.measurements.netflix_fast.measurements.NetflixFastMeasurement._get_url_result"
     )
     def test_measure(self, mock_get_url_result, mock_get_fast_result):
-        mock_get_url_result.side_effect = self.thread_result_three_list
+        # Latency is probed concurrently, so results are matched by index rather than call order
+        mock_get_url_result.side_effect = (
+            lambda thread_result: self.thread_result_three_list[thread_result["index"]]
+        )
         mock_get_fast_result.return_value = self.fast_result_three
         assert self.nft.measure() == (
             [self.fast_result_three]
@@ -338,6 +357,42 @@ class NetflixResultTestCase(TestCase):
             == self.thread_result_three_list[0]
         )
 
+    @mock.patch(
+        "netmeasure.measurements.netflix_fast.measurements.NetflixFastMeasurement._get_fast_result"
+    )
+    @mock.patch("netmeasure.measurements.netflix_fast.measurements.LatencyMeasurement")
+    def test_latency_probes_concurrent(
+        self, mock_latency_measurement, mock_get_fast_result
+    ):
+        def get_fast_result():
+            for thread_result, target in zip(
+                self.nft.thread_results, self.api_response_three["targets"]
+            ):
+                thread_result["url"] = target["url"]
+                thread_result["location"] = target["location"]
+            return self.fast_result_three
+
+        # Each probe waits for the others, so probes run one at a time would time out
+        barrier = Barrier(3, timeout=5)
+
+        def create_latency_measurement(id, host, count):
+            def measure():
+                barrier.wait()
+                return [host]
+
+            return mock.Mock(measure=measure)
+
+        mock_get_fast_result.side_effect = get_fast_result
+        mock_latency_measurement.side_effect = create_latency_measurement
+        results = self.nft.measure()
+        assert results[0] == self.fast_result_three
+        assert [r.host for r in results[1::2]] == results[2::2]
+        assert results[2::2] == [
+            "afakeurl.1.notreal.net",
+            "afakeurl.2.notreal.net",
+            "afakeurl.3.notreal.net",
+        ]
+
 
 class HelperFunctionTestCase(TestCase):
     def setUp(self) -> None:
@@ -346,45 +401,133 @@ class HelperFunctionTestCase(TestCase):
 
     @mock.patch("requests.Session")
     def test_get_connection(self, mock_get_session):
+        responses = [mock.Mock(status_code=200) for _ in range(3)]
         mock_session = mock.MagicMock()
-        mock_session.get.side_effect = ["first_url", "second_url", "third_url"]
+        mock_session.get.side_effect = responses
         mock_get_session.return_value = mock_session
         nft = NetflixFastMeasurement("1")
         assert [
             nft._get_connection("first"),
             nft._get_connection("second"),
             nft._get_connection("third"),
-        ] == ["first_url", "second_url", "third_url"]
-        assert len(nft.sessions) == 3
+        ] == responses
+        # A single session is shared by every connection
+        assert mock_get_session.call_count == 1
+        assert nft.session is mock_session
+
+    @mock.patch("requests.Session")
+    def test_get_connection_error_status(self, mock_get_session):
+        response = mock_get_session.return_value.get.return_value
+        response.status_code = 404
+        nft = NetflixFastMeasurement("1")
+        self.assertRaises(ConnectionError, nft._get_connection, "first")
+        response.close.assert_called_once_with()
+
+    @mock.patch("requests.Session")
+    def test_close(self, mock_get_session):
+        mock_get_session.return_value.get.return_value.status_code = 200
+        nft = NetflixFastMeasurement("1")
+        nft._get_connection("first")
+        nft.close()
+        mock_get_session.return_value.close.assert_called_once_with()
+        assert nft.session is None
+        nft._get_connection("second")
+        assert mock_get_session.call_count == 2
+
+    @mock.patch("requests.Session")
+    def test_context_manager(self, mock_get_session):
+        mock_get_session.return_value.get.return_value.status_code = 200
+        with NetflixFastMeasurement("1") as nft:
+            nft._get_connection("first")
+        mock_get_session.return_value.close.assert_called_once_with()
+
+    @mock.patch("requests.Session")
+    def test_no_keep_alive(self, mock_get_session):
+        mock_get_session.return_value.headers = {}
+        mock_get_session.return_value.get.return_value.status_code = 200
+        nft = NetflixFastMeasurement("1", keep_alive=False)
+        nft._get_connection("first")
+        assert mock_get_session.return_value.headers["Connection"] == "close"
+
+    def test_get_range_url(self):
+        url = "https://afakeurl.1.notreal.net/speedtest?c=gb&n=0"
+        assert self.nft._get_range_url(url, 0) == url
+        nft = NetflixFastMeasurement("1", range_sizes=(2048, 2**20))
+        assert (
+            nft._get_range_url(url, 0)
+            == "https://afakeurl.1.notreal.net/speedtest/range/0-2047?c=gb&n=0"
+        )
+        assert (
+            nft._get_range_url(url, 1)
+            == "https://afakeurl.1.notreal.net/speedtest/range/0-1048575?c=gb&n=0"
+        )
+
+    def test_invalid_range_sizes(self):
+        self.assertRaises(ValueError, NetflixFastMeasurement, "1", range_sizes=())
+        self.assertRaises(
+            ValueError, NetflixFastMeasurement, "1", range_sizes=(1024, 0)
+        )
+
+    def _update_stability_detector(self, sample_count, elapsed_time, get_total):
+        for i in range(1, sample_count + 1):
+            sample_time = elapsed_time * i / sample_count
+            self.nft.stability_detector.update(sample_time, get_total(sample_time))
 
     def test_is_stabilised_is_stable(self):
-        mock_elapsed_time = MIN_TIME_SECONDS + 1
-        mock_percent_deltas = [
-            STABLE_MEASUREMENTS_DELTA - sys.float_info.epsilon
-        ] * MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE
-        assert self.nft._is_stabilised(mock_percent_deltas, mock_elapsed_time) is True
+        self._update_stability_detector(
+            MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE * 3,
+            MIN_TIME_SECONDS + 1,
+            lambda t: t * 10000,
+        )
+        assert self.nft._is_stabilised() is True
 
     def test_is_stabilised_not_stable(self):
-        mock_elapsed_time = MIN_TIME_SECONDS + 1
-        mock_percent_deltas = [STABLE_MEASUREMENTS_DELTA - sys.float_info.epsilon] * (
-            MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE - 1
+        # The cumulative average rate keeps rising as the rate accelerates
+        self._update_stability_detector(
+            MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE * 3,
+            MIN_TIME_SECONDS + 1,
+            lambda t: t**3 * 10000,
         )
-        mock_percent_deltas.append(STABLE_MEASUREMENTS_DELTA + sys.float_info.epsilon)
-        assert self.nft._is_stabilised(mock_percent_deltas, mock_elapsed_time) is False
+        assert self.nft._is_stabilised() is False
 
     def test_is_stabilised_too_short(self):
-        mock_elapsed_time = MIN_TIME_SECONDS + 1
-        mock_percent_deltas = [STABLE_MEASUREMENTS_DELTA - sys.float_info.epsilon] * (
-            MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE - 1
+        # Too few samples to have a full set of percentage deltas
+        self._update_stability_detector(
+            MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE * 2 - 2,
+            MIN_TIME_SECONDS + 1,
+            lambda t: t * 10000,
         )
-        assert self.nft._is_stabilised(mock_percent_deltas, mock_elapsed_time) is False
+        assert self.nft._is_stabilised() is False
 
     def test_is_stabilised_too_early(self):
-        mock_elapsed_time = MIN_TIME_SECONDS - 1
-        mock_percent_deltas = [
-            STABLE_MEASUREMENTS_DELTA - sys.float_info.epsilon
-        ] * MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE
-        assert self.nft._is_stabilised(mock_percent_deltas, mock_elapsed_time) is False
+        self._update_stability_detector(
+            MEASUREMENTS_COUNTED_BEFORE_CONSIDERED_STABLE * 3,
+            MIN_TIME_SECONDS - 1,
+            lambda t: t * 10000,
+        )
+        assert self.nft._is_stabilised() is False
+
+    def test_invalid_stability_detector(self):
+        self.assertRaises(
+            ValueError, NetflixFastMeasurement, "1", stability_detector="median"
+        )
+
+    def test_stability_detector_instance(self):
+        detector = EWMAStabilityDetector(min_time_seconds=1)
+        nft = NetflixFastMeasurement("1", stability_detector=detector)
+        assert nft.stability_detector is detector
+
+    def test_stability_detector_names(self):
+        for name, detector_class in zip(
+            STABILITY_DETECTORS,
+            [
+                DeltaStabilityDetector,
+                EWMAStabilityDetector,
+                RegressionStabilityDetector,
+            ],
+        ):
+            nft = NetflixFastMeasurement("1", stability_detector=name)
+            self.assertIsInstance(nft.stability_detector, detector_class)
 
 
 class ErrorsTestCase(TestCase):
@@ -757,3 +900,510 @@ class ErrorsTestCase(TestCase):
             for i in range(self.nft.urlcount)  # Generate thread results dict structure
         ]
         assert self.nft._get_fast_result() == mock_error_result
+
+
+class TokenCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "netmeasure", "token.json")
+        self.clock = mock.Mock(return_value=1000.0)
+        self.cache = TokenCache(self.path, ttl_seconds=60, clock=self.clock)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+        super().tearDown()
+
+    def test_store_load(self):
+        self.cache.store("token")
+        self.clock.return_value = 1059.0
+        assert self.cache.load() == "token"
+
+    def test_empty(self):
+        assert self.cache.load() is None
+
+    def test_expired(self):
+        self.cache.store("token")
+        self.clock.return_value = 1060.0
+        assert self.cache.load() is None
+
+    def test_invalidate(self):
+        self.cache.store("token")
+        self.cache.invalidate()
+        assert self.cache.load() is None
+        self.cache.invalidate()
+
+    def test_corrupt(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write('{"token": "tok')
+        assert self.cache.load() is None
+
+
+class CachedTokenTestCase(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "token.json")
+        self.nft = NetflixFastMeasurement("1", urlcount=1, token_cache_path=self.path)
+        self.nft.thread_results = [
+            {
+                "index": 0,
+                "elapsed_time": None,
+                "download_size": 0,
+                "download_rate": 0,
+                "url": None,
+                "location": None,
+            }
+        ]
+        self.api_response = {
+            "client": {
+                "location": {"city": "HBox City", "country": "HBoxtopia"},
+                "isp": "ServiceProvider",
+                "asn": "0000",
+                "ip": "0000:0000:000a:0000:0c00:0b00:a0a0:f0f0",
+            },
+            "targets": [
+                {
+                    "location": {"city": "Foreign City", "country": "Foreign Country"},
+                    "url": "https://afakeurl.1.notreal.net/speedtest",
+                }
+            ],
+        }
+        self.mock_resp = mock.MagicMock()
+        self.mock_resp.text = '<script src="/app-new.js">'
+        self.mock_script_resp = mock.MagicMock()
+        self.mock_script_resp.text = 'containing token:"new-token"'
+        self.mock_api_resp = mock.MagicMock()
+        self.mock_api_resp.json.return_value = self.api_response
+        self.fast_data = {
+            "speed_bits": 1000,
+            "total": 100,
+            "reason_terminated": "all_complete",
+        }
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+        super().tearDown()
+
+    @mock.patch.object(NetflixFastMeasurement, "_manage_threads")
+    @mock.patch.object(NetflixFastMeasurement, "_get_connection")
+    @mock.patch("requests.Session")
+    def test_stores_token(
+        self, mock_get_session, mock_get_connection, mock_manage_threads
+    ):
+        mock_session = mock.MagicMock()
+        mock_session.get.side_effect = [
+            self.mock_resp,
+            self.mock_script_resp,
+            self.mock_api_resp,
+        ]
+        mock_get_session.return_value = mock_session
+        mock_manage_threads.return_value = self.fast_data
+        assert self.nft._get_fast_result().errors == []
+        assert self.nft.token_cache.load() == "new-token"
+
+    @mock.patch.object(NetflixFastMeasurement, "_manage_threads")
+    @mock.patch.object(NetflixFastMeasurement, "_get_connection")
+    @mock.patch("requests.Session")
+    def test_uses_cached_token(
+        self, mock_get_session, mock_get_connection, mock_manage_threads
+    ):
+        self.nft.token_cache.store("cached-token")
+        mock_session = mock.MagicMock()
+        mock_session.get.side_effect = [self.mock_api_resp]
+        mock_get_session.return_value = mock_session
+        mock_manage_threads.return_value = self.fast_data
+        result = self.nft._get_fast_result()
+        assert result.errors == []
+        assert result.city == "HBox City"
+        mock_session.get.assert_called_once_with(
+            "https://api.fast.com/netflix/speedtest/v2",
+            params={"https": "true", "token": "cached-token", "urlCount": 1},
+        )
+
+    @mock.patch.object(NetflixFastMeasurement, "_manage_threads")
+    @mock.patch.object(NetflixFastMeasurement, "_get_connection")
+    @mock.patch("requests.Session")
+    def test_rejected_token(
+        self, mock_get_session, mock_get_connection, mock_manage_threads
+    ):
+        self.nft.token_cache.store("expired-token")
+        mock_rejected_resp = mock.MagicMock()
+        mock_rejected_resp.json.return_value = {"errors": ["invalid token"]}
+        mock_session = mock.MagicMock()
+        mock_session.get.side_effect = [
+            mock_rejected_resp,
+            self.mock_resp,
+            self.mock_script_resp,
+            self.mock_api_resp,
+        ]
+        mock_get_session.return_value = mock_session
+        mock_manage_threads.return_value = self.fast_data
+        assert self.nft._get_fast_result().errors == []
+        assert mock_session.get.call_count == 4
+        assert self.nft.token_cache.load() == "new-token"
+
+    @mock.patch.object(NetflixFastMeasurement, "_manage_threads")
+    @mock.patch.object(NetflixFastMeasurement, "_get_connection")
+    @mock.patch("requests.Session")
+    def test_cached_token_request_error(
+        self, mock_get_session, mock_get_connection, mock_manage_threads
+    ):
+        self.nft.token_cache.store("cached-token")
+        mock_session = mock.MagicMock()
+        mock_session.get.side_effect = [
+            requests.exceptions.ConnectionError("Connection reset"),
+            self.mock_resp,
+            self.mock_script_resp,
+            self.mock_api_resp,
+        ]
+        mock_get_session.return_value = mock_session
+        mock_manage_threads.return_value = self.fast_data
+        assert self.nft._get_fast_result().errors == []
+        assert self.nft.token_cache.load() == "new-token"
+
+    @mock.patch("requests.Session")
+    def test_rejected_token_invalidated(self, mock_get_session):
+        self.nft.token_cache.store("expired-token")
+        mock_rejected_resp = mock.MagicMock()
+        mock_rejected_resp.json.return_value = {"errors": ["invalid token"]}
+        mock_session = mock.MagicMock()
+        mock_session.get.side_effect = [
+            mock_rejected_resp,
+            ConnectionError("Failed to pretend to establish a new connection"),
+        ]
+        mock_get_session.return_value = mock_session
+        result = self.nft._get_fast_result()
+        assert result.errors[0].key == "netflix-response"
+        assert self.nft.token_cache.load() is None
+
+
+class TargetRequestHandler(BaseHTTPRequestHandler):
+    """Responds to `/<size>` with a body of `size` bytes.
+
+    `/slow/<size>` sends the body in 1 KiB pieces every 50ms, and
+    `/missing/<size>` responds with a `404`.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        size = int(parts[-1])
+        self.send_response(404 if parts[0] == "missing" else 200)
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        try:
+            if parts[0] == "slow":
+                for _ in range(0, size, 1024):
+                    self.wfile.write(b"x" * 1024)
+                    self.wfile.flush()
+                    time.sleep(0.05)
+            else:
+                self.wfile.write(b"x" * size)
+        except ConnectionError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AsyncEngineTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), TargetRequestHandler)
+        cls.server.daemon_threads = True
+        cls.base_url = "http://127.0.0.1:{port}".format(port=cls.server.server_port)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def get_measurement(self, paths, **kwargs):
+        nft = NetflixFastMeasurement(
+            "1", urlcount=len(paths), engine="asyncio", **kwargs
+        )
+        nft.thread_results = [
+            {
+                "index": i,
+                "elapsed_time": None,
+                "download_size": 0,
+                "download_rate": 0,
+                "url": self.base_url + path,
+                "location": None,
+            }
+            for i, path in enumerate(paths)
+        ]
+        return nft
+
+    def test_invalid_engine(self):
+        self.assertRaises(ValueError, NetflixFastMeasurement, "1", engine="invalid")
+        self.assertEqual(ENGINES, ["threads", "asyncio"])
+
+    def test_all_complete(self):
+        nft = self.get_measurement(
+            ["/100000", "/200000", "/300000"], terminate_on_thread_complete=False
+        )
+        x = nft._manage_async_downloads()
+        assert (x["reason_terminated"] == "all_complete") & (x["total"] == 600000)
+        assert [r["download_size"] for r in nft.thread_results] == [
+            100000,
+            200000,
+            300000,
+        ]
+        assert all(r["elapsed_time"] > 0 for r in nft.thread_results)
+
+    def test_thread_complete_cancels_downloads(self):
+        nft = self.get_measurement(["/100000", "/slow/1048576", "/slow/1048576"])
+        x = nft._manage_async_downloads()
+        assert x["reason_terminated"] == "thread_complete"
+        assert nft.thread_results[0]["download_size"] == 100000
+        # The slow downloads would take over 50 seconds to complete
+        assert all(r["download_size"] < 1048576 for r in nft.thread_results[1:])
+        assert nft.completed_total >= 100000
+        self.assertAlmostEqual(
+            x["speed_bits"], nft.completed_total / nft.completed_elapsed_time * 8
+        )
+
+    def test_time_expired(self):
+        nft = self.get_measurement(["/slow/1048576"], max_time_seconds=0.5)
+        x = nft._manage_async_downloads()
+        assert x["reason_terminated"] == "time_expired"
+        assert 0 < nft.thread_results[0]["download_size"] < 1048576
+        assert nft.thread_results[0]["elapsed_time"] >= 0.5
+
+    def test_rate_timeline(self):
+        nft = self.get_measurement(
+            ["/slow/1048576", "/slow/1048576"], max_time_seconds=0.9
+        )
+        x = nft._manage_async_downloads()
+        sample_times = x["sample_times"]
+        assert len(sample_times) >= 2
+        assert list(sample_times) == sorted(set(sample_times))
+        first, second = [r["download_rates"] for r in nft.thread_results]
+        assert len(first) == len(second) == len(x["rates_bits"]) == len(sample_times)
+        for total, first_rate, second_rate in zip(x["rates_bits"], first, second):
+            self.assertAlmostEqual(total, first_rate + second_rate)
+        # Each slow download sends 20 KiB/s
+        assert 0 < max(first) < 1024 * 20 * 8 * 4
+
+    @mock.patch(
+        "netmeasure.measurements.netflix_fast.measurements.NetflixFastMeasurement._is_stabilised"
+    )
+    def test_stabilised(self, mock_is_stabilised):
+        mock_is_stabilised.return_value = True
+        nft = self.get_measurement(
+            ["/slow/1048576"],
+            terminate_on_thread_complete=False,
+            terminate_on_result_stable=True,
+        )
+        x = nft._manage_async_downloads()
+        assert x["reason_terminated"] == "result_stabilised"
+
+    @mock.patch(
+        "netmeasure.measurements.netflix_fast.measurements.ADAPTIVE_INTERVAL_SECONDS",
+        0.4,
+    )
+    def test_adaptive_connections(self):
+        # Each slow download is rate limited, so every connection added raises throughput
+        nft = self.get_measurement(
+            ["/slow/1048576"] * 3,
+            max_time_seconds=2,
+            terminate_on_thread_complete=False,
+            adaptive_connections=True,
+        )
+        x = nft._manage_async_downloads()
+        assert x["reason_terminated"] == "time_expired"
+        assert nft.connection_count == 3
+        assert nft.connection_scaler.settled
+        # Connections were added one at a time
+        sizes = [r["download_size"] for r in nft.thread_results]
+        assert sizes[0] > sizes[1] > sizes[2] > 0
+
+    @mock.patch(
+        "netmeasure.measurements.netflix_fast.measurements.ADAPTIVE_INTERVAL_SECONDS",
+        0.4,
+    )
+    def test_adaptive_connections_threads(self):
+        # Threads read until the chunk is full, so use a chunk the size of each write
+        nft = self.get_measurement(
+            ["/slow/1048576"] * 3,
+            chunk_size=1024,
+            max_time_seconds=2,
+            terminate_on_thread_complete=False,
+            adaptive_connections=True,
+        )
+        conns = [nft._get_connection(r["url"]) for r in nft._get_initial_targets()]
+        assert len(conns) == 1
+        x = nft._manage_threads(conns)
+        assert x["reason_terminated"] == "time_expired"
+        assert nft.connection_count == 3
+        sizes = [r["download_size"] for r in nft.thread_results]
+        assert sizes[0] > sizes[1] > sizes[2] > 0
+
+    @mock.patch(
+        "netmeasure.measurements.netflix_fast.measurements.ADAPTIVE_INTERVAL_SECONDS",
+        0.2,
+    )
+    def test_adaptive_connections_threads_connect(self):
+        nft = self.get_measurement(
+            ["/slow/1048576"] * 2,
+            chunk_size=1024,
+            max_time_seconds=1,
+            terminate_on_thread_complete=False,
+            adaptive_connections=True,
+        )
+        conns = [nft._get_connection(r["url"]) for r in nft._get_initial_targets()]
+        get_connection = nft._get_connection
+        connecting_threads = []
+
+        def record_get_connection(url, step=0):
+            connecting_threads.append(current_thread())
+            return get_connection(url, step)
+
+        with mock.patch.object(
+            nft, "_get_connection", side_effect=record_get_connection
+        ):
+            x = nft._manage_threads(conns)
+        assert x["reason_terminated"] == "time_expired"
+        assert nft.connection_count == 2
+        # The added connection was opened by the thread reading it, not the sampler
+        assert len(connecting_threads) == 1
+        assert connecting_threads[0] is not current_thread()
+
+    @mock.patch(
+        "netmeasure.measurements.netflix_fast.measurements.ADAPTIVE_INTERVAL_SECONDS",
+        0.2,
+    )
+    def test_adaptive_connections_threads_connect_failed(self):
+        nft = self.get_measurement(
+            ["/slow/1048576", "/missing/100", "/slow/1048576"],
+            chunk_size=1024,
+            max_time_seconds=1.5,
+            terminate_on_thread_complete=False,
+            adaptive_connections=True,
+        )
+        conns = [nft._get_connection(r["url"]) for r in nft._get_initial_targets()]
+        x = nft._manage_threads(conns)
+        assert x["reason_terminated"] == "time_expired"
+        # No connection is added after the one which failed
+        assert nft.connection_scaler.settled
+        assert nft.connection_count == 2
+        assert nft.thread_results[1]["download_size"] == 0
+
+    def test_adaptive_not_stabilised_while_scaling(self):
+        nft = self.get_measurement(["/100"] * 3, adaptive_connections=True)
+        nft.stability_detector = mock.Mock(is_stable=mock.Mock(return_value=True))
+        nft.connection_scaler = nft._create_connection_scaler(1)
+        assert nft._is_stabilised() is False
+        nft.connection_scaler.settle(2)
+        assert nft._is_stabilised() is True
+
+    def test_connection_error(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), TargetRequestHandler)
+        nft = self.get_measurement(["/100000"])
+        nft.thread_results[0]["url"] = "http://127.0.0.1:{port}/100".format(
+            port=server.server_port
+        )
+        server.server_close()
+        self.assertRaises(ConnectionError, nft._manage_async_downloads)
+
+
+@mock.patch("netmeasure.measurements.netflix_fast.measurements.LatencyMeasurement")
+class StandInTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FastStandInServer()
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.server.accept_uploads = True
+
+    def get_measurement(self, **kwargs):
+        return NetflixFastMeasurement(
+            "1",
+            terminate_on_thread_complete=False,
+            upload=True,
+            upload_payload_size=1000000,
+            fast_url=self.server.fast_url,
+            api_url=self.server.api_url,
+            **kwargs
+        )
+
+    def test_download_upload(self, mock_latency_measurement):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                results = self.get_measurement(engine=engine).measure()
+                fast_result = results[0]
+                assert fast_result.errors == []
+                assert fast_result.isp == "Loopback"
+                assert fast_result.city == "Stand-in City"
+                assert fast_result.reason_terminated == "all_complete"
+                assert fast_result.download_size == 3 * 200000
+                assert fast_result.upload_size == 3 * 1000000
+                assert fast_result.upload_rate > 0
+                assert fast_result.upload_rate_unit == NetworkUnit("bit/s")
+                assert [r.city for r in results[1::2]] == ["Target City"] * 3
+
+    def test_repeated_measurements(self, mock_latency_measurement):
+        with self.get_measurement(adaptive_connections=False) as nft:
+            first = nft.measure()
+            session = nft.session
+            second = nft.measure()
+            assert nft.session is session
+            assert len(nft.thread_results) == 3
+        assert nft.session is None
+        assert len(first) == len(second) == 7
+        assert second[0].download_size == 3 * 200000
+        assert second[0].upload_size == 3 * 1000000
+
+    def test_chunk_size_reported(self, mock_latency_measurement):
+        nft = self.get_measurement(engine="threads")
+        nft.upload = False
+        results = nft.measure()
+        for thread_result in results[1::2]:
+            assert MIN_CHUNK_SIZE <= thread_result.chunk_size <= MAX_CHUNK_SIZE
+        nft = self.get_measurement(engine="threads", autotune_chunk_size=False)
+        nft.upload = False
+        results = nft.measure()
+        assert [r.chunk_size for r in results[1::2]] == [64 * 2**10] * 3
+
+    def test_range_sizes(self, mock_latency_measurement):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                nft = self.get_measurement(
+                    engine=engine, range_sizes=(1000, 5000, 20000)
+                )
+                nft.upload = False
+                fast_result = nft.measure()[0]
+                assert fast_result.errors == []
+                assert fast_result.reason_terminated == "all_complete"
+                assert fast_result.download_size == 3 * 26000
+
+    def test_upload_disabled(self, mock_latency_measurement):
+        nft = self.get_measurement()
+        nft.upload = False
+        fast_result = nft.measure()[0]
+        assert fast_result.download_size == 3 * 200000
+        assert fast_result.upload_size is None
+
+    def test_upload_rejected(self, mock_latency_measurement):
+        self.server.accept_uploads = False
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                fast_result = self.get_measurement(engine=engine).measure()[0]
+                assert fast_result.download_size == 3 * 200000
+                assert fast_result.upload_size is None
+                assert [e.key for e in fast_result.errors] == ["netflix-upload"]
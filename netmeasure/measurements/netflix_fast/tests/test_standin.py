@@ -0,0 +1,69 @@
+import time
+from unittest import TestCase, mock
+
+import requests
+
+from netmeasure.measurements.netflix_fast.standin import (
+    TOKEN,
+    FastStandInServer,
+    Throttle,
+)
+
+
+class ThrottleTestCase(TestCase):
+    def setUp(self):
+        self.clock = mock.Mock(return_value=0.0)
+        self.sleep = mock.Mock()
+        self.throttle = Throttle(1000, clock=self.clock, sleep=self.sleep)
+
+    def test_paces_transfer(self):
+        self.throttle.wait(500)
+        self.sleep.assert_called_once_with(0.5)
+        self.clock.return_value = 0.5
+        self.throttle.wait(1000)
+        self.sleep.assert_called_with(1.0)
+
+    def test_shares_link(self):
+        # A second transfer waits for the slot after the first one's
+        self.throttle.wait(500)
+        self.throttle.wait(500)
+        self.assertEqual(self.sleep.call_args_list, [mock.call(0.5), mock.call(1.0)])
+
+    def test_idle_link(self):
+        # Time the link was idle is not saved up for later transfers
+        self.throttle.wait(500)
+        self.clock.return_value = 10.0
+        self.throttle.wait(500)
+        self.sleep.assert_called_with(0.5)
+
+    def test_invalid_rate(self):
+        self.assertRaises(ValueError, Throttle, 0)
+
+
+class FastStandInServerTestCase(TestCase):
+    def test_api(self):
+        with FastStandInServer() as server:
+            response = requests.get(
+                server.api_url, params={"token": TOKEN, "urlCount": 2}
+            )
+            targets = response.json()["targets"]
+            self.assertEqual(len(targets), 2)
+            self.assertEqual(len(requests.get(targets[0]["url"]).content), 200000)
+            self.assertEqual(
+                len(requests.get(targets[0]["url"] + "/range/0-999").content), 1000
+            )
+
+    def test_invalid_token(self):
+        with FastStandInServer() as server:
+            response = requests.get(
+                server.api_url, params={"token": "wrong", "urlCount": 1}
+            )
+            self.assertEqual(response.status_code, 403)
+
+    def test_throttled(self):
+        with FastStandInServer(target_size=100000, rate=200000) as server:
+            start = time.monotonic()
+            response = requests.get(server.base_url + "/speedtest/0")
+            elapsed_time = time.monotonic() - start
+        self.assertEqual(len(response.content), 100000)
+        self.assertGreaterEqual(elapsed_time, 0.45)
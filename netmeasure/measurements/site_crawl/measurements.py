@@ -0,0 +1,254 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from six.moves.urllib.parse import urldefrag, urlsplit
+
+import requests
+
+from netmeasure.measurements.base.measurements import BaseMeasurement
+from netmeasure.measurements.base.results import Error
+from netmeasure.measurements.site_crawl.results import SiteCrawlMeasurementResult
+from netmeasure.measurements.webpage_download.cache import HTTPCache
+from netmeasure.measurements.webpage_download.fetcher import get_origin
+from netmeasure.measurements.webpage_download.measurements import (
+    CONNECTIONS_PER_ORIGIN,
+    MAX_ASSET_DEPTH,
+    MAX_ASSETS,
+    MAX_CONNECTIONS,
+    WEB_ERRORS,
+    WebpageDownloadMeasurement,
+)
+from netmeasure.measurements.webpage_download.results import (
+    WebpageDownloadMeasurementResult,
+)
+from netmeasure.units import NetworkUnit, StorageUnit, TimeUnit
+
+SITE_CRAWL_ERRORS = {
+    "site-crawl-pages": "None of the pages loaded successfully",
+}
+BITS_PER_BYTE = 8
+MAX_PAGES = 50
+CONCURRENT_PAGES = 4
+
+
+class SiteCrawlMeasurement(BaseMeasurement):
+    """A measurement of the time taken to load the pages of a site.
+
+    Each page is loaded as a `WebpageDownloadMeasurement`, several at
+    once, sharing one pool of connections and one `HTTPCache`, so that
+    an asset used by many pages is fetched once and later pages reuse
+    the connections, and the DNS lookups, of earlier ones. With
+    `follow_links`, the pages linked to from each page are loaded too,
+    where they share an origin with one of `urls`.
+    """
+
+    def __init__(
+        self,
+        id,
+        urls,
+        follow_links=False,
+        max_pages=MAX_PAGES,
+        concurrent_pages=CONCURRENT_PAGES,
+        download_timeout=180,
+        connections_per_origin=CONNECTIONS_PER_ORIGIN,
+        max_connections=MAX_CONNECTIONS,
+        max_asset_depth=MAX_ASSET_DEPTH,
+        max_assets=MAX_ASSETS,
+        cache=None,
+    ):
+        """
+        :param id: A unique identifier for the measurement.
+        :param urls: A list of the URLs of the pages to load.
+        :param follow_links: Whether to also load the pages linked to
+        from each page, on the same origins as `urls`.
+        :param max_pages: The most pages loaded, including `urls`.
+        :param concurrent_pages: The most pages loaded at once.
+        :param download_timeout: The time in seconds after which a
+        request is abandoned.
+        :param connections_per_origin: The most assets of a page fetched
+        at once from a single origin.
+        :param max_connections: The most assets of a page fetched at once.
+        :param max_asset_depth: The deepest level of stylesheet imports
+        whose assets are fetched.
+        :param max_assets: The most assets fetched for a page.
+        :param cache: An `HTTPCache` shared by the pages, e.g. one kept
+        from an earlier crawl. By default, each measurement starts with
+        an empty cache.
+        """
+        super(SiteCrawlMeasurement, self).__init__(id=id)
+        if len(urls) < 1:
+            raise ValueError("At least one URL must be provided.")
+        if max_pages < 1 or concurrent_pages < 1:
+            raise ValueError("`max_pages` and `concurrent_pages` must be at least 1")
+        self.urls = urls
+        self.follow_links = follow_links
+        self.max_pages = max_pages
+        self.concurrent_pages = concurrent_pages
+        self.download_timeout = download_timeout
+        self.connections_per_origin = connections_per_origin
+        self.max_connections = max_connections
+        self.max_asset_depth = max_asset_depth
+        self.max_assets = max_assets
+        self.cache = cache
+        # Raises a `ValueError` for invalid page options
+        self._get_page_measurement(urls[0], None, None)
+
+    def measure(self):
+        """Perform the measurement.
+
+        Returns a `SiteCrawlMeasurementResult` followed by a
+        `WebpageDownloadMeasurementResult` for each page, in the order
+        they were queued.
+        """
+        cache = self.cache if self.cache is not None else HTTPCache()
+        origins = {get_origin(url) for url in self.urls}
+        queued = set()
+        futures = []
+
+        def queue_page(url):
+            url = urldefrag(url)[0]
+            if url in queued or len(queued) >= self.max_pages:
+                return None
+            queued.add(url)
+            future = executor.submit(self._measure_page, url, session, cache)
+            futures.append(future)
+            return future
+
+        start_time = time.time()
+        with self._get_session() as session, ThreadPoolExecutor(
+            max_workers=self.concurrent_pages
+        ) as executor:
+            pending = {queue_page(url) for url in self.urls} - {None}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                if not self.follow_links:
+                    continue
+                for future in done:
+                    for link in future.result().links or []:
+                        if (
+                            urlsplit(link).scheme in ("http", "https")
+                            and get_origin(link) in origins
+                        ):
+                            pending.add(queue_page(link))
+                pending.discard(None)
+        elapsed_time = time.time() - start_time
+        cache.save()
+
+        page_results = [future.result() for future in futures]
+        return [self._get_crawl_result(page_results, elapsed_time)] + page_results
+
+    def _measure_page(self, url, session, cache):
+        """
+        Returns the `WebpageDownloadMeasurementResult` of the page at `url`
+        An error the page measurement does not handle, e.g. a followed link redirecting
+        too many times, fails that page rather than the crawl
+        """
+        try:
+            return self._get_page_measurement(url, session, cache).measure()
+        except requests.RequestException as e:
+            return WebpageDownloadMeasurementResult(
+                id=self.id,
+                url=url,
+                download_rate=None,
+                download_rate_unit=None,
+                download_size=None,
+                download_size_unit=None,
+                asset_count=None,
+                failed_asset_downloads=None,
+                elapsed_time=None,
+                elapsed_time_unit=None,
+                errors=[
+                    Error(
+                        key="web-get",
+                        description=WEB_ERRORS["web-get"],
+                        traceback=str(e),
+                    )
+                ],
+            )
+
+    def _get_page_measurement(self, url, session, cache):
+        return WebpageDownloadMeasurement(
+            self.id,
+            url,
+            download_timeout=self.download_timeout,
+            connections_per_origin=self.connections_per_origin,
+            max_connections=self.max_connections,
+            max_asset_depth=self.max_asset_depth,
+            max_assets=self.max_assets,
+            cache=cache,
+            session=session,
+            collect_links=self.follow_links,
+        )
+
+    def _get_session(self):
+        session = requests.Session()
+        # Each page loading at once may use as many connections to an origin as a single page
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.max_connections,
+            pool_maxsize=self.connections_per_origin * self.concurrent_pages,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get_crawl_result(self, page_results, elapsed_time):
+        """
+        Returns a SiteCrawlMeasurementResult combining the `page_results` which loaded successfully
+        """
+        completed_results = [r for r in page_results if len(r.errors) == 0]
+        if len(completed_results) == 0:
+            return self._get_crawl_error(
+                "site-crawl-pages",
+                traceback="\n".join(
+                    str(error.traceback) for r in page_results for error in r.errors
+                ),
+            )
+        download_size = sum(r.download_size for r in completed_results)
+        return SiteCrawlMeasurementResult(
+            id=self.id,
+            urls=[r.url for r in completed_results],
+            page_count=len(completed_results),
+            failed_page_count=len(page_results) - len(completed_results),
+            asset_count=sum(r.asset_count for r in completed_results),
+            failed_asset_downloads=sum(
+                r.failed_asset_downloads for r in completed_results
+            ),
+            download_size=download_size,
+            download_size_unit=StorageUnit("B"),
+            download_rate=download_size * BITS_PER_BYTE / elapsed_time,
+            download_rate_unit=NetworkUnit("bit/s"),
+            mean_page_load_time=sum(r.elapsed_time for r in completed_results)
+            / len(completed_results),
+            mean_page_load_time_unit=TimeUnit("s"),
+            elapsed_time=elapsed_time,
+            elapsed_time_unit=TimeUnit("s"),
+            cache_hits=sum(r.cache_hits for r in completed_results),
+            cache_revalidations=sum(r.cache_revalidations for r in completed_results),
+            errors=[],
+        )
+
+    def _get_crawl_error(self, key, traceback):
+        return SiteCrawlMeasurementResult(
+            id=self.id,
+            urls=[],
+            page_count=None,
+            failed_page_count=None,
+            asset_count=None,
+            failed_asset_downloads=None,
+            download_size=None,
+            download_size_unit=None,
+            download_rate=None,
+            download_rate_unit=None,
+            mean_page_load_time=None,
+            mean_page_load_time_unit=None,
+            elapsed_time=None,
+            elapsed_time_unit=None,
+            cache_hits=None,
+            cache_revalidations=None,
+            errors=[
+                Error(
+                    key=key,
+                    description=SITE_CRAWL_ERRORS.get(key, ""),
+                    traceback=traceback,
+                )
+            ],
+        )
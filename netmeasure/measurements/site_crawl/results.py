@@ -0,0 +1,54 @@
+import typing
+from dataclasses import dataclass
+
+from netmeasure.measurements.base.results import MeasurementResult
+from netmeasure.units import NetworkUnit, StorageUnit, TimeUnit
+
+
+@dataclass(frozen=True)
+class SiteCrawlMeasurementResult(MeasurementResult):
+    """Encapsulates the combined results from loading the pages of a site.
+
+    :param urls: The URLs of the pages which loaded successfully.
+    :param page_count: The number of pages loaded.
+    :param failed_page_count: The number of pages which failed to load.
+    :param asset_count: The number of assets fetched by all pages.
+    :param failed_asset_downloads: The number of assets which failed to
+    download across all pages.
+    :param download_size: The combined size of the pages and their
+    assets as received (excluding units).
+    :param download_size_unit: The unit of measurement used to describe
+    the `download_size`.
+    :param download_rate: The combined rate of the page loads, measured
+    from the start of the first to the end of the last (excluding units).
+    :param download_rate_unit: The unit of measurement used to measure
+    the `download_rate`.
+    :param mean_page_load_time: The mean time taken to load a page and
+    its assets (excluding units).
+    :param mean_page_load_time_unit: The unit of measurement used to
+    describe the `mean_page_load_time`.
+    :param elapsed_time: The time taken to load all pages (excluding
+    units).
+    :param elapsed_time_unit: The unit of measurement used to describe
+    the `elapsed_time`.
+    :param cache_hits: The number of responses reused from the shared
+    cache without a request.
+    :param cache_revalidations: The number of responses reused from the
+    shared cache after a conditional request.
+    """
+
+    urls: typing.List[str]
+    page_count: typing.Optional[int]
+    failed_page_count: typing.Optional[int]
+    asset_count: typing.Optional[int]
+    failed_asset_downloads: typing.Optional[int]
+    download_size: typing.Optional[float]
+    download_size_unit: typing.Optional[StorageUnit]
+    download_rate: typing.Optional[float]
+    download_rate_unit: typing.Optional[NetworkUnit]
+    mean_page_load_time: typing.Optional[float]
+    mean_page_load_time_unit: typing.Optional[TimeUnit]
+    elapsed_time: typing.Optional[float]
+    elapsed_time_unit: typing.Optional[TimeUnit]
+    cache_hits: typing.Optional[int]
+    cache_revalidations: typing.Optional[int]
@@ -0,0 +1,191 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import time
+from threading import Thread
+from unittest import TestCase
+
+from netmeasure.measurements.site_crawl.measurements import (
+    SITE_CRAWL_ERRORS,
+    SiteCrawlMeasurement,
+)
+from netmeasure.measurements.site_crawl.results import SiteCrawlMeasurementResult
+from netmeasure.measurements.webpage_download.cache import HTTPCache
+from netmeasure.measurements.webpage_download.results import (
+    WebpageDownloadMeasurementResult,
+)
+
+
+def get_page(links, image):
+    return (
+        '<html><link rel="stylesheet" href="/style.css"><img src="/logo.png">'
+        '<img src="{image}">{links}</html>'.format(
+            image=image,
+            links="".join(
+                '<a href="{link}">A page</a>'.format(link=link) for link in links
+            ),
+        ).encode()
+    )
+
+
+class SiteRequestHandler(BaseHTTPRequestHandler):
+    """Serves a site of four pages sharing a stylesheet and a logo, which
+    may be cached for a minute.
+
+    `/stalled` sends half of a page, then stalls for 3s, and `/broken`
+    links to `/a` and to `/redirect`, which redirects to itself."""
+
+    protocol_version = "HTTP/1.1"
+    PAGES = {
+        "/": get_page(["/a", "/b#section", "https://example.com/"], "/home.png"),
+        "/a": get_page(["/", "/b", "/c"], "/a.png"),
+        "/b": get_page(["/a", "mailto:someone@example.com"], "/b.png"),
+        "/c": get_page([], "/c.png"),
+    }
+
+    def do_GET(self):
+        self.server.requested_paths.append(self.path)
+        self.server.client_ports.add(self.client_address[1])
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/redirect")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/stalled":
+            self.send_response(200)
+            self.send_header("Content-Length", "100")
+            self.end_headers()
+            self.wfile.write(b"x" * 50)
+            self.wfile.flush()
+            time.sleep(3)
+            return
+        headers = {}
+        if self.path in self.PAGES:
+            body = self.PAGES[self.path]
+        elif self.path == "/broken":
+            body = get_page(["/a", "/redirect"], "/broken.png")
+        elif self.path == "/style.css":
+            headers = {"Content-Type": "text/css", "Cache-Control": "max-age=60"}
+            body = b".a { background: url(/background.png) }"
+        elif self.path in ("/logo.png", "/background.png"):
+            headers = {"Cache-Control": "max-age=60"}
+            body = b"x" * 1000
+        else:
+            body = b"x" * 100
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SiteCrawlMeasurementTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SiteRequestHandler)
+        self.server.daemon_threads = True
+        self.server.requested_paths = []
+        self.server.client_ports = set()
+        self.url = "http://127.0.0.1:{port}/".format(port=self.server.server_port)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_pages(self):
+        results = SiteCrawlMeasurement(
+            "test", [self.url, self.url + "a", self.url + "c"], concurrent_pages=1
+        ).measure()
+        crawl_result, page_results = results[0], results[1:]
+        self.assertIsInstance(crawl_result, SiteCrawlMeasurementResult)
+        self.assertEqual(crawl_result.errors, [])
+        self.assertEqual(
+            [r.url for r in page_results], [self.url, self.url + "a", self.url + "c"]
+        )
+        for result in page_results:
+            self.assertIsInstance(result, WebpageDownloadMeasurementResult)
+            self.assertEqual(result.errors, [])
+            self.assertIsNone(result.links)
+        self.assertEqual(crawl_result.page_count, 3)
+        self.assertEqual(crawl_result.failed_page_count, 0)
+        self.assertEqual(crawl_result.asset_count, 3 * 4)
+        self.assertEqual(
+            crawl_result.download_size, sum(r.download_size for r in page_results)
+        )
+        # The shared stylesheet, background and logo are fetched once
+        self.assertEqual(crawl_result.cache_hits, 6)
+        for path in ("/style.css", "/background.png", "/logo.png"):
+            self.assertEqual(self.server.requested_paths.count(path), 1)
+        # Later pages reuse the connections opened by earlier ones
+        self.assertLess(len(self.server.client_ports), len(self.server.requested_paths))
+
+    def test_follow_links(self):
+        results = SiteCrawlMeasurement("test", [self.url], follow_links=True).measure()
+        self.assertEqual(results[0].errors, [])
+        self.assertEqual(results[0].page_count, 4)
+        self.assertCountEqual(
+            [r.url for r in results[1:]],
+            [self.url, self.url + "a", self.url + "b", self.url + "c"],
+        )
+        for path in SiteRequestHandler.PAGES:
+            self.assertEqual(self.server.requested_paths.count(path), 1)
+
+    def test_max_pages(self):
+        results = SiteCrawlMeasurement(
+            "test", [self.url], follow_links=True, max_pages=2
+        ).measure()
+        self.assertEqual(results[0].page_count, 2)
+        self.assertEqual(len(results), 3)
+
+    def test_shared_cache(self):
+        cache = HTTPCache()
+        SiteCrawlMeasurement("test", [self.url], cache=cache).measure()
+        results = SiteCrawlMeasurement("test", [self.url], cache=cache).measure()
+        # Only the page and its own image are fetched again
+        self.assertEqual(results[0].cache_hits, 3)
+
+    def test_all_pages_failed(self):
+        self.server.shutdown()
+        self.server.server_close()
+        results = SiteCrawlMeasurement("test", [self.url]).measure()
+        self.assertEqual(results[0].errors[0].key, "site-crawl-pages")
+        self.assertEqual(
+            results[0].errors[0].description, SITE_CRAWL_ERRORS["site-crawl-pages"]
+        )
+        self.assertEqual(results[1].errors[0].key, "web-get")
+
+    def test_failed_link(self):
+        results = SiteCrawlMeasurement(
+            "test", [self.url + "broken"], follow_links=True
+        ).measure()
+        self.assertEqual(results[0].errors, [])
+        # Every page but the one redirecting too many times loads
+        self.assertEqual(results[0].page_count, 5)
+        self.assertEqual(results[0].failed_page_count, 1)
+        failed = [r for r in results[1:] if r.errors]
+        self.assertEqual([r.url for r in failed], [self.url + "redirect"])
+        self.assertEqual(failed[0].errors[0].key, "web-get")
+
+    def test_stalled_page(self):
+        results = SiteCrawlMeasurement(
+            "test", [self.url + "stalled"], download_timeout=1
+        ).measure()
+        self.assertEqual(results[0].errors[0].key, "site-crawl-pages")
+        self.assertEqual(results[1].errors[0].key, "web-timeout")
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, SiteCrawlMeasurement, "test", [])
+        self.assertRaises(
+            ValueError, SiteCrawlMeasurement, "test", [self.url], max_pages=0
+        )
+        self.assertRaises(
+            ValueError, SiteCrawlMeasurement, "test", [self.url], concurrent_pages=0
+        )
+        self.assertRaises(
+            ValueError, SiteCrawlMeasurement, "test", [self.url], max_connections=0
+        )
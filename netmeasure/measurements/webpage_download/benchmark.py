@@ -0,0 +1,156 @@
+"""A benchmark of webpage asset extraction.
+
+Times `extract_assets` against the BeautifulSoup `html.parser` tree and
+`find_all` passes it replaced, on a corpus of saved pages, and checks
+that `extract_assets` finds every asset the passes found. BeautifulSoup is only needed for the
+comparison; without it only `extract_assets` is timed.
+
+    python -m netmeasure.measurements.webpage_download.benchmark saved/*.html
+"""
+
+import time
+import typing
+from collections import Counter
+from dataclasses import dataclass
+
+import click
+
+from netmeasure.measurements.webpage_download.parser import (
+    VALID_LINK_REL_ATTRIBUTES,
+    extract_assets,
+)
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+BENCHMARK_REPEAT = 5
+SYNTHETIC_ASSET_COUNT = 2000
+
+
+@dataclass(frozen=True)
+class ParserBenchmarkResult:
+    """The time taken to extract the assets of one page, in seconds."""
+
+    name: str
+    size: int
+    asset_count: int
+    extractor_time: float
+    soup_time: typing.Optional[float]
+    matches: typing.Optional[bool]
+
+
+def extract_assets_soup(content):
+    """Get the URLs of the assets loaded by an HTML document with
+    BeautifulSoup, as `WebpageDownloadMeasurement` previously did."""
+    soup = BeautifulSoup(content, "html.parser")
+    to_download = []
+    for img in soup.find_all("img"):
+        if img.has_attr("src"):
+            to_download.append(img["src"])
+    for script in soup.find_all("script"):
+        if script.has_attr("src"):
+            to_download.append(script["src"])
+    for link in soup.find_all("link"):
+        if link.has_attr("rel") & link.has_attr("href"):
+            if " ".join(link["rel"]) in VALID_LINK_REL_ATTRIBUTES:
+                to_download.append(link["href"])
+    return to_download
+
+
+def generate_page(asset_count=SYNTHETIC_ASSET_COUNT):
+    """Generate a page of text interspersed with `asset_count` assets."""
+    parts = ["<html><head>"]
+    for i in range(asset_count):
+        kind = i % 4
+        if kind == 0:
+            parts.append('<img alt="" src="/img/{i}.png"/>'.format(i=i))
+        elif kind == 1:
+            parts.append('<script src="/js/{i}.js"></script>'.format(i=i))
+        elif kind == 2:
+            parts.append('<link rel="stylesheet" href="/css/{i}.css"/>'.format(i=i))
+        else:
+            parts.append('<a href="/page/{i}">A link to a page</a>'.format(i=i))
+        parts.append("<p>{text}</p>".format(text="Some text &amp; more. " * 10))
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def time_parser(parse, content, repeat=BENCHMARK_REPEAT):
+    """Get the fastest of `repeat` timings of `parse(content)`."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(content)
+        elapsed_time = time.perf_counter() - start
+        best = elapsed_time if best is None else min(best, elapsed_time)
+    return best
+
+
+def run_benchmark(name, content, repeat=BENCHMARK_REPEAT):
+    """Time asset extraction on a page.
+
+    :param name: The name the page is reported as.
+    :param content: The page's HTML as a `str`.
+    :param repeat: The number of times each parser is timed, of which
+    the fastest is reported.
+    :return: A `ParserBenchmarkResult`.
+    """
+    assets = extract_assets(content)
+    soup_time = None
+    matches = None
+    if BeautifulSoup is not None:
+        soup_time = time_parser(extract_assets_soup, content, repeat)
+        # `extract_assets` also finds `srcset` and style assets, which the passes miss
+        matches = not Counter(extract_assets_soup(content)) - Counter(assets)
+    return ParserBenchmarkResult(
+        name=name,
+        size=len(content),
+        asset_count=len(assets),
+        extractor_time=time_parser(extract_assets, content, repeat),
+        soup_time=soup_time,
+        matches=matches,
+    )
+
+
+@click.command()
+@click.argument("paths", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option("--repeat", default=BENCHMARK_REPEAT, type=click.IntRange(min=1))
+def main(paths, repeat):
+    """
+    Benchmark asset extraction on saved pages, or a synthetic page if none are given.
+    """
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            pages.append((path, f.read()))
+    if not pages:
+        pages.append(("synthetic", generate_page()))
+
+    click.echo("page  chars  assets  extractor (ms)  soup (ms)  speedup  matches")
+    for name, content in pages:
+        result = run_benchmark(name, content, repeat)
+        soup = (
+            "{ms:.2f}".format(ms=result.soup_time * 1000)
+            if result.soup_time is not None
+            else "-"
+        )
+        speedup = (
+            "{x:.1f}x".format(x=result.soup_time / result.extractor_time)
+            if result.soup_time is not None and result.extractor_time
+            else "-"
+        )
+        click.echo(
+            "{r.name}  {r.size}  {r.asset_count}  {extractor:.2f}  {soup}  {speedup}  "
+            "{r.matches}".format(
+                r=result,
+                extractor=result.extractor_time * 1000,
+                soup=soup,
+                speedup=speedup,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""An emulation of a browser's HTTP cache, for repeat views of a webpage.
+
+Measurements read and discard response bodies, so `HTTPCache` keeps
+only what decides whether a response could be reused: its caching
+headers and when it was stored. For documents and stylesheets it also
+keeps the URLs of the assets they reference, and for documents the
+pages they link to, so that a page can be walked from the cache without
+their bodies.
+
+A fresh response is reused without a request. A stale one with an
+`ETag` or `Last-Modified` validator is revalidated with a conditional
+request, which a `304 Not Modified` response answers without a body.
+Freshness follows RFC 9111 for a private cache: `Cache-Control`
+`max-age`, then `Expires`, then a tenth of the time since
+`Last-Modified`.
+"""
+
+import dataclasses
+import email.utils
+import json
+import os
+import tempfile
+import threading
+import time
+import typing
+
+# The headers which decide how a response is cached
+CACHE_HEADERS = ["age", "cache-control", "date", "etag", "expires", "last-modified"]
+HEURISTIC_FRESHNESS_FRACTION = 0.1
+
+
+@dataclasses.dataclass(frozen=True)
+class CacheEntry:
+    """A cached response.
+
+    :param url: The URL requested.
+    :param headers: The response's `CACHE_HEADERS`, with lower case names.
+    :param stored_at: When the response was received or last
+    revalidated, in seconds since the epoch.
+    :param references: The URLs of the assets the response references,
+    if it was searched for them.
+    :param links: The URLs of the pages a document links to, if it was
+    searched for them.
+    """
+
+    url: str
+    headers: typing.Dict[str, str]
+    stored_at: float
+    references: typing.Optional[typing.List[str]] = None
+    links: typing.Optional[typing.List[str]] = None
+
+
+def parse_cache_control(value):
+    """Get the directives of a `Cache-Control` header.
+
+    :param value: The header's value, or `None`.
+    :return: A `dict` of lower case directive names to their values, or
+    `None` for directives without one.
+    """
+    directives = {}
+    for directive in (value or "").split(","):
+        name, _, argument = directive.partition("=")
+        name = name.strip().lower()
+        if name:
+            directives[name] = argument.strip().strip('"') if argument else None
+    return directives
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _parse_seconds(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HTTPCache:
+    """Stores the caching metadata of responses, in memory or in a JSON file.
+
+    A cache may be shared by concurrent requests. The file is
+    best-effort: one which cannot be read or written is treated as empty.
+
+    :param path: If given, the cache is loaded from and `save` writes to
+    this file.
+    :param clock: A wall clock returning seconds since the epoch.
+    """
+
+    def __init__(self, path=None, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path is not None:
+            self._load()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def lookup(self, url):
+        """Get the entry cached for `url`, or `None`."""
+        with self._lock:
+            return self._entries.get(url)
+
+    def is_fresh(self, entry):
+        """Whether `entry` may be used without revalidating it."""
+        directives = parse_cache_control(entry.headers.get("cache-control"))
+        if "no-cache" in directives:
+            return False
+        return self._get_current_age(entry) < self._get_freshness_lifetime(entry)
+
+    def get_conditional_headers(self, entry):
+        """Get the headers which revalidate `entry`, which are empty if it
+        has no validator."""
+        headers = {}
+        if entry.headers.get("etag"):
+            headers["If-None-Match"] = entry.headers["etag"]
+        if entry.headers.get("last-modified"):
+            headers["If-Modified-Since"] = entry.headers["last-modified"]
+        return headers
+
+    def store(self, url, response, references=None, links=None):
+        """Cache the `200 OK` `response` to a request for `url`, unless its
+        headers forbid it.
+
+        :param url: The URL requested.
+        :param response: A `requests.Response`.
+        :param references: The URLs of the assets the response references.
+        :param links: The URLs of the pages the response links to.
+        :return: The new `CacheEntry`, or `None` if the response was not
+        cached.
+        """
+        headers = self._get_cache_headers(response)
+        directives = parse_cache_control(headers.get("cache-control"))
+        with self._lock:
+            if response.status_code != 200 or "no-store" in directives:
+                self._entries.pop(url, None)
+                return None
+            entry = CacheEntry(url, headers, self._clock(), references, links)
+            self._entries[url] = entry
+            return entry
+
+    def update(self, entry, response):
+        """Refresh `entry` from the `304 Not Modified` `response` which
+        revalidated it.
+
+        :return: The updated `CacheEntry`.
+        """
+        headers = dict(entry.headers)
+        headers.update(self._get_cache_headers(response))
+        updated = dataclasses.replace(entry, headers=headers, stored_at=self._clock())
+        with self._lock:
+            self._entries[entry.url] = updated
+        return updated
+
+    def save(self):
+        """Write the cache to its file, if it has one."""
+        if self.path is None:
+            return
+        with self._lock:
+            entries = [dataclasses.asdict(entry) for entry in self._entries.values()]
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Replace the file in one step so readers never see a partial cache
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(entries, f)
+                os.replace(temp_path, self.path)
+            except OSError:
+                os.unlink(temp_path)
+                raise
+        except OSError:
+            pass
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = [CacheEntry(**entry) for entry in json.load(f)]
+        except (OSError, ValueError, TypeError):
+            return
+        self._entries = {entry.url: entry for entry in entries}
+
+    def _get_cache_headers(self, response):
+        headers = {}
+        for name in CACHE_HEADERS:
+            value = response.headers.get(name)
+            if isinstance(value, str):
+                headers[name] = value
+        return headers
+
+    def _get_current_age(self, entry):
+        age = _parse_seconds(entry.headers.get("age")) or 0
+        return age + max(self._clock() - entry.stored_at, 0)
+
+    def _get_freshness_lifetime(self, entry):
+        directives = parse_cache_control(entry.headers.get("cache-control"))
+        max_age = _parse_seconds(directives.get("max-age"))
+        if max_age is not None:
+            return max_age
+        date = _parse_date(entry.headers.get("date")) or entry.stored_at
+        if "expires" in entry.headers:
+            # An invalid date, such as "0", means already expired
+            expires = _parse_date(entry.headers["expires"])
+            return expires - date if expires is not None else 0
+        last_modified = _parse_date(entry.headers.get("last-modified"))
+        if last_modified is not None:
+            return max(date - last_modified, 0) * HEURISTIC_FRESHNESS_FRACTION
+        return 0
@@ -0,0 +1,102 @@
+"""Concurrent fetching of a webpage's assets.
+
+Browsers fetch a page's assets over several connections at once, limited
+per origin and overall. `AssetFetcher` does the same on a thread pool,
+starting queued assets in the order they were added whenever their
+origin and the pool both have a connection free.
+"""
+
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+
+def get_origin(url):
+    """Get the scheme and host of `url`, e.g. `https://example.com:8443`."""
+    parts = urlsplit(url)
+    return "{scheme}://{netloc}".format(scheme=parts.scheme, netloc=parts.netloc)
+
+
+class AssetFetcher:
+    """Fetches URLs concurrently, with limits per origin and overall.
+
+    URLs may be added while others are being fetched. Use as a context
+    manager, or call `join` once every URL has been added.
+
+    :param fetch: A callable which fetches a URL, passed the URL and any
+    further arguments it was added with, and returns its result. It is
+    called from worker threads, and may add further URLs. A fetch which
+    raises an exception has `None` as its result.
+    :param connections_per_origin: The most URLs fetched at once from a
+    single origin.
+    :param max_connections: The most URLs fetched at once overall.
+    """
+
+    def __init__(self, fetch, connections_per_origin, max_connections):
+        if connections_per_origin < 1 or max_connections < 1:
+            raise ValueError(
+                "`connections_per_origin` and `max_connections` must be at least 1"
+            )
+        self.connections_per_origin = connections_per_origin
+        self.max_connections = max_connections
+        self._fetch = fetch
+        self._executor = ThreadPoolExecutor(max_workers=max_connections)
+        # Re-entrant, as a fetch which completes straight away calls back
+        # into the fetcher from `_start_queued`
+        self._lock = threading.RLock()
+        self._idle = threading.Condition(self._lock)
+        self._queue = deque()
+        self._origin_counts = Counter()
+        self._running = 0
+        self.results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.join()
+
+    def add(self, url, *args):
+        """Queue `url` to be fetched as soon as a connection is free.
+
+        :param url: The URL to fetch.
+        :param args: Further arguments passed to `fetch`.
+        """
+        with self._lock:
+            self._queue.append((url, args))
+            self._start_queued()
+
+    def join(self):
+        """Wait for every URL added to be fetched.
+
+        :return: The result of each fetch, in the order they completed.
+        """
+        with self._idle:
+            self._idle.wait_for(lambda: not self._queue and not self._running)
+        self._executor.shutdown()
+        return self.results
+
+    def _start_queued(self):
+        # Start queued URLs in order, skipping those whose origin is busy
+        waiting = deque()
+        while self._queue and self._running < self.max_connections:
+            url, args = item = self._queue.popleft()
+            origin = get_origin(url)
+            if self._origin_counts[origin] >= self.connections_per_origin:
+                waiting.append(item)
+                continue
+            self._origin_counts[origin] += 1
+            self._running += 1
+            future = self._executor.submit(self._fetch, url, *args)
+            future.add_done_callback(lambda f, origin=origin: self._done(origin, f))
+        waiting.extend(self._queue)
+        self._queue = waiting
+
+    def _done(self, origin, future):
+        with self._lock:
+            self._origin_counts[origin] -= 1
+            self._running -= 1
+            self.results.append(future.result() if future.exception() is None else None)
+            self._start_queued()
+            self._idle.notify_all()
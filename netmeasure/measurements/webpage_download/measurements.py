@@ -1,15 +1,37 @@
+import codecs
+import dataclasses
+import threading
 import time
-from six.moves.urllib.parse import urlparse
+from collections import deque
+from six.moves.urllib.parse import urlparse, urldefrag, urljoin, urlsplit
 
 import requests
-from bs4 import BeautifulSoup
 
+from netmeasure.measurements.base.http2 import HTTP2Session, is_http2_available
 from netmeasure.measurements.base.measurements import BaseMeasurement
 from netmeasure.measurements.base.results import Error
+from netmeasure.measurements.base.streaming import (
+    ChunkSizeTuner,
+    discard,
+    get_wire_size,
+    iter_decoded,
+)
 from netmeasure.units import RatioUnit, TimeUnit, StorageUnit, NetworkUnit
+from netmeasure.measurements.webpage_download.cache import HTTPCache
+from netmeasure.measurements.webpage_download.fetcher import AssetFetcher, get_origin
+from netmeasure.measurements.webpage_download.parser import (
+    VALID_LINK_REL_ATTRIBUTES,
+    AssetExtractor,
+    extract_css_urls,
+)
+from netmeasure.measurements.webpage_download.preconnect import Preconnector
 from netmeasure.measurements.webpage_download.results import (
     WebpageDownloadMeasurementResult,
 )
+from netmeasure.measurements.webpage_download.waterfall import (
+    HTTP_VERSIONS,
+    RequestRecorder,
+)
 from netmeasure.measurements.latency.measurements import LatencyMeasurement
 
 
@@ -21,32 +43,118 @@ WEB_ERRORS = {
     "web-timeout": "Initial page download timed out",
 }
 VALID_LINK_EXTENSTIONS = [".css", ".ico", ".png", ".woff2", ""]
-VALID_LINK_REL_ATTRIBUTES = [
-    "manifest",
-    "modulepreload",
-    "preload",
-    "prerender",
-    "stylesheet",
-    "apple-touch-icon",
-    "icon",
-    "shortcut icon",
-]
+ASSET_CHUNK_SIZE = 64 * 2**10
+ASSET_MAX_CHUNK_SIZE = 2**20
+# Small, so that assets are found soon after the HTML referencing them arrives
+DOCUMENT_CHUNK_SIZE = 16 * 2**10
+# Browsers open up to 6 connections per origin
+CONNECTIONS_PER_ORIGIN = 6
+MAX_CONNECTIONS = 16
+# Assets in the document are at depth 1, those its stylesheets reference at depth 2, and so on
+MAX_ASSET_DEPTH = 4
+MAX_ASSETS = 1000
+MAX_STYLESHEET_SCAN_SIZE = 2 * 2**20
 
 
 class WebpageDownloadMeasurement(BaseMeasurement):
-    def __init__(self, id, url, count=4, download_timeout=180):
+    """A measurement of the time taken to load a webpage and its assets.
+
+    Assets are fetched concurrently, as a browser would, over at most
+    `connections_per_origin` connections to each origin and
+    `max_connections` connections overall. Like a browser's preload
+    scanner, the HTML is parsed as it downloads, and each asset is queued
+    to be fetched as soon as it is found.
+
+    Assets referenced by stylesheets, through `url()` and `@import`, are
+    fetched too, up to `max_asset_depth` stylesheets deep. Each asset URL
+    is fetched once, and at most `max_assets` are fetched in total.
+
+    With `record_requests`, the timing of every request is kept on the
+    result, from which `waterfall.to_har` builds an HTTP Archive.
+
+    Given an `HTTPCache`, responses are reused from it and stored in it
+    as a browser would, so a measurement can be repeated with a warm
+    cache. With `repeat_view`, the page is loaded twice, the second time
+    with the cache the first filled, and the result of the repeat view
+    is kept on the result of the first.
+
+    A `requests.Session`, or an `HTTP2Session`, may be given to share
+    connections between measurements, otherwise each page load uses a
+    new one. With `collect_links`, the URLs of the pages the document
+    links to are kept on the result.
+
+    With `preconnect`, each origin an asset is found on, or which the
+    document hints it will load from with a `preconnect` or
+    `dns-prefetch` link, is resolved and connected to in the background
+    as soon as it is found, so the DNS lookup and handshakes overlap with
+    the rest of the document downloading rather than delaying the
+    origin's first asset.
+
+    With `http2`, requests are made through an `HTTP2Session`, which
+    multiplexes them over one connection to each server that supports
+    HTTP/2, as a browser would, and which needs the `http2` extra. The
+    protocol the document arrived over is kept on the result. Origins are
+    not preconnected over HTTP/2.
+    """
+
+    def __init__(
+        self,
+        id,
+        url,
+        count=4,
+        download_timeout=180,
+        connections_per_origin=CONNECTIONS_PER_ORIGIN,
+        max_connections=MAX_CONNECTIONS,
+        max_asset_depth=MAX_ASSET_DEPTH,
+        max_assets=MAX_ASSETS,
+        record_requests=False,
+        cache=None,
+        repeat_view=False,
+        session=None,
+        collect_links=False,
+        preconnect=True,
+        http2=False,
+    ):
+        if connections_per_origin < 1 or max_connections < 1:
+            raise ValueError(
+                "`connections_per_origin` and `max_connections` must be at least 1"
+            )
+        if max_asset_depth < 1 or max_assets < 1:
+            raise ValueError("`max_asset_depth` and `max_assets` must be at least 1")
         self.id = id
         self.url = url
         self.count = count
         self.download_timeout = download_timeout
+        self.connections_per_origin = connections_per_origin
+        self.max_connections = max_connections
+        self.max_asset_depth = max_asset_depth
+        self.max_assets = max_assets
+        self.record_requests = record_requests
+        self.cache = cache
+        self.repeat_view = repeat_view
+        self.session = session
+        self.collect_links = collect_links
+        self.preconnect = preconnect
+        self.http2 = http2
+        if http2 and session is None and not is_http2_available():
+            raise ValueError(
+                "HTTP/2 requires httpx and h2, installed with `pip install netmeasure[http2]`"
+            )
 
     def measure(self):
         host = urlparse(self.url).netloc
         protocol = urlparse(self.url).scheme
-        return self._get_webpage_result(self.url, host, protocol)
+        if not self.repeat_view:
+            return self._get_webpage_result(self.url, host, protocol, self.cache)
+        cache = self.cache if self.cache is not None else HTTPCache()
+        first_view = self._get_webpage_result(self.url, host, protocol, cache)
+        if first_view.errors:
+            return first_view
+        repeat_view = self._get_webpage_result(self.url, host, protocol, cache)
+        return dataclasses.replace(first_view, repeat_view=repeat_view)
 
-    def _get_webpage_result(self, url, host, protocol):
-        s = requests.Session()
+    def _get_webpage_result(self, url, host, protocol, cache=None):
+        s = self.session if self.session is not None else self._get_session()
         headers = {
             "dnt": "1",
             "upgrade-insecure-requests": "1",
@@ -59,26 +167,73 @@ class WebpageDownloadMeasurement(BaseMeasurement):
             "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
         }
 
+        recorder = RequestRecorder() if self.record_requests else None
+        preconnector = self._get_preconnector(s, url)
         start_time = time.time()
+        document = {
+            "size": 0,
+            "decoded_size": 0,
+            "cache_status": None,
+            "links": None,
+            "http_version": None,
+        }
+        cache_entry = cache.lookup(url) if cache is not None else None
         try:
-            r = s.get(url, headers=headers, timeout=self.download_timeout)
+            if cache_entry is not None and cache.is_fresh(cache_entry):
+                # The document is reused without a request
+                document["cache_status"] = "hit"
+                document["links"] = cache_entry.links
+                asset_download_metrics = self._download_assets(
+                    s, cache_entry.references or [], url, recorder, cache, preconnector
+                )
+            else:
+                if cache_entry is not None:
+                    headers.update(cache.get_conditional_headers(cache_entry))
+                timer = recorder.start_request(url, 0) if recorder is not None else None
+                r = s.get(
+                    url, headers=headers, timeout=self.download_timeout, stream=True
+                )
+                if timer is not None:
+                    timer.received_headers(r)
+                document["http_version"] = HTTP_VERSIONS.get(
+                    getattr(r.raw, "version", None)
+                )
+                if cache_entry is not None and r.status_code == 304:
+                    document["cache_status"] = "revalidated"
+                    document["links"] = cache_entry.links
+                    document["size"] = discard(r, bytearray(ASSET_CHUNK_SIZE))
+                    if timer is not None:
+                        timer.finish(document["size"], document["size"])
+                    cache.update(cache_entry, r)
+                    to_download = cache_entry.references or []
+                else:
+                    to_download = self._iter_document_assets(
+                        r, document, timer, preconnector
+                    )
+                # Assets are fetched while the rest of the document downloads
+                asset_download_metrics = self._download_assets(
+                    s, to_download, r.url, recorder, cache, preconnector
+                )
+                if cache is not None and "assets" in document:
+                    cache.store(url, r, document["assets"], document["links"])
         except (ConnectionError, requests.ConnectionError) as e:
             return self._get_webpage_error("web-get", traceback=str(e))
         except requests.exceptions.ReadTimeout as e:
             return self._get_webpage_error("web-timeout", traceback=str(e))
-        try:
-            to_download = self._parse_html(r.text)
-        except TypeError as e:
-            return self._get_webpage_error("web-parse-rel", traceback=str(e))
-        try:
-            asset_download_metrics = self._download_assets(
-                s, to_download, host, protocol
-            )
         except TypeError as e:
             return self._get_webpage_error("web-assets", traceback=str(e))
+        finally:
+            if preconnector is not None:
+                preconnector.close()
+            # A session supplied by the caller is left open for its next use
+            if s is not self.session:
+                s.close()
 
-        primary_download_size = len(r.text)
+        primary_download_size = document["size"]
         asset_download_size = asset_download_metrics["asset_download_size"]
+        decoded_download_size = (
+            document["decoded_size"] + asset_download_metrics["asset_decoded_size"]
+        )
         elapsed_time = asset_download_metrics["completion_time"] - start_time
         download_rate = (primary_download_size + asset_download_size) * 8 / elapsed_time
         failed_asset_downloads = asset_download_metrics["failed_asset_downloads"]
@@ -90,71 +245,248 @@ class WebpageDownloadMeasurement(BaseMeasurement):
             download_rate_unit=NetworkUnit("bit/s"),
             download_size=primary_download_size + asset_download_size,
             download_size_unit=StorageUnit("B"),
-            asset_count=len(to_download),
+            asset_count=asset_download_metrics["asset_count"],
             failed_asset_downloads=failed_asset_downloads,
             elapsed_time=elapsed_time,
             elapsed_time_unit=TimeUnit("s"),
             errors=[],
+            decoded_download_size=decoded_download_size,
+            decoded_download_size_unit=StorageUnit("B"),
+            start_time=start_time,
+            request_records=recorder.records if recorder is not None else None,
+            links=document["links"] if self.collect_links else None,
+            http_version=document["http_version"],
+            **self._get_cache_metrics(cache, document, asset_download_metrics),
         )
 
-    def _parse_html(self, content):
-        soup = BeautifulSoup(content, "html.parser")
-        imgs = soup.find_all("img")
-        links = soup.find_all("link")
-        scripts = soup.find_all("script")
-        to_download = []
-        for img in imgs:
-            if img.has_attr("src"):
-                to_download.append(img["src"])
-        for script in scripts:
-            if script.has_attr("src"):
-                to_download.append(script["src"])
-        for link in links:
-            if link.has_attr("rel") & link.has_attr("href"):
-                # Join in the case where `rel` is more than one word
-                rel = " ".join(link["rel"])
-                if rel in VALID_LINK_REL_ATTRIBUTES:
-                    to_download.append(link["href"])
-
-        return to_download
-
-    def _download_assets(self, session, to_download, host, protocol):
-        # Store the amount of bytes downloaded
-        asset_download_sizes = []
-        failed_asset_downloads = 0
-        for asset in to_download:
-            try:
-                # Identify data URLs (already downloaded inline, counted in main download size)
-                if "data:" in asset:
-                    continue
-
-                # Check if path w/o preceeding slashes is a valid URL
-                if asset.startswith("//"):
-                    download_url = protocol + ":" + asset
-                # Check if path is a relative path
-                elif asset.startswith("/"):
-                    download_url = protocol + "://" + host + asset
-                # ...or simply a normal file link
-                else:
-                    download_url = asset
-
-                a = session.get(download_url, timeout=self.download_timeout)
-                if a.status_code >= 400:
-                    raise ConnectionError
-                asset_download_sizes.append(len(a.text))
-            except ConnectionError:
-                failed_asset_downloads = failed_asset_downloads + 1
-            except requests.exceptions.MissingSchema:
-                failed_asset_downloads = failed_asset_downloads + 1
-            except requests.exceptions.ReadTimeout:
-                failed_asset_downloads = failed_asset_downloads + 1
+    def _get_cache_metrics(self, cache, document, asset_download_metrics):
+        """
+        Returns the number of responses reused from `cache` without a request and after revalidating them, if given
+        The cache is saved, if it is kept in a file
+        """
+        if cache is None:
+            return {}
+        cache.save()
+        return {
+            "cache_hits": asset_download_metrics["cache_hits"]
+            + (document["cache_status"] == "hit"),
+            "cache_revalidations": asset_download_metrics["cache_revalidations"]
+            + (document["cache_status"] == "revalidated"),
+        }
+
+    def _get_session(self):
+        if self.http2:
+            return HTTP2Session(max_connections=self.max_connections)
+        session = requests.Session()
+        # Keep a pool per origin, holding a connection for each concurrent fetch
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.max_connections,
+            pool_maxsize=self.connections_per_origin,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get_preconnector(self, session, url):
+        """
+        Returns a Preconnector for the origins of the page at `url` other than its own
+        Returns None without `preconnect`, or if `session` is an `HTTP2Session`
+        """
+        if not self.preconnect or isinstance(session, HTTP2Session):
+            return None
+        return Preconnector(
+            session,
+            max_workers=self.max_connections,
+            timeout=self.download_timeout,
+            origins=[get_origin(url)],
+        )
+
+    def _iter_document_assets(self, response, document, timer=None, preconnector=None):
+        """
+        Yields the assets of the streamed HTML document `response` as they are found, while it downloads
+        The size of the document as sent and once decoded are kept in `document`, and passed to `timer` if given
+        The origins the document hints it will load from are passed to `preconnector`, if given
+        """
+        found = deque()
+        extractor = AssetExtractor(
+            base_url=response.url,
+            on_asset=found.append,
+            on_preconnect=preconnector.add if preconnector is not None else None,
+        )
+        decoder = self._get_decoder(response)
+        for chunk in iter_decoded(response, DOCUMENT_CHUNK_SIZE):
+            document["decoded_size"] += len(chunk)
+            extractor.feed(decoder.decode(chunk))
+            while found:
+                yield found.popleft()
+        document["size"] = get_wire_size(response, document["decoded_size"])
+        document["assets"] = extractor.assets
+        document["links"] = extractor.links
+        if timer is not None:
+            timer.finish(document["size"], document["decoded_size"])
+        extractor.feed(decoder.decode(b"", final=True))
+        extractor.close()
+        while found:
+            yield found.popleft()
+
+    def _get_decoder(self, response):
+        try:
+            return codecs.getincrementaldecoder(response.encoding or "utf-8")(
+                errors="replace"
+            )
+        except (LookupError, TypeError):
+            return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def _download_assets(
+        self,
+        session,
+        to_download,
+        base_url,
+        recorder=None,
+        cache=None,
+        preconnector=None,
+    ):
+        """
+        Downloads each asset in `to_download` once, along with those referenced by stylesheets
+        Assets are resolved against `base_url`, and those past `max_asset_depth` or `max_assets` are skipped
+        Each request is timed by `recorder`, and assets are reused from and stored in `cache`, if given
+        The origin of each asset which needs a request is passed to `preconnector` when it is queued, if given
+        """
+        # Assets are read into a buffer per thread and discarded, only their sizes are kept
+        # The read size carries over between the assets each thread downloads
+        local = threading.local()
+        queued = set()
+        lock = threading.Lock()
+
+        def queue_asset(url, depth):
+            # Only http(s) assets are fetched, data URLs are counted in the document that holds them
+            url = urldefrag(urljoin(base_url, url.strip()))[0]
+            if (
+                urlsplit(url).scheme not in ("http", "https")
+                or depth > self.max_asset_depth
+            ):
+                return
+            with lock:
+                if url in queued or len(queued) >= self.max_assets:
+                    return
+                queued.add(url)
+            if preconnector is not None and not self._is_cached(cache, url):
+                preconnector.add(url)
+            fetcher.add(url, depth)
+
+        with AssetFetcher(
+            lambda url, depth: self._download_asset(
+                session, url, depth, local, queue_asset, recorder, cache
+            ),
+            self.connections_per_origin,
+            self.max_connections,
+        ) as fetcher:
+            for asset in to_download:
+                queue_asset(asset, 1)
+        asset_downloads = [result for result in fetcher.results if result is not None]
+        failed_asset_downloads = len(fetcher.results) - len(asset_downloads)
+        cache_statuses = [cache_status for _, _, cache_status in asset_downloads]
 
         return {
-            "asset_download_size": sum(asset_download_sizes),
+            "asset_count": len(fetcher.results),
+            "asset_download_size": sum(size for size, _, _ in asset_downloads),
+            "asset_decoded_size": sum(size for _, size, _ in asset_downloads),
             "failed_asset_downloads": failed_asset_downloads,
+            "cache_hits": cache_statuses.count("hit"),
+            "cache_revalidations": cache_statuses.count("revalidated"),
             "completion_time": time.time(),
         }
 
+    def _download_asset(
+        self, session, url, depth, local, queue_asset, recorder=None, cache=None
+    ):
+        """
+        Returns the size of the asset at `url` as sent and once decoded, and "hit" or "revalidated" if reused from `cache`
+        Returns None if the asset could not be downloaded
+        The assets referenced by a stylesheet are passed to `queue_asset`, one level deeper
+        """
+        if not hasattr(local, "buffer"):
+            local.tuner = ChunkSizeTuner(ASSET_CHUNK_SIZE, maximum=ASSET_MAX_CHUNK_SIZE)
+            local.buffer = bytearray(local.tuner.maximum)
+        cache_entry = cache.lookup(url) if cache is not None else None
+        if cache_entry is not None and cache.is_fresh(cache_entry):
+            for reference in cache_entry.references or []:
+                queue_asset(reference, depth + 1)
+            return 0, 0, "hit"
+        headers = None
+        if cache_entry is not None:
+            headers = cache.get_conditional_headers(cache_entry)
+        timer = recorder.start_request(url, depth) if recorder is not None else None
+        result = None
+        try:
+            a = session.get(
+                url, headers=headers, timeout=self.download_timeout, stream=True
+            )
+            if timer is not None:
+                timer.received_headers(a)
+            if cache_entry is not None and a.status_code == 304:
+                size = discard(a, local.buffer)
+                cache.update(cache_entry, a)
+                for reference in cache_entry.references or []:
+                    queue_asset(reference, depth + 1)
+                result = size, size, "revalidated"
+            elif a.status_code >= 400:
+                a.close()
+            else:
+                references = None
+                if depth < self.max_asset_depth and self._is_stylesheet(a):
+                    size, text = self._read_stylesheet(a)
+                    references = [
+                        urljoin(a.url, reference)
+                        for reference in extract_css_urls(text)
+                    ]
+                    for reference in references:
+                        queue_asset(reference, depth + 1)
+                else:
+                    size = discard(a, local.buffer, local.tuner)
+                if cache is not None:
+                    cache.store(url, a, references)
+                result = get_wire_size(a, size), size, None
+        except (
+            ConnectionError,
+            requests.ConnectionError,
+            requests.exceptions.MissingSchema,
+            requests.exceptions.ReadTimeout,
+        ):
+            pass
+        if timer is not None:
+            timer.finish(*(result[:2] if result is not None else ()))
+        return result
+
+    def _is_cached(self, cache, url):
+        """
+        Returns whether the response for `url` can be reused from `cache` without a request
+        """
+        if cache is None:
+            return False
+        cache_entry = cache.lookup(url)
+        return cache_entry is not None and cache.is_fresh(cache_entry)
+
+    def _is_stylesheet(self, response):
+        content_type = response.headers.get("content-type")
+        if not isinstance(content_type, str):
+            return False
+        return content_type.split(";")[0].strip().lower() == "text/css"
+
+    def _read_stylesheet(self, response):
+        """
+        Returns the decoded size of the stylesheet `response` and its text
+        Only the first `MAX_STYLESHEET_SCAN_SIZE` bytes are kept to be searched for assets
+        """
+        size = 0
+        decoder = self._get_decoder(response)
+        text = []
+        for chunk in iter_decoded(response, ASSET_CHUNK_SIZE):
+            if size < MAX_STYLESHEET_SCAN_SIZE:
+                text.append(decoder.decode(chunk[: MAX_STYLESHEET_SCAN_SIZE - size]))
+            size += len(chunk)
+        return size, "".join(text)
+
     def _get_webpage_error(self, key, traceback):
         return WebpageDownloadMeasurementResult(
             id=self.id,
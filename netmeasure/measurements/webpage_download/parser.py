@@ -0,0 +1,180 @@
+"""Extraction of the assets a webpage loads from its HTML and CSS.
+
+`AssetExtractor` collects the targets of `img`, `source`, `script` and
+`link` tags, including `srcset` candidates, and the URLs referenced by
+inline styles and `style` elements, as well as the pages linked to by
+`a` tags and the origins named by `preconnect` and `dns-prefetch` hints.
+It works from
+`html.parser.HTMLParser` callbacks in a single pass, without building a
+document tree, and HTML may be fed to it in pieces as it arrives.
+
+`extract_css_urls` finds the URLs referenced by a stylesheet, through
+`url()` and `@import`.
+"""
+
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+VALID_LINK_REL_ATTRIBUTES = [
+    "manifest",
+    "modulepreload",
+    "preload",
+    "prerender",
+    "stylesheet",
+    "apple-touch-icon",
+    "icon",
+    "shortcut icon",
+]
+# Hints naming an origin which the page will load from, rather than an asset
+PRECONNECT_LINK_REL_ATTRIBUTES = ["dns-prefetch", "preconnect"]
+CSS_COMMENT_PATTERN = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_URL_PATTERN = re.compile(
+    r"""url\(\s*(?:"([^"]*)"|'([^']*)'|([^)\s"']*))\s*\)"""
+    r"""|@import\s+(?:"([^"]*)"|'([^']*)')""",
+    re.IGNORECASE,
+)
+
+
+def extract_css_urls(text):
+    """Get the URLs referenced by CSS through `url()` and `@import`.
+
+    :param text: The CSS as a `str`.
+    :return: A list of URLs, in the order they appear.
+    """
+    text = CSS_COMMENT_PATTERN.sub("", text)
+    urls = []
+    for match in CSS_URL_PATTERN.finditer(text):
+        url = next(group for group in match.groups() if group is not None)
+        if url:
+            urls.append(url)
+    return urls
+
+
+def parse_srcset(value):
+    """Get the URLs of the image candidates in a `srcset` attribute."""
+    urls = []
+    position = 0
+    length = len(value)
+    while position < length:
+        while position < length and (
+            value[position].isspace() or value[position] == ","
+        ):
+            position += 1
+        start = position
+        while position < length and not value[position].isspace():
+            position += 1
+        url = value[start:position]
+        if url.endswith(","):
+            # A candidate without descriptors
+            url = url.rstrip(",")
+        else:
+            comma = value.find(",", position)
+            position = length if comma == -1 else comma + 1
+        if url:
+            urls.append(url)
+    return urls
+
+
+class AssetExtractor(HTMLParser):
+    """Collects the URLs of a webpage's assets, in document order.
+
+    The `src` and `srcset` of `img` and `source` tags are collected, as
+    are the `src` of `script` tags, the `href` of `link` tags whose `rel`
+    is one of `VALID_LINK_REL_ATTRIBUTES`, and URLs referenced by `style`
+    attributes and elements. The `href` of `a` tags are collected
+    separately, as `links`, and those of `link` tags whose `rel` is one
+    of `PRECONNECT_LINK_REL_ATTRIBUTES` as `preconnects`.
+
+    :param base_url: If given, URLs are resolved against it, or against
+    the document's `base` element if it has one.
+    :param on_asset: An optional callable passed each URL as it is found.
+    :param on_preconnect: An optional callable passed each URL in
+    `preconnects` as it is found.
+    """
+
+    def __init__(self, base_url=None, on_asset=None, on_preconnect=None):
+        super(AssetExtractor, self).__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.on_asset = on_asset
+        self.on_preconnect = on_preconnect
+        self.assets = []
+        self.links = []
+        self.preconnects = []
+        self._has_base = False
+        self._style = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "img" or tag == "source":
+            self._add(attrs.get("src"))
+            if attrs.get("srcset"):
+                for url in parse_srcset(attrs["srcset"]):
+                    self._add(url)
+        elif tag == "script":
+            self._add(attrs.get("src"))
+        elif tag == "link":
+            rel = attrs.get("rel")
+            # Normalise the whitespace in the case where `rel` is more than one word
+            rel = " ".join(rel.split()) if rel is not None else None
+            if rel in VALID_LINK_REL_ATTRIBUTES:
+                self._add(attrs.get("href"))
+            elif rel in PRECONNECT_LINK_REL_ATTRIBUTES and attrs.get("href"):
+                url = self._resolve(attrs["href"])
+                self.preconnects.append(url)
+                if self.on_preconnect is not None:
+                    self.on_preconnect(url)
+        elif tag == "a":
+            if attrs.get("href"):
+                self.links.append(self._resolve(attrs["href"]))
+        elif tag == "base":
+            # Only the first `base` element counts
+            if self.base_url is not None and attrs.get("href") and not self._has_base:
+                self.base_url = urljoin(self.base_url, attrs["href"])
+                self._has_base = True
+        elif tag == "style":
+            self._style = []
+        if attrs.get("style"):
+            for url in extract_css_urls(attrs["style"]):
+                self._add(url)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag == "style":
+            self.handle_endtag(tag)
+
+    def handle_data(self, data):
+        if self._style is not None:
+            self._style.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "style" and self._style is not None:
+            for url in extract_css_urls("".join(self._style)):
+                self._add(url)
+            self._style = None
+
+    def _add(self, url):
+        if url is None:
+            return
+        url = self._resolve(url)
+        self.assets.append(url)
+        if self.on_asset is not None:
+            self.on_asset(url)
+
+    def _resolve(self, url):
+        if self.base_url is None:
+            return url
+        return urljoin(self.base_url, url.strip())
+
+
+def extract_assets(content, base_url=None):
+    """Get the URLs of the assets loaded by an HTML document.
+
+    :param content: The document as a `str`.
+    :param base_url: If given, URLs are resolved against it.
+    :return: A list of URLs, in document order.
+    """
+    extractor = AssetExtractor(base_url=base_url)
+    extractor.feed(content)
+    extractor.close()
+    return extractor.assets
@@ -0,0 +1,110 @@
+"""Early connection setup for the origins a webpage loads assets from.
+
+Browsers resolve and connect to each origin as soon as the preload
+scanner finds it, so that DNS lookups and TCP and TLS handshakes overlap
+with the rest of the document downloading, rather than waiting until an
+asset from the origin is requested. `Preconnector` does the same for a
+`requests.Session`: it opens a connection to each new origin in the
+background and leaves it in the session's pool, where the first request
+to the origin finds it.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+
+from netmeasure.measurements.webpage_download.fetcher import get_origin
+
+
+class Preconnector:
+    """Connects to each origin added, once, in the background.
+
+    Call `close`, or use as a context manager, to stop starting
+    connections once the page has loaded, without waiting for those in
+    progress.
+
+    :param session: The `requests.Session` whose pools are connected.
+    :param max_workers: The most connections set up at once.
+    :param timeout: The time in seconds after which a connection attempt
+    is abandoned.
+    :param origins: Origins which are already connected, and are not
+    connected again.
+    """
+
+    def __init__(self, session, max_workers, timeout, origins=()):
+        self.session = session
+        self.timeout = timeout
+        self.connected = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._origins = set(origins)
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Stop starting connections, leaving those in progress to finish."""
+        self._closed = True
+        self._executor.shutdown(wait=False)
+
+    def add(self, url):
+        """Start connecting to the origin of `url`, unless it was added before."""
+        if urlsplit(url).scheme not in ("http", "https"):
+            return
+        origin = get_origin(url)
+        with self._lock:
+            if origin in self._origins:
+                return
+            self._origins.add(origin)
+        try:
+            self._executor.submit(self._connect, origin)
+        except RuntimeError:
+            # The page has finished loading
+            pass
+
+    def _connect(self, origin):
+        if self._closed:
+            return
+        pool = self._get_pool(origin)
+        # urllib3 has no public way to open a pooled connection without a
+        # request, so this takes one from the pool and puts it back through
+        # `_get_conn` and `_put_conn`, which behave alike in urllib3 1.26
+        # and 2.x (checked against 2.8)
+        conn = None
+        try:
+            conn = pool._get_conn()
+            if conn.sock is None:
+                conn.timeout = self.timeout
+                conn.connect()
+        except (OSError, urllib3.exceptions.HTTPError):
+            # A pool closed with its session raises before handing out a
+            # connection, leaving nothing to return
+            if conn is not None:
+                conn.close()
+                # Return the pool's slot without the connection
+                pool._put_conn(None)
+            return
+        pool._put_conn(conn)
+        with self._lock:
+            self.connected.append(origin)
+
+    def _get_pool(self, url):
+        # Find the pool a request to `url` would use, with the same proxy
+        # and TLS settings
+        adapter = self.session.get_adapter(url)
+        settings = self.session.merge_environment_settings(url, {}, None, None, None)
+        if hasattr(adapter, "get_connection_with_tls_context"):
+            return adapter.get_connection_with_tls_context(
+                requests.Request("GET", url).prepare(),
+                settings["verify"],
+                settings["proxies"],
+                settings["cert"],
+            )
+        return adapter.get_connection(url, settings["proxies"])
@@ -5,9 +5,54 @@ from netmeasure.measurements.base.results import MeasurementResult
 from netmeasure.units import TimeUnit, StorageUnit, RatioUnit, NetworkUnit
 
 
+@dataclass(frozen=True)
+class WebpageRequestRecord:
+    """The timing of one request made while loading a webpage.
+
+    Times are in seconds and sizes in bytes, with `None` where the
+    request failed before they were known. `wait_time` runs from the
+    request being sent, including any connection setup, until its
+    headers arrived, and `receive_time` from then until its body was
+    read.
+    """
+
+    url: str
+    depth: int
+    start_offset: float
+    status: typing.Optional[int]
+    content_type: typing.Optional[str]
+    connection_reused: typing.Optional[bool]
+    wait_time: typing.Optional[float]
+    receive_time: typing.Optional[float]
+    download_size: typing.Optional[int]
+    decoded_download_size: typing.Optional[int]
+    http_version: typing.Optional[str]
+
+
 @dataclass(frozen=True)
 class WebpageDownloadMeasurementResult(MeasurementResult):
-    """Encapsulates the results from a Webpage download measurement."""
+    """Encapsulates the results from a Webpage download measurement.
+
+    `download_size` counts the bytes received, before any content
+    decoding, and `download_rate` is calculated from it.
+    `decoded_download_size` counts the bytes once decoded, e.g. after
+    decompressing gzip.
+
+    `request_records` holds a `WebpageRequestRecord` for the document and
+    each asset, by start time, if requests were recorded. Their start
+    offsets are from `start_time`, in seconds since the epoch.
+
+    With a cache, `cache_hits` counts the responses reused without a
+    request and `cache_revalidations` those reused after a conditional
+    request. A repeat view keeps the result of loading the page again
+    with a warm cache as `repeat_view`.
+
+    `links` holds the URLs of the pages the document links to, if they
+    were collected.
+
+    `http_version` is the protocol the document was received over, e.g.
+    "HTTP/1.1" or "HTTP/2", or `None` if it was reused from the cache.
+    """
 
     url: typing.Optional[str]
     download_rate: typing.Optional[float]
@@ -18,3 +63,12 @@ class WebpageDownloadMeasurementResult(MeasurementResult):
     failed_asset_downloads: typing.Optional[int]
     elapsed_time: typing.Optional[float]
     elapsed_time_unit: typing.Optional[TimeUnit]
+    decoded_download_size: typing.Optional[float] = None
+    decoded_download_size_unit: typing.Optional[StorageUnit] = None
+    start_time: typing.Optional[float] = None
+    request_records: typing.Optional[typing.List[WebpageRequestRecord]] = None
+    cache_hits: typing.Optional[int] = None
+    cache_revalidations: typing.Optional[int] = None
+    repeat_view: typing.Optional["WebpageDownloadMeasurementResult"] = None
+    links: typing.Optional[typing.List[str]] = None
+    http_version: typing.Optional[str] = None
@@ -0,0 +1,158 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from netmeasure.measurements.webpage_download.cache import (
+    HTTPCache,
+    parse_cache_control,
+)
+
+# Tue, 14 Nov 2023 22:13:20 GMT
+NOW = 1700000000.0
+
+
+def get_response(headers, status_code=200):
+    response = mock.MagicMock()
+    response.status_code = status_code
+    response.headers = headers
+    return response
+
+
+class ParseCacheControlTestCase(TestCase):
+    def test_directives(self):
+        self.assertEqual(
+            parse_cache_control('Public, max-age=60, no-cache="set-cookie",,'),
+            {"public": None, "max-age": "60", "no-cache": "set-cookie"},
+        )
+
+    def test_missing(self):
+        self.assertEqual(parse_cache_control(None), {})
+
+
+class HTTPCacheTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = mock.Mock(return_value=NOW)
+        self.cache = HTTPCache(clock=self.clock)
+        self.url = "https://example.com/style.css"
+
+    def store(self, headers, **kwargs):
+        return self.cache.store(self.url, get_response(headers), **kwargs)
+
+    def assertFreshFor(self, entry, seconds):
+        self.clock.return_value = NOW + seconds - 1
+        self.assertTrue(self.cache.is_fresh(entry))
+        self.clock.return_value = NOW + seconds
+        self.assertFalse(self.cache.is_fresh(entry))
+
+    def test_max_age(self):
+        entry = self.store(
+            {
+                "cache-control": "max-age=60",
+                "expires": "Wed, 15 Nov 2023 22:13:20 GMT",
+            },
+            references=["https://example.com/bg.png"],
+        )
+        self.assertEqual(self.cache.lookup(self.url), entry)
+        self.assertEqual(entry.references, ["https://example.com/bg.png"])
+        self.assertFreshFor(entry, 60)
+
+    def test_age(self):
+        entry = self.store({"cache-control": "max-age=60", "age": "50"})
+        self.assertFreshFor(entry, 10)
+
+    def test_expires(self):
+        entry = self.store(
+            {
+                "date": "Tue, 14 Nov 2023 22:13:20 GMT",
+                "expires": "Tue, 14 Nov 2023 22:15:20 GMT",
+            }
+        )
+        self.assertFreshFor(entry, 120)
+
+    def test_invalid_expires(self):
+        entry = self.store({"expires": "0"})
+        self.assertFalse(self.cache.is_fresh(entry))
+
+    def test_heuristic(self):
+        entry = self.store(
+            {
+                "date": "Tue, 14 Nov 2023 22:13:20 GMT",
+                "last-modified": "Tue, 14 Nov 2023 22:03:20 GMT",
+            }
+        )
+        self.assertFreshFor(entry, 60)
+
+    def test_no_cache(self):
+        entry = self.store({"cache-control": "no-cache, max-age=60", "etag": '"a"'})
+        self.assertFalse(self.cache.is_fresh(entry))
+        self.assertEqual(
+            self.cache.get_conditional_headers(entry), {"If-None-Match": '"a"'}
+        )
+
+    def test_no_store(self):
+        self.store({"cache-control": "max-age=60"})
+        self.assertIsNone(self.store({"cache-control": "no-store"}))
+        self.assertIsNone(self.cache.lookup(self.url))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_not_ok(self):
+        self.assertIsNone(
+            self.cache.store(
+                self.url, get_response({"cache-control": "max-age=60"}, status_code=404)
+            )
+        )
+
+    def test_conditional_headers(self):
+        entry = self.store(
+            {"etag": '"a"', "last-modified": "Tue, 14 Nov 2023 22:03:20 GMT"}
+        )
+        self.assertEqual(
+            self.cache.get_conditional_headers(entry),
+            {
+                "If-None-Match": '"a"',
+                "If-Modified-Since": "Tue, 14 Nov 2023 22:03:20 GMT",
+            },
+        )
+        self.assertEqual(
+            self.cache.get_conditional_headers(
+                self.store({"cache-control": "max-age=1"})
+            ),
+            {},
+        )
+
+    def test_update(self):
+        entry = self.store(
+            {"cache-control": "max-age=60", "etag": '"a"'},
+            references=["https://example.com/bg.png"],
+        )
+        self.clock.return_value = NOW + 100
+        self.assertFalse(self.cache.is_fresh(entry))
+        updated = self.cache.update(
+            entry, get_response({"cache-control": "max-age=30"}, status_code=304)
+        )
+        self.assertEqual(self.cache.lookup(self.url), updated)
+        self.assertEqual(
+            updated.headers, {"cache-control": "max-age=30", "etag": '"a"'}
+        )
+        self.assertEqual(updated.references, entry.references)
+        self.assertTrue(self.cache.is_fresh(updated))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache", "http.json")
+            cache = HTTPCache(path, clock=self.clock)
+            entry = cache.store(
+                self.url,
+                get_response({"cache-control": "max-age=60"}),
+                references=["https://example.com/bg.png"],
+            )
+            cache.save()
+            self.assertEqual(HTTPCache(path, clock=self.clock).lookup(self.url), entry)
+
+    def test_load_invalid(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "http.json")
+            with open(path, "w") as f:
+                f.write("{not json")
+            self.assertEqual(len(HTTPCache(path)), 0)
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import Counter
+from unittest import TestCase
+
+from netmeasure.measurements.webpage_download.fetcher import AssetFetcher, get_origin
+
+
+class ConcurrencyRecorder:
+    """A fetch which records the most fetches running at once."""
+
+    def __init__(self, duration=0.05):
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.running = Counter()
+        self.max_running = Counter()
+
+    def __call__(self, url):
+        origin = get_origin(url)
+        with self.lock:
+            self.running[origin] += 1
+            self.running["all"] += 1
+            for key in (origin, "all"):
+                self.max_running[key] = max(self.max_running[key], self.running[key])
+        time.sleep(self.duration)
+        with self.lock:
+            self.running[origin] -= 1
+            self.running["all"] -= 1
+        return url
+
+
+class AssetFetcherTestCase(TestCase):
+    def test_get_origin(self):
+        self.assertEqual(
+            get_origin("https://example.com:8443/a/b.png?c=d"),
+            "https://example.com:8443",
+        )
+
+    def test_limits(self):
+        fetch = ConcurrencyRecorder()
+        urls = [
+            "http://{host}.example/{i}".format(host=host, i=i)
+            for host in ("a", "b", "c")
+            for i in range(5)
+        ]
+        with AssetFetcher(fetch, connections_per_origin=2, max_connections=5) as f:
+            for url in urls:
+                f.add(url)
+        self.assertCountEqual(f.results, urls)
+        self.assertEqual(fetch.max_running["http://a.example"], 2)
+        self.assertEqual(fetch.max_running["http://b.example"], 2)
+        self.assertEqual(fetch.max_running["all"], 5)
+
+    def test_busy_origin_does_not_block_others(self):
+        # Assets from a second origin start while the first origin is busy
+        fetch = ConcurrencyRecorder(duration=0.2)
+        urls = ["http://a.example/{i}".format(i=i) for i in range(3)]
+        start = time.monotonic()
+        with AssetFetcher(fetch, connections_per_origin=1, max_connections=4) as f:
+            for url in urls + ["http://b.example/0"]:
+                f.add(url)
+        self.assertEqual(fetch.max_running["all"], 2)
+        self.assertLess(time.monotonic() - start, 0.75)
+
+    def test_failed_fetch(self):
+        def fetch(url):
+            if url.endswith("fail"):
+                raise ConnectionError
+            return url
+
+        with AssetFetcher(fetch, connections_per_origin=1, max_connections=1) as f:
+            f.add("http://a.example/ok")
+            f.add("http://a.example/fail")
+        self.assertEqual(f.results, ["http://a.example/ok", None])
+
+    def test_empty(self):
+        with AssetFetcher(str, 1, 1) as f:
+            pass
+        self.assertEqual(f.results, [])
+
+    def test_invalid_limits(self):
+        self.assertRaises(ValueError, AssetFetcher, str, 0, 1)
+        self.assertRaises(ValueError, AssetFetcher, str, 1, 0)
@@ -1,16 +1,26 @@
 # -*- coding: utf-8 -*-
-from unittest import TestCase, mock
+import dataclasses
+from unittest import TestCase, mock, skipUnless
 from unittest.mock import call
 
+import gzip
+import requests
 import six
 import subprocess
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
 
 from netmeasure.measurements.latency.measurements import LatencyMeasurement
+from netmeasure.measurements.base.http2 import is_http2_available
 from netmeasure.measurements.base.results import Error
+from netmeasure.measurements.base.tests.h2_server import H2Server, get_h2c_session
 from netmeasure.measurements.webpage_download.measurements import (
     WebpageDownloadMeasurement,
 )
 from netmeasure.measurements.webpage_download.measurements import WEB_ERRORS
+from netmeasure.measurements.webpage_download.cache import HTTPCache
+from netmeasure.measurements.webpage_download.parser import extract_assets
 
 from netmeasure.measurements.webpage_download.results import (
     WebpageDownloadMeasurementResult,
@@ -38,7 +48,11 @@ class WebpageDownloadMeasurementResultsTestCase(TestCase):
             errors=[],
         )
         self.simple_asset_download_metrics = {
+            "asset_count": 123,
             "asset_download_size": 90,
+            "asset_decoded_size": 90,
+            "cache_hits": 0,
+            "cache_revalidations": 0,
             "failed_asset_downloads": 0,
             "completion_time": 2.00,
         }
@@ -72,42 +86,60 @@ class WebpageDownloadMeasurementResultsTestCase(TestCase):
     @mock.patch(
         "netmeasure.measurements.webpage_download.measurements.WebpageDownloadMeasurement._download_assets"
     )
-    @mock.patch(
-        "netmeasure.measurements.webpage_download.measurements.WebpageDownloadMeasurement._parse_html"
-    )
     @mock.patch("requests.Session")
     @mock.patch("time.time")
     def test_get_requests_measurement(
-        self, mock_time, mock_get_session, mock_parse_html, mock_download_assets
+        self, mock_time, mock_get_session, mock_download_assets
     ):
         mock_time.return_value = 1.00
         mock_session = mock.MagicMock()
         mock_resp = mock.MagicMock()
-        # Total 'downloaded' size is 100 bytes
-        mock_resp.text = "Ten chars_"
-        mock_session.get.side_effect = [mock_resp]
-        mock_parse_html.return_value = [
-            "URL number {x}".format(x=i + 1) for i in range(123)
+        mock_resp.encoding = "utf-8"
+        mock_resp.url = "http://validfakehost.com/test"
+        # Ten chunks of ten bytes, the last naming 123 assets
+        mock_resp.iter_content.return_value = [b"Ten chars_"] * 9 + [
+            "".join('<img src="/{x}.png">'.format(x=i + 1) for i in range(123)).encode()
         ]
-        mock_download_assets.return_value = self.simple_asset_download_metrics
+        mock_session.get.side_effect = [mock_resp]
+        found = []
+
+        def download_assets(
+            session, to_download, base_url, recorder, cache, preconnector
+        ):
+            self.assertIsNone(recorder)
+            self.assertIsNone(cache)
+            found.extend(to_download)
+            return self.simple_asset_download_metrics
+
+        mock_download_assets.side_effect = download_assets
         mock_get_session.return_value = mock_session
+        result = self.wpm._get_webpage_result(
+            "http://validfakehost.com/test", "validfakehost.com", "https"
+        )
+        document_size = 90 + len(mock_resp.iter_content.return_value[-1])
         self.assertEqual(
-            self.wpm._get_webpage_result(
-                "http://validfakehost.com/test", "validfakehost.com", "https"
+            result,
+            dataclasses.replace(
+                self.simple_webpage_output,
+                download_size=document_size + 90,
+                download_rate=(document_size + 90) / 1.00 * 8,
+                decoded_download_size=document_size + 90,
+                decoded_download_size_unit=StorageUnit("B"),
+                start_time=1.00,
             ),
-            self.simple_webpage_output,
+        )
+        self.assertEqual(
+            found,
+            ["http://validfakehost.com/{x}.png".format(x=i + 1) for i in range(123)],
         )
 
     @mock.patch(
         "netmeasure.measurements.webpage_download.measurements.WebpageDownloadMeasurement._download_assets"
     )
-    @mock.patch(
-        "netmeasure.measurements.webpage_download.measurements.WebpageDownloadMeasurement._parse_html"
-    )
     @mock.patch("requests.Session")
     @mock.patch("time.time")
     def test_get_requests_error(
-        self, mock_time, mock_get_session, mock_parse_html, mock_download_assets
+        self, mock_time, mock_get_session, mock_download_assets
     ):
         mock_time.return_value = 1.00
         mock_session = mock.MagicMock()
@@ -174,13 +206,13 @@ class WebpageHTMLParseTestCase(TestCase):
         ]
 
     def test_parse_img(self):
-        self.assertEqual(self.wpm._parse_html(self.img_html), self.img_urls)
+        self.assertEqual(extract_assets(self.img_html), self.img_urls)
 
     def test_parse_script(self):
-        self.assertEqual(self.wpm._parse_html(self.script_html), self.script_urls)
+        self.assertEqual(extract_assets(self.script_html), self.script_urls)
 
     def test_parse_links(self):
-        self.assertEqual(self.wpm._parse_html(self.link_html), self.link_urls)
+        self.assertEqual(extract_assets(self.link_html), self.link_urls)
 
 
 class WebpageAssetDownloadTestCase(TestCase):
@@ -195,29 +227,47 @@ class WebpageAssetDownloadTestCase(TestCase):
         self.all_success_urls_transformed = [
             call(
                 "https://validfakehost.com/an_image.jpg",
+                headers=None,
                 timeout=self.wpm.download_timeout,
+                stream=True,
             ),
             call(
                 "https://validfakehost.com/resources/client/a_stylesheet.css",
+                headers=None,
                 timeout=self.wpm.download_timeout,
+                stream=True,
             ),
             call(
                 "https://res.validfakehost.com/fonts/a_font.woff2",
+                headers=None,
                 timeout=self.wpm.download_timeout,
+                stream=True,
             ),
         ]
         self.all_success_dict = {
+            "asset_count": 3,
             "asset_download_size": 3,
+            "asset_decoded_size": 3,
+            "cache_hits": 0,
+            "cache_revalidations": 0,
             "failed_asset_downloads": 0,
             "completion_time": 1.23,
         }
         self.one_failure_dict = {
+            "asset_count": 3,
             "asset_download_size": 2,
+            "asset_decoded_size": 2,
+            "cache_hits": 0,
+            "cache_revalidations": 0,
             "failed_asset_downloads": 1,
             "completion_time": 1.23,
         }
         self.all_failure_dict = {
+            "asset_count": 3,
             "asset_download_size": 0,
+            "asset_decoded_size": 0,
+            "cache_hits": 0,
+            "cache_revalidations": 0,
             "failed_asset_downloads": 3,
             "completion_time": 1.23,
         }
@@ -229,13 +279,13 @@ class WebpageAssetDownloadTestCase(TestCase):
         responses = []
         for i in range(3):
             response = mock.MagicMock()
-            response.text = str("i")
+            response.iter_content.return_value = [b"i"]
             response.status_code = 200
             responses.append(response)
         mock_session.get.side_effect = responses
         self.assertEqual(
             self.wpm._download_assets(
-                mock_session, self.all_url_types, "validfakehost.com", "https"
+                mock_session, self.all_url_types, "https://validfakehost.com/test"
             ),
             self.all_success_dict,
         )
@@ -245,14 +295,17 @@ class WebpageAssetDownloadTestCase(TestCase):
         responses = []
         for i in range(3):
             response = mock.MagicMock()
-            response.text = str("i")
+            response.iter_content.return_value = [b"i"]
             response.status_code = 200
             responses.append(response)
         mock_session.get.side_effect = responses
         self.wpm._download_assets(
-            mock_session, self.all_url_types, "validfakehost.com", "https"
+            mock_session, self.all_url_types, "https://validfakehost.com/test"
+        )
+        # Assets are fetched concurrently, so may be requested in any order
+        mock_session.get.assert_has_calls(
+            self.all_success_urls_transformed, any_order=True
         )
-        mock_session.get.assert_has_calls(self.all_success_urls_transformed)
 
     @mock.patch("time.time")
     def test_single_failure_code(self, mock_time):
@@ -261,17 +314,17 @@ class WebpageAssetDownloadTestCase(TestCase):
         responses = []
         for i in range(2):
             response = mock.MagicMock()
-            response.text = str("i")
+            response.iter_content.return_value = [b"i"]
             response.status_code = 200
             responses.append(response)
         fail_response = mock.MagicMock()
-        fail_response.text = "0"
+        fail_response.iter_content.return_value = [b"0"]
         fail_response.status_code = 404
         responses.append(fail_response)
         mock_session.get.side_effect = responses
         self.assertEqual(
             self.wpm._download_assets(
-                mock_session, self.all_url_types, "validfakehost.com", "https"
+                mock_session, self.all_url_types, "https://validfakehost.com/test"
             ),
             self.one_failure_dict,
         )
@@ -283,14 +336,14 @@ class WebpageAssetDownloadTestCase(TestCase):
         responses = []
         for i in range(2):
             response = mock.MagicMock()
-            response.text = str("i")
+            response.iter_content.return_value = [b"i"]
             response.status_code = 200
             responses.append(response)
         responses.append(ConnectionError)
         mock_session.get.side_effect = responses
         self.assertEqual(
             self.wpm._download_assets(
-                mock_session, self.all_url_types, "validfakehost.com", "https"
+                mock_session, self.all_url_types, "https://validfakehost.com/test"
             ),
             self.one_failure_dict,
         )
@@ -302,14 +355,578 @@ class WebpageAssetDownloadTestCase(TestCase):
         responses = []
         for i in range(2):
             response = mock.MagicMock()
-            response.text = str("i")
+            response.iter_content.return_value = [b"i"]
             response.status_code = 404
             responses.append(response)
         responses.append(ConnectionError)
         mock_session.get.side_effect = responses
         self.assertEqual(
             self.wpm._download_assets(
-                mock_session, self.all_url_types, "validfakehost.com", "https"
+                mock_session, self.all_url_types, "https://validfakehost.com/test"
             ),
             self.all_failure_dict,
         )
+
+
+class DelayedAssetRequestHandler(BaseHTTPRequestHandler):
+    """Serves a page of six images, each of which takes 0.2s to respond.
+
+    `/streamed` instead serves a page whose second half is sent 0.5s
+    after its first, which names an image, or the server's
+    `streamed_page` if it has one.
+    """
+
+    protocol_version = "HTTP/1.1"
+    PAGE = "".join('<img src="/image/{i}.png"/>'.format(i=i) for i in range(6)).encode()
+    STREAMED_PAGE = (b'<html><img src="/image/0.png">', b"<p>The end</p></html>")
+
+    def do_GET(self):
+        if self.path == "/streamed":
+            page = getattr(self.server, "streamed_page", self.STREAMED_PAGE)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(b"".join(page))))
+            self.end_headers()
+            self.wfile.write(page[0])
+            self.wfile.flush()
+            time.sleep(0.5)
+            # Recorded before the write, which the client may finish reading first
+            self.server.document_sent_time = time.monotonic()
+            self.wfile.write(page[1])
+            return
+        if self.path == "/":
+            body = self.PAGE
+        else:
+            self.server.asset_requested_times.append(time.monotonic())
+            time.sleep(0.2)
+            body = b"x" * 1000
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebpageConcurrencyTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), DelayedAssetRequestHandler)
+        self.server.daemon_threads = True
+        self.server.asset_requested_times = []
+        self.url = "http://127.0.0.1:{port}/".format(port=self.server.server_port)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_concurrent_assets(self):
+        result = WebpageDownloadMeasurement("test", self.url).measure()
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.asset_count, 6)
+        self.assertEqual(result.failed_asset_downloads, 0)
+        self.assertEqual(
+            result.download_size, len(DelayedAssetRequestHandler.PAGE) + 6000
+        )
+        # Fetched one at a time, the assets would take 1.2s
+        self.assertLess(result.elapsed_time, 0.8)
+
+    def test_assets_fetched_while_document_downloads(self):
+        result = WebpageDownloadMeasurement("test", self.url + "streamed").measure()
+        self.assertEqual(result.asset_count, 1)
+        self.assertEqual(
+            result.download_size,
+            len(b"".join(DelayedAssetRequestHandler.STREAMED_PAGE)) + 1000,
+        )
+        # The image was requested before the rest of the document was sent
+        self.assertLess(
+            self.server.asset_requested_times[0], self.server.document_sent_time
+        )
+        self.assertLess(result.elapsed_time, 0.6)
+
+    def test_http_version(self):
+        result = WebpageDownloadMeasurement("test", self.url).measure()
+        self.assertEqual(result.http_version, "HTTP/1.1")
+
+    @skipUnless(is_http2_available(), "httpx and h2 are not installed")
+    def test_http2_fallback(self):
+        # HTTP/2 is only negotiated over TLS, so this server is spoken to over HTTP/1.1
+        result = WebpageDownloadMeasurement("test", self.url, http2=True).measure()
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.asset_count, 6)
+        self.assertEqual(result.http_version, "HTTP/1.1")
+
+    def test_http2_unavailable(self):
+        with mock.patch(
+            "netmeasure.measurements.webpage_download.measurements.is_http2_available",
+            return_value=False,
+        ):
+            self.assertRaises(
+                ValueError, WebpageDownloadMeasurement, "test", self.url, http2=True
+            )
+
+    def test_connections_per_origin(self):
+        result = WebpageDownloadMeasurement(
+            "test", self.url, connections_per_origin=1
+        ).measure()
+        self.assertGreaterEqual(result.elapsed_time, 1.2)
+
+    def test_invalid_connections(self):
+        self.assertRaises(
+            ValueError,
+            WebpageDownloadMeasurement,
+            "test",
+            self.url,
+            connections_per_origin=0,
+        )
+        self.assertRaises(
+            ValueError, WebpageDownloadMeasurement, "test", self.url, max_connections=0
+        )
+
+
+@skipUnless(is_http2_available(), "httpx and h2 are not installed")
+class WebpageHTTP2TestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        page = "".join(
+            '<img src="/image/{i}.png"/>'.format(i=i) for i in range(6)
+        ).encode()
+        routes = {"/": ([("content-type", "text/html")], page)}
+        for i in range(6):
+            routes["/image/{i}.png".format(i=i)] = (
+                [("content-type", "image/png")],
+                b"x" * 100000,
+            )
+        self.server = H2Server(routes)
+        self.server.start()
+        self.url = self.server.base_url + "/"
+
+    def tearDown(self):
+        self.server.stop()
+        super().tearDown()
+
+    def test_multiplexed(self):
+        with get_h2c_session() as session:
+            result = WebpageDownloadMeasurement(
+                "test", self.url, http2=True, session=session, record_requests=True
+            ).measure()
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.http_version, "HTTP/2")
+        self.assertEqual(result.asset_count, 6)
+        self.assertEqual(result.failed_asset_downloads, 0)
+        self.assertEqual(result.download_size, len(self.server.routes["/"][1]) + 600000)
+        self.assertEqual(
+            [record.http_version for record in result.request_records],
+            ["HTTP/2"] * 7,
+        )
+        # The page and its assets were fetched concurrently over one connection
+        self.assertEqual(self.server.connection_count, 1)
+
+
+class AssetOriginRequestHandler(BaseHTTPRequestHandler):
+    """Serves an image, recording when each connection to it is made."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        self.server.connection_times.append(time.monotonic())
+        super().setup()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "1000")
+        self.end_headers()
+        self.wfile.write(b"x" * 1000)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebpagePreconnectTestCase(TestCase):
+    """Loads a page from one server, whose image is on a second origin.
+
+    The page hints the image's origin in its first half, and names the
+    image in its second half, sent 0.5s later.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.servers = []
+        self.page_server = self.start_server(DelayedAssetRequestHandler)
+        self.asset_server = self.start_server(AssetOriginRequestHandler)
+        self.asset_server.connection_times = []
+        asset_origin = "http://127.0.0.1:{port}".format(
+            port=self.asset_server.server_port
+        )
+        self.page_server.streamed_page = (
+            '<html><link rel="preconnect" href="{origin}">'.format(
+                origin=asset_origin
+            ).encode(),
+            '<img src="{origin}/image.png"></html>'.format(
+                origin=asset_origin
+            ).encode(),
+        )
+        self.url = "http://127.0.0.1:{port}/streamed".format(
+            port=self.page_server.server_port
+        )
+
+    def start_server(self, handler):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return server
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        super().tearDown()
+
+    def test_preconnect(self):
+        result = WebpageDownloadMeasurement("test", self.url).measure()
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.asset_count, 1)
+        self.assertEqual(result.failed_asset_downloads, 0)
+        # The image's origin was connected to before the image was found,
+        # and the image was fetched over that connection
+        self.assertEqual(len(self.asset_server.connection_times), 1)
+        self.assertLess(
+            self.asset_server.connection_times[0],
+            self.page_server.document_sent_time,
+        )
+
+    def test_no_preconnect(self):
+        result = WebpageDownloadMeasurement(
+            "test", self.url, preconnect=False
+        ).measure()
+        self.assertEqual(result.asset_count, 1)
+        self.assertEqual(len(self.asset_server.connection_times), 1)
+        self.assertGreater(
+            self.asset_server.connection_times[0],
+            self.page_server.document_sent_time,
+        )
+
+
+class StylesheetRequestHandler(BaseHTTPRequestHandler):
+    """Serves a page whose stylesheet imports another, with images named
+    more than once across the page and both stylesheets.
+
+    If the server's `compress` is set, each response is gzip encoded and
+    sent in chunks.
+    """
+
+    protocol_version = "HTTP/1.1"
+    RESOURCES = {
+        "/": (
+            "text/html",
+            b'<html><head><link rel="stylesheet" href="/css/main.css">'
+            b'<style>body { background: url("img/bg.png#top") }</style></head>'
+            b'<body><img src="/img/logo.png" srcset="/img/logo.png 1x, /img/logo@2x.png 2x">'
+            b'<div style="background: url(data:image/png;base64,AAAA)"></div>'
+            b"</body></html>",
+        ),
+        "/css/main.css": (
+            "text/css; charset=utf-8",
+            b'@import "theme.css";\n.logo { background: url(../img/logo.png) }\n',
+        ),
+        "/css/theme.css": (
+            "text/css",
+            b".a { background: url(/img/bg.png) }\n.b { background: url(/img/b.png) }",
+        ),
+        "/img/bg.png": ("image/png", b"x" * 100),
+        "/img/logo.png": ("image/png", b"x" * 200),
+        "/img/logo@2x.png": ("image/png", b"x" * 400),
+        "/img/b.png": ("image/png", b"x" * 800),
+    }
+
+    def do_GET(self):
+        self.server.requested_paths.append(self.path)
+        content_type, body = self.RESOURCES.get(self.path, ("text/plain", None))
+        if body is None:
+            self.send_response(404)
+            body = b""
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if not self.server.compress:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        body = gzip.compress(body)
+        self.server.sent_sizes.append(len(body))
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(0, len(body), 64):
+            chunk = body[i : i + 64]
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebpageSubresourceTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StylesheetRequestHandler)
+        self.server.daemon_threads = True
+        self.server.requested_paths = []
+        self.server.compress = False
+        self.server.sent_sizes = []
+        self.url = "http://127.0.0.1:{port}/".format(port=self.server.server_port)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_stylesheet_assets(self):
+        result = WebpageDownloadMeasurement("test", self.url).measure()
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.asset_count, 6)
+        self.assertEqual(result.failed_asset_downloads, 0)
+        self.assertEqual(
+            result.download_size,
+            sum(len(body) for _, body in StylesheetRequestHandler.RESOURCES.values()),
+        )
+        # Each asset was requested once
+        self.assertCountEqual(
+            self.server.requested_paths, list(StylesheetRequestHandler.RESOURCES)
+        )
+
+    def test_compressed(self):
+        self.server.compress = True
+        result = WebpageDownloadMeasurement("test", self.url).measure()
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.asset_count, 6)
+        # The bytes sent are counted, and the bytes they decode to separately
+        self.assertEqual(result.download_size, sum(self.server.sent_sizes))
+        self.assertEqual(
+            result.decoded_download_size,
+            sum(len(body) for _, body in StylesheetRequestHandler.RESOURCES.values()),
+        )
+        self.assertLess(result.download_size, result.decoded_download_size)
+
+    def test_record_requests(self):
+        result = WebpageDownloadMeasurement(
+            "test", self.url, record_requests=True
+        ).measure()
+        records = result.request_records
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records[0].url, self.url)
+        self.assertEqual(records[0].depth, 0)
+        self.assertFalse(records[0].connection_reused)
+        self.assertEqual(
+            [record.start_offset for record in records],
+            sorted(record.start_offset for record in records),
+        )
+        self.assertEqual(
+            sum(record.download_size for record in records), result.download_size
+        )
+        theme = next(record for record in records if record.url.endswith("theme.css"))
+        self.assertEqual(theme.depth, 2)
+        self.assertEqual(theme.status, 200)
+        self.assertEqual(theme.content_type, "text/css")
+        self.assertEqual(theme.http_version, "HTTP/1.1")
+        # The connection the document was sent on is kept alive for an asset
+        self.assertIn(True, [record.connection_reused for record in records])
+
+    def test_no_request_records(self):
+        result = WebpageDownloadMeasurement("test", self.url).measure()
+        self.assertIsNone(result.request_records)
+
+    def test_max_asset_depth(self):
+        result = WebpageDownloadMeasurement(
+            "test", self.url, max_asset_depth=2
+        ).measure()
+        # `theme.css` is fetched, but the image only it names is not
+        self.assertEqual(result.asset_count, 5)
+        self.assertNotIn("/img/b.png", self.server.requested_paths)
+
+    def test_max_assets(self):
+        result = WebpageDownloadMeasurement("test", self.url, max_assets=2).measure()
+        self.assertEqual(result.asset_count, 2)
+        self.assertEqual(len(self.server.requested_paths), 3)
+
+    def test_invalid_limits(self):
+        self.assertRaises(
+            ValueError, WebpageDownloadMeasurement, "test", self.url, max_asset_depth=0
+        )
+        self.assertRaises(
+            ValueError, WebpageDownloadMeasurement, "test", self.url, max_assets=0
+        )
+
+
+class CachingRequestHandler(BaseHTTPRequestHandler):
+    """Serves a page whose resources are cached in different ways.
+
+    The page must be revalidated, its stylesheet is fresh for a minute,
+    its image has only a validator and its script may not be stored.
+    """
+
+    protocol_version = "HTTP/1.1"
+    RESOURCES = {
+        "/": (
+            {"Cache-Control": "no-cache", "ETag": '"page"'},
+            b'<html><link rel="stylesheet" href="/style.css">'
+            b'<img src="/image.png"><script src="/app.js"></script></html>',
+        ),
+        "/style.css": (
+            {"Cache-Control": "max-age=60", "Content-Type": "text/css"},
+            b".a { background: url(/background.png) }",
+        ),
+        "/background.png": ({"Cache-Control": "max-age=60"}, b"x" * 1000),
+        "/image.png": (
+            {"Last-Modified": "Tue, 14 Nov 2023 22:03:20 GMT", "Expires": "0"},
+            b"x" * 2000,
+        ),
+        "/app.js": ({"Cache-Control": "no-store"}, b"x" * 4000),
+    }
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        headers, body = self.RESOURCES[self.path]
+        validators = [
+            (self.headers.get("If-None-Match"), headers.get("ETag")),
+            (self.headers.get("If-Modified-Since"), headers.get("Last-Modified")),
+        ]
+        if any(sent is not None and sent == current for sent, current in validators):
+            self.send_response(304)
+            body = b""
+        else:
+            self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebpageCacheTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), CachingRequestHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.url = "http://127.0.0.1:{port}/".format(port=self.server.server_port)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_repeat_view(self):
+        result = WebpageDownloadMeasurement(
+            "test", self.url, repeat_view=True
+        ).measure()
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.asset_count, 4)
+        self.assertEqual(result.cache_hits, 0)
+        self.assertEqual(result.cache_revalidations, 0)
+        repeat_view = result.repeat_view
+        self.assertEqual(repeat_view.errors, [])
+        self.assertEqual(repeat_view.asset_count, 4)
+        # The stylesheet and its background are reused, the page and the
+        # image are revalidated, and the script is downloaded again
+        self.assertEqual(repeat_view.cache_hits, 2)
+        self.assertEqual(repeat_view.cache_revalidations, 2)
+        self.assertEqual(repeat_view.download_size, 4000)
+        self.assertIsNone(repeat_view.repeat_view)
+        repeat_requests = self.server.requests[5:]
+        self.assertCountEqual(
+            repeat_requests, [("/", '"page"'), ("/image.png", None), ("/app.js", None)]
+        )
+
+    def test_shared_cache(self):
+        cache = HTTPCache()
+        first_view = WebpageDownloadMeasurement("test", self.url, cache=cache).measure()
+        self.assertEqual(len(cache), 4)
+        self.assertIsNone(first_view.repeat_view)
+        repeat_view = WebpageDownloadMeasurement(
+            "test", self.url, cache=cache
+        ).measure()
+        self.assertEqual(repeat_view.cache_hits, 2)
+        self.assertLess(repeat_view.download_size, first_view.download_size)
+
+    def test_sessions_closed(self):
+        with mock.patch.object(
+            requests.Session, "close", autospec=True, side_effect=requests.Session.close
+        ) as close:
+            WebpageDownloadMeasurement("test", self.url, repeat_view=True).measure()
+        # One session for each view
+        self.assertEqual(close.call_count, 2)
+
+    def test_supplied_session_open(self):
+        with requests.Session() as session:
+            with mock.patch.object(session, "close") as close:
+                result = WebpageDownloadMeasurement(
+                    "test", self.url, session=session, repeat_view=True
+                ).measure()
+        self.assertEqual(result.repeat_view.errors, [])
+        close.assert_not_called()
+
+    def test_no_cache(self):
+        result = WebpageDownloadMeasurement("test", self.url).measure()
+        self.assertIsNone(result.cache_hits)
+        self.assertIsNone(result.repeat_view)
+
+
+class StallingRequestHandler(BaseHTTPRequestHandler):
+    """Sends the start of a page, then stalls for longer than the client waits.
+
+    `/gzip` sends the start of a gzip encoded page instead.
+    """
+
+    protocol_version = "HTTP/1.1"
+    PAGE = b"<html>" + b"x" * 1000 + b"</html>"
+
+    def do_GET(self):
+        body = self.PAGE
+        self.send_response(200)
+        if self.path == "/gzip":
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[: len(body) // 2])
+        self.wfile.flush()
+        time.sleep(3)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebpageStallTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StallingRequestHandler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{port}/".format(port=self.server.server_port)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_stalled_document(self):
+        result = WebpageDownloadMeasurement(
+            "test", self.url, download_timeout=1
+        ).measure()
+        self.assertEqual([error.key for error in result.errors], ["web-timeout"])
+
+    def test_stalled_encoded_document(self):
+        result = WebpageDownloadMeasurement(
+            "test", self.url + "gzip", download_timeout=1
+        ).measure()
+        self.assertEqual([error.key for error in result.errors], ["web-timeout"])
@@ -0,0 +1,126 @@
+from unittest import TestCase
+
+from netmeasure.measurements.webpage_download.benchmark import (
+    generate_page,
+    run_benchmark,
+)
+from netmeasure.measurements.webpage_download.parser import (
+    AssetExtractor,
+    extract_assets,
+    extract_css_urls,
+    parse_srcset,
+)
+
+
+class AssetExtractorTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.html = (
+            "<html><head>"
+            '<link rel="stylesheet" href="/style.css">'
+            '<script src="/app.js"></script>'
+            "</head><body>"
+            '<img src="/one.png"><p>Text</p>'
+            '<script>var s = "<img src=/not-an-asset.png>";</script>'
+            '<img src="/two.png?a=1&amp;b=2">'
+            "</body></html>"
+        )
+        self.assets = ["/style.css", "/app.js", "/one.png", "/two.png?a=1&b=2"]
+
+    def test_document_order(self):
+        self.assertEqual(extract_assets(self.html), self.assets)
+
+    def test_incremental(self):
+        found = []
+        extractor = AssetExtractor(on_asset=found.append)
+        for i in range(0, len(self.html), 7):
+            extractor.feed(self.html[i : i + 7])
+        extractor.close()
+        self.assertEqual(extractor.assets, self.assets)
+        self.assertEqual(found, self.assets)
+
+    def test_link_rel_whitespace(self):
+        self.assertEqual(
+            extract_assets('<link rel="shortcut\n  icon" href="/favicon.ico">'),
+            ["/favicon.ico"],
+        )
+
+    def test_missing_values(self):
+        self.assertEqual(extract_assets("<img src><script></script><link rel>"), [])
+
+    def test_srcset(self):
+        self.assertEqual(
+            extract_assets(
+                '<img src="/small.png" srcset="/medium.png 2x, /large,wide.png 3x">'
+                '<picture><source srcset="/one.webp, /two.webp 100w"></picture>'
+            ),
+            ["/small.png", "/medium.png", "/large,wide.png", "/one.webp", "/two.webp"],
+        )
+
+    def test_styles(self):
+        self.assertEqual(
+            extract_assets(
+                "<style>@import 'reset.css'; body { background: url(/bg.png) }</style>"
+                '<div style="background-image: url(&quot;/div.png&quot;)"></div>'
+            ),
+            ["reset.css", "/bg.png", "/div.png"],
+        )
+
+    def test_base_url(self):
+        self.assertEqual(
+            extract_assets(
+                '<img src="one.png"><base href="/static/"><base href="/other/">'
+                '<img src="two.png"><img src="https://cdn.example.com/three.png">',
+                base_url="https://example.com/page/index.html",
+            ),
+            [
+                "https://example.com/page/one.png",
+                "https://example.com/static/two.png",
+                "https://cdn.example.com/three.png",
+            ],
+        )
+
+    def test_preconnects(self):
+        preconnects = []
+        extractor = AssetExtractor(
+            base_url="https://example.com/", on_preconnect=preconnects.append
+        )
+        extractor.feed(
+            '<link rel="preconnect" href="https://cdn.example.com">'
+            '<link rel="dns-prefetch" href="//fonts.example.com">'
+            '<link rel="preconnect">'
+        )
+        extractor.close()
+        self.assertEqual(
+            extractor.preconnects,
+            ["https://cdn.example.com", "https://fonts.example.com"],
+        )
+        self.assertEqual(preconnects, extractor.preconnects)
+        self.assertEqual(extractor.assets, [])
+
+
+class ExtractCSSURLsTestCase(TestCase):
+    def test_urls(self):
+        self.assertEqual(
+            extract_css_urls(
+                '@import "a.css";\n@import url(b.css) screen;\n'
+                "/* url(commented.png) */\n"
+                ".c { background: url( 'c.png' ) }\n"
+                '@font-face { src: url("d.woff2") format("woff2"), url(e.woff) }\n'
+                ".f { background: url() }"
+            ),
+            ["a.css", "b.css", "c.png", "d.woff2", "e.woff"],
+        )
+
+    def test_parse_srcset(self):
+        self.assertEqual(
+            parse_srcset(" a.png 1x,b.png 2x , c.png"), ["a.png", "b.png", "c.png"]
+        )
+
+
+class ParserBenchmarkTestCase(TestCase):
+    def test_run_benchmark(self):
+        result = run_benchmark("synthetic", generate_page(40), repeat=1)
+        self.assertEqual(result.asset_count, 30)
+        self.assertGreater(result.extractor_time, 0)
+        self.assertIn(result.matches, (True, None))
@@ -0,0 +1,93 @@
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest import TestCase
+
+import requests
+
+from netmeasure.measurements.webpage_download.preconnect import Preconnector
+
+
+class ConnectionCountingRequestHandler(BaseHTTPRequestHandler):
+    """Serves a small body, counting the connections made to the server."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        self.server.connection_count += 1
+        super().setup()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PreconnectorTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), ConnectionCountingRequestHandler
+        )
+        self.server.daemon_threads = True
+        self.server.connection_count = 0
+        self.url = "http://127.0.0.1:{port}/".format(port=self.server.server_port)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def wait_for_connections(self, preconnector, count):
+        deadline = time.monotonic() + 5
+        while len(preconnector.connected) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_connection_reused(self):
+        with Preconnector(self.session, max_workers=2, timeout=5) as preconnector:
+            preconnector.add(self.url + "image.png")
+            self.wait_for_connections(preconnector, 1)
+            self.assertEqual(preconnector.connected, [self.url.rstrip("/")])
+            # The request uses the connection already made
+            self.assertEqual(self.session.get(self.url + "script.js").content, b"ok")
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_origin_once(self):
+        with Preconnector(self.session, max_workers=2, timeout=5) as preconnector:
+            preconnector.add(self.url + "image.png")
+            preconnector.add(self.url + "script.js")
+            self.wait_for_connections(preconnector, 1)
+        self.assertEqual(preconnector.connected, [self.url.rstrip("/")])
+
+    def test_known_origin(self):
+        with Preconnector(
+            self.session, max_workers=2, timeout=5, origins=[self.url.rstrip("/")]
+        ) as preconnector:
+            preconnector.add(self.url + "image.png")
+            preconnector.add("data:image/png;base64,AAAA")
+        self.assertEqual(preconnector.connected, [])
+        self.assertEqual(self.server.connection_count, 0)
+
+    def test_connection_failure(self):
+        # Nothing listens on the server's port once it is closed
+        self.server.shutdown()
+        self.server.server_close()
+        with Preconnector(self.session, max_workers=2, timeout=5) as preconnector:
+            preconnector.add(self.url)
+            preconnector._executor.shutdown(wait=True)
+        self.assertEqual(preconnector.connected, [])
+
+    def test_closed_pool(self):
+        with Preconnector(self.session, max_workers=2, timeout=5) as preconnector:
+            preconnector._get_pool(self.url).close()
+            # Run in this thread, where an error would not be lost in the executor
+            preconnector._connect(self.url.rstrip("/"))
+        self.assertEqual(preconnector.connected, [])
+        self.assertEqual(self.server.connection_count, 0)
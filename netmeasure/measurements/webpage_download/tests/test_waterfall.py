@@ -0,0 +1,168 @@
+import dataclasses
+import json
+from unittest import TestCase, mock
+
+from netmeasure.measurements.webpage_download.results import (
+    WebpageDownloadMeasurementResult,
+    WebpageRequestRecord,
+)
+from netmeasure.measurements.webpage_download.waterfall import RequestRecorder, to_har
+from netmeasure.units import NetworkUnit, StorageUnit, TimeUnit
+
+
+def get_response(status_code=200, content_type="image/png", version=11):
+    response = mock.MagicMock()
+    response.status_code = status_code
+    response.headers = {"content-type": content_type}
+    response.raw.version = version
+    return response
+
+
+class RequestRecorderTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = mock.Mock(return_value=10.0)
+        self.recorder = RequestRecorder(clock=self.clock)
+
+    def test_record(self):
+        self.clock.return_value = 10.5
+        timer = self.recorder.start_request("https://example.com/a.png", 1)
+        self.clock.return_value = 10.75
+        timer.received_headers(get_response())
+        self.clock.return_value = 11.0
+        timer.finish(100, 200)
+        self.assertEqual(
+            self.recorder.records,
+            [
+                WebpageRequestRecord(
+                    url="https://example.com/a.png",
+                    depth=1,
+                    start_offset=0.5,
+                    status=200,
+                    content_type="image/png",
+                    connection_reused=None,
+                    wait_time=0.25,
+                    receive_time=0.25,
+                    download_size=100,
+                    decoded_download_size=200,
+                    http_version="HTTP/1.1",
+                )
+            ],
+        )
+
+    def test_failed_before_headers(self):
+        timer = self.recorder.start_request("https://example.com/a.png", 1)
+        timer.finish()
+        record = self.recorder.records[0]
+        self.assertIsNone(record.status)
+        self.assertIsNone(record.wait_time)
+        self.assertIsNone(record.download_size)
+
+    def test_records_by_start_time(self):
+        self.clock.return_value = 12.0
+        later = self.recorder.start_request("https://example.com/later.png", 1)
+        self.clock.return_value = 11.0
+        earlier = self.recorder.start_request("https://example.com/earlier.png", 1)
+        later.finish()
+        earlier.finish()
+        self.assertEqual(
+            [record.url for record in self.recorder.records],
+            ["https://example.com/earlier.png", "https://example.com/later.png"],
+        )
+
+
+class ToHARTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.records = [
+            WebpageRequestRecord(
+                url="https://example.com/",
+                depth=0,
+                start_offset=0.0,
+                status=200,
+                content_type="text/html",
+                connection_reused=False,
+                wait_time=0.1,
+                receive_time=0.2,
+                download_size=1000,
+                decoded_download_size=4000,
+                http_version="HTTP/1.1",
+            ),
+            WebpageRequestRecord(
+                url="https://example.com/missing.png",
+                depth=1,
+                start_offset=0.15,
+                status=None,
+                content_type=None,
+                connection_reused=None,
+                wait_time=None,
+                receive_time=None,
+                download_size=None,
+                decoded_download_size=None,
+                http_version=None,
+            ),
+        ]
+        self.result = WebpageDownloadMeasurementResult(
+            id="test",
+            url="https://example.com/",
+            download_rate=8000.0,
+            download_rate_unit=NetworkUnit("bit/s"),
+            download_size=1000,
+            download_size_unit=StorageUnit("B"),
+            asset_count=1,
+            failed_asset_downloads=1,
+            elapsed_time=0.5,
+            elapsed_time_unit=TimeUnit("s"),
+            errors=[],
+            start_time=1700000000.0,
+            request_records=self.records,
+        )
+
+    def test_har(self):
+        har = to_har(self.result)
+        # The archive must be serialisable
+        json.dumps(har)
+        log = har["log"]
+        self.assertEqual(log["version"], "1.2")
+        self.assertEqual(log["pages"][0]["startedDateTime"], "2023-11-14T22:13:20.000Z")
+        self.assertEqual(log["pages"][0]["pageTimings"]["onLoad"], 500.0)
+        document, missing = log["entries"]
+        self.assertEqual(document["startedDateTime"], "2023-11-14T22:13:20.000Z")
+        self.assertAlmostEqual(document["time"], 300.0)
+        self.assertEqual(document["timings"]["wait"], 100.0)
+        self.assertEqual(document["response"]["bodySize"], 1000)
+        self.assertEqual(
+            document["response"]["content"],
+            {"size": 4000, "mimeType": "text/html", "compression": 3000},
+        )
+        self.assertFalse(document["_connectionReused"])
+        self.assertEqual(missing["startedDateTime"], "2023-11-14T22:13:20.150Z")
+        self.assertEqual(missing["response"]["status"], 0)
+        self.assertEqual(missing["response"]["bodySize"], -1)
+        self.assertEqual(missing["timings"]["wait"], -1)
+        self.assertEqual(missing["time"], 0)
+
+    def test_repeat_view(self):
+        repeat_view = dataclasses.replace(
+            self.result,
+            start_time=1700000001.0,
+            request_records=self.records[:1],
+        )
+        har = to_har(dataclasses.replace(self.result, repeat_view=repeat_view))
+        self.assertEqual(
+            [page["id"] for page in har["log"]["pages"]], ["page_1", "page_2"]
+        )
+        self.assertEqual(
+            [entry["pageref"] for entry in har["log"]["entries"]],
+            ["page_1", "page_1", "page_2"],
+        )
+        self.assertEqual(
+            har["log"]["entries"][2]["startedDateTime"], "2023-11-14T22:13:21.000Z"
+        )
+
+    def test_no_records(self):
+        self.assertRaises(
+            ValueError,
+            to_har,
+            dataclasses.replace(self.result, request_records=None),
+        )
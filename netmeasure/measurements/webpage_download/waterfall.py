@@ -0,0 +1,239 @@
+"""Per-request records of a webpage load, and their export as HAR.
+
+`RequestRecorder` times each request a `WebpageDownloadMeasurement`
+makes, from when it is sent until its body has been read, and notes
+whether it reused a connection. The records are kept on the result as
+`WebpageRequestRecord`s, and `to_har` turns them into an HTTP Archive
+that browser developer tools and waterfall viewers can open.
+
+Requests made through `requests` do not expose when DNS resolution or
+connection setup end, so the time until the response headers arrive is
+reported as waiting time, including any connection setup.
+"""
+
+import datetime
+import socket
+import threading
+import time
+
+from netmeasure.measurements.webpage_download.results import WebpageRequestRecord
+
+HAR_VERSION = "1.2"
+HTTP_VERSIONS = {10: "HTTP/1.0", 11: "HTTP/1.1", 20: "HTTP/2"}
+
+
+class RequestRecorder:
+    """Collects a `WebpageRequestRecord` for each request of a page load.
+
+    Requests may be recorded from several threads at once.
+
+    :param clock: A monotonic clock returning seconds, which start
+    offsets are measured with from when the recorder is created.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._start = clock()
+        self._lock = threading.Lock()
+        self._sockets = set()
+        self._records = []
+
+    def start_request(self, url, depth):
+        """Start timing a request, just before it is sent.
+
+        :param url: The URL requested.
+        :param depth: 0 for the document, 1 for the assets it references,
+        and so on.
+        :return: A `RequestTimer`.
+        """
+        return RequestTimer(self, url, depth)
+
+    @property
+    def records(self):
+        """The records of the requests finished so far, by start time."""
+        with self._lock:
+            return sorted(self._records, key=lambda record: record.start_offset)
+
+    def _is_connection_reused(self, response):
+        # The socket of a connection is replaced if it reconnects, so a
+        # socket seen before means the connection was kept alive
+        connection = getattr(response.raw, "connection", None)
+        sock = getattr(connection, "sock", None)
+        if not isinstance(sock, socket.socket):
+            return None
+        with self._lock:
+            if sock in self._sockets:
+                return True
+            self._sockets.add(sock)
+            return False
+
+    def _add(self, record):
+        with self._lock:
+            self._records.append(record)
+
+
+class RequestTimer:
+    """Times one request for a `RequestRecorder`."""
+
+    def __init__(self, recorder, url, depth):
+        self._recorder = recorder
+        self.url = url
+        self.depth = depth
+        self.started = recorder._clock()
+        self.headers_received = None
+        self.status = None
+        self.content_type = None
+        self.connection_reused = None
+        self.http_version = None
+
+    def received_headers(self, response):
+        """Record the arrival of the headers of `response`."""
+        self.headers_received = self._recorder._clock()
+        self.status = response.status_code
+        content_type = response.headers.get("content-type")
+        self.content_type = content_type if isinstance(content_type, str) else None
+        self.connection_reused = self._recorder._is_connection_reused(response)
+        self.http_version = HTTP_VERSIONS.get(getattr(response.raw, "version", None))
+
+    def finish(self, download_size=None, decoded_download_size=None):
+        """Record the end of the request, once its body has been read or it failed.
+
+        :param download_size: The number of body bytes received, if the
+        body was read.
+        :param decoded_download_size: The number of body bytes once
+        decoded, if the body was read.
+        """
+        finished = self._recorder._clock()
+        wait_time = None
+        receive_time = None
+        if self.headers_received is not None:
+            wait_time = self.headers_received - self.started
+            receive_time = finished - self.headers_received
+        self._recorder._add(
+            WebpageRequestRecord(
+                url=self.url,
+                depth=self.depth,
+                start_offset=self.started - self._recorder._start,
+                status=self.status,
+                content_type=self.content_type,
+                connection_reused=self.connection_reused,
+                wait_time=wait_time,
+                receive_time=receive_time,
+                download_size=download_size,
+                decoded_download_size=decoded_download_size,
+                http_version=self.http_version,
+            )
+        )
+
+
+def to_har(result):
+    """Export the requests of a webpage load as an HTTP Archive.
+
+    A repeat view is exported as a second page.
+
+    :param result: A `WebpageDownloadMeasurementResult` of a measurement
+    made with `record_requests=True`.
+    :return: The archive as a `dict`, ready to be serialised as JSON.
+    """
+    if result.request_records is None:
+        raise ValueError("`result` has no request records")
+    views = [result]
+    if result.repeat_view is not None and not result.repeat_view.errors:
+        views.append(result.repeat_view)
+    pages = []
+    entries = []
+    for number, view in enumerate(views, start=1):
+        page_id = "page_{number}".format(number=number)
+        pages.append(
+            {
+                "startedDateTime": _get_har_datetime(view.start_time),
+                "id": page_id,
+                "title": view.url,
+                "pageTimings": {
+                    "onContentLoad": -1,
+                    "onLoad": _get_har_milliseconds(view.elapsed_time),
+                },
+            }
+        )
+        entries.extend(
+            _get_har_entry(record, view.start_time, page_id)
+            for record in view.request_records
+        )
+    return {
+        "log": {
+            "version": HAR_VERSION,
+            "creator": {"name": "netmeasure", "version": ""},
+            "pages": pages,
+            "entries": entries,
+        }
+    }
+
+
+def _get_har_entry(record, start_time, page_id):
+    wait = _get_har_milliseconds(record.wait_time)
+    receive = _get_har_milliseconds(record.receive_time)
+    http_version = record.http_version or ""
+    compression = None
+    if record.download_size is not None and record.decoded_download_size is not None:
+        compression = record.decoded_download_size - record.download_size
+    content = {
+        "size": _or_unknown(record.decoded_download_size),
+        "mimeType": record.content_type or "",
+    }
+    if compression is not None:
+        content["compression"] = compression
+    return {
+        "pageref": page_id,
+        "startedDateTime": _get_har_datetime(start_time + record.start_offset),
+        "time": max(wait, 0) + max(receive, 0),
+        "request": {
+            "method": "GET",
+            "url": record.url,
+            "httpVersion": http_version,
+            "cookies": [],
+            "headers": [],
+            "queryString": [],
+            "headersSize": -1,
+            "bodySize": 0,
+        },
+        "response": {
+            "status": record.status or 0,
+            "statusText": "",
+            "httpVersion": http_version,
+            "cookies": [],
+            "headers": [],
+            "content": content,
+            "redirectURL": "",
+            "headersSize": -1,
+            "bodySize": _or_unknown(record.download_size),
+        },
+        "cache": {},
+        # Connection setup is included in `wait`, see the module docstring
+        "timings": {
+            "blocked": -1,
+            "dns": -1,
+            "connect": -1,
+            "send": 0,
+            "wait": wait,
+            "receive": receive,
+            "ssl": -1,
+        },
+        "_connectionReused": record.connection_reused,
+        "_depth": record.depth,
+    }
+
+
+def _get_har_datetime(timestamp):
+    return (
+        datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+        .isoformat(timespec="milliseconds")
+        .replace("+00:00", "Z")
+    )
+
+
+def _get_har_milliseconds(seconds):
+    return -1 if seconds is None else round(seconds * 1000, 3)
+
+
+def _or_unknown(value):
+    return -1 if value is None else value